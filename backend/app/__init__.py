@@ -1,4 +1,5 @@
 import os
+import sqlite3
 import sys
 
 # Add the parent directory to sys.path
@@ -7,9 +8,32 @@ sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(__file__))))
 from flask import Flask
 from flask_cors import CORS
 from database.db import Database
+from database.pool import StorageProfile
+from app.commands import register_commands
+from app.tasks import register_tasks
+from utils.cache import LRUCache
+from utils.auth import TokenCache, admin_required
+from utils.passwords import PasswordHasher
+from utils.compression import ResponseCompressor
+from utils.metrics import QueryLog, RequestMetrics
+from utils.tasks import TaskQueue
+from utils.popularity import PopularityTracker
 from routes.auth_routes import auth_bp
 from routes.product_routes import product_bp
 from routes.cart_routes import cart_bp
+from routes.order_routes import order_bp
+from routes.wishlist_routes import wishlist_bp
+from routes.event_routes import event_bp
+
+def start_background(app):
+    """Start the task workers and the popularity flusher of a serving process.
+    
+    Not done by create_app, so CLI commands, the reloader parent and the
+    Gunicorn master run no background threads.
+    """
+    app.tasks.start()
+    if app.popularity is not None:
+        app.popularity.start()
 
 def create_app(test_config=None):
     """Create and configure the Flask application"""
@@ -21,7 +45,62 @@ def create_app(test_config=None):
     # Apply configuration
     app.config.from_mapping(
         SECRET_KEY=os.environ.get('SECRET_KEY', 'dev_secret_key'),
+        ADMIN_API_KEY=os.environ.get('ADMIN_API_KEY'),
+        PRODUCT_BATCH_MAX=5000,
         DATABASE=os.path.join(app.instance_path, 'egadget.db'),
+        DATABASE_POOL_SIZE=16,
+        DATABASE_JOURNAL_MODE='WAL',
+        DATABASE_SYNCHRONOUS='NORMAL',
+        DATABASE_CACHE_SIZE=-64000,
+        DATABASE_MMAP_SIZE=268435456,
+        DATABASE_BUSY_TIMEOUT=5000,
+        REVIEW_PREVIEW_LIMIT=3,
+        PRODUCT_STREAM_MIN_LIMIT=1000,
+        PRODUCT_STREAM_CHUNK_SIZE=500,
+        PRODUCT_CACHE_ENABLED=True,
+        PRODUCT_CACHE_SIZE=1024,
+        PRODUCT_CACHE_TTL=60,
+        FACET_CACHE_ENABLED=True,
+        FACET_CACHE_SIZE=256,
+        FACET_CACHE_TTL=300,
+        FACET_PRICE_BOUNDS=[1000, 5000, 10000, 25000, 50000, 100000],
+        TOKEN_CACHE_ENABLED=True,
+        TOKEN_CACHE_SIZE=4096,
+        TOKEN_CACHE_TTL=300,
+        BCRYPT_ROUNDS=12,
+        PASSWORD_POOL_WORKERS=2,
+        PASSWORD_POOL_MAX_PENDING=16,
+        PASSWORD_POOL_TIMEOUT=10,
+        PRODUCT_LIST_CACHE_CONTROL='public, max-age=0, must-revalidate',
+        PRODUCT_DETAIL_CACHE_CONTROL='public, max-age=0, must-revalidate',
+        PRIVATE_CACHE_CONTROL='private, max-age=0, must-revalidate',
+        METRICS_ENABLED=True,
+        SERVER_TIMING_ENABLED=True,
+        SLOW_QUERY_MS=100,
+        METRICS_DIR=os.environ.get('METRICS_DIR'),
+        METRICS_SYNC_INTERVAL=1.0,
+        COMPRESSION_ENABLED=True,
+        COMPRESSION_MIN_SIZE=1024,
+        COMPRESSION_LEVEL=6,
+        COMPRESSION_CACHE_SIZE=256,
+        COMPRESSION_CACHE_TTL=300,
+        COMPRESSION_CACHE_MAX_BODY=1048576,
+        TASK_WORKERS=2,
+        TASK_POLL_INTERVAL=1.0,
+        TASK_BATCH_SIZE=50,
+        TASK_LEASE_SECONDS=60,
+        TASK_MAX_ATTEMPTS=5,
+        TASK_RETRY_DELAY=2.0,
+        TASK_RETRY_MAX_DELAY=600,
+        RATING_REPAIR_INTERVAL=86400,
+        POPULARITY_ENABLED=True,
+        POPULARITY_EVENT_WEIGHTS={'view': 1.0, 'add_to_cart': 5.0, 'purchase': 10.0},
+        POPULARITY_HALF_LIFE=43200,
+        POPULARITY_FLUSH_INTERVAL=10,
+        POPULARITY_MAX_PENDING=10000,
+        TRENDING_SIZE=12,
+        TRENDING_MIN_SCORE=5.0,
+        EVENT_BATCH_MAX=500,
     )
     
     if test_config is None:
@@ -35,9 +114,82 @@ def create_app(test_config=None):
     os.makedirs(app.instance_path, exist_ok=True)
     
     # Initialize database
-    db = Database(app.config['DATABASE'])
+    db = Database(
+        app.config['DATABASE'],
+        profile=StorageProfile.from_config(app.config),
+        pool_size=app.config['DATABASE_POOL_SIZE']
+    )
     app.db = db
     
+    # Product entity cache, shared by every ProductRepository on this database
+    if app.config['PRODUCT_CACHE_ENABLED']:
+        db.product_cache = LRUCache(
+            max_size=app.config['PRODUCT_CACHE_SIZE'],
+            ttl=app.config['PRODUCT_CACHE_TTL']
+        )
+    
+    # Facet counts, keyed by catalog version so writes never serve stale counts
+    if app.config['FACET_CACHE_ENABLED']:
+        db.facet_cache = LRUCache(
+            max_size=app.config['FACET_CACHE_SIZE'],
+            ttl=app.config['FACET_CACHE_TTL']
+        )
+    
+    # Verified-token cache, invalidated by UserRepository on user writes
+    if app.config['TOKEN_CACHE_ENABLED']:
+        db.token_cache = TokenCache(
+            max_size=app.config['TOKEN_CACHE_SIZE'],
+            ttl=app.config['TOKEN_CACHE_TTL']
+        )
+    
+    # bcrypt runs in a bounded worker pool instead of on request threads
+    app.password_hasher = PasswordHasher(
+        rounds=app.config['BCRYPT_ROUNDS'],
+        workers=app.config['PASSWORD_POOL_WORKERS'],
+        max_pending=app.config['PASSWORD_POOL_MAX_PENDING'],
+        timeout=app.config['PASSWORD_POOL_TIMEOUT']
+    )
+    
+    # Per-request SQL totals, Server-Timing headers and /api/_metrics
+    app.metrics = None
+    if app.config['METRICS_ENABLED']:
+        db.query_log = QueryLog(slow_threshold=app.config['SLOW_QUERY_MS'] / 1000.0)
+        app.metrics = RequestMetrics(
+            db.query_log,
+            server_timing=app.config['SERVER_TIMING_ENABLED'],
+            shared_dir=app.config['METRICS_DIR'],
+            sync_interval=app.config['METRICS_SYNC_INTERVAL']
+        )
+        app.metrics.install(app)
+    
+    # Gzip for clients that accept it, with compressed bodies cached by ETag
+    app.compressor = None
+    if app.config['COMPRESSION_ENABLED']:
+        app.compressor = ResponseCompressor(
+            min_size=app.config['COMPRESSION_MIN_SIZE'],
+            level=app.config['COMPRESSION_LEVEL'],
+            cache=LRUCache(
+                max_size=app.config['COMPRESSION_CACHE_SIZE'],
+                ttl=app.config['COMPRESSION_CACHE_TTL']
+            ) if app.config['COMPRESSION_CACHE_SIZE'] else None,
+            cache_max_body=app.config['COMPRESSION_CACHE_MAX_BODY']
+        )
+        app.after_request(app.compressor.process)
+    
+    # Transactions roll back and re-raise; turn what reaches the app into JSON
+    @app.errorhandler(sqlite3.Error)
+    def database_error(error):
+        if isinstance(error, sqlite3.OperationalError) and 'locked' in str(error):
+            # The write lock could not be taken within the busy timeout
+            return {'message': 'Database is busy, please try again'}, 503, {'Retry-After': '1'}
+        app.logger.exception("Database error")
+        return {'message': 'Database error'}, 500
+    
+    # Hand each request's connection back to the pool when it finishes
+    @app.teardown_appcontext
+    def release_db_connection(exception=None):
+        db.release()
+    
     # Initialize database tables and seed data
     with app.app_context():
         db.connect()
@@ -48,6 +200,38 @@ def create_app(test_config=None):
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
     app.register_blueprint(product_bp, url_prefix='/api/products')
     app.register_blueprint(cart_bp, url_prefix='/api/cart')
+    app.register_blueprint(order_bp, url_prefix='/api/orders')
+    app.register_blueprint(wishlist_bp, url_prefix='/api/wishlist')
+    app.register_blueprint(event_bp, url_prefix='/api/events')
+    
+    # Durable background tasks; workers only run when serving (start_background)
+    app.tasks = TaskQueue(
+        app,
+        workers=app.config['TASK_WORKERS'],
+        poll_interval=app.config['TASK_POLL_INTERVAL'],
+        batch_size=app.config['TASK_BATCH_SIZE'],
+        lease=app.config['TASK_LEASE_SECONDS'],
+        max_attempts=app.config['TASK_MAX_ATTEMPTS'],
+        retry_delay=app.config['TASK_RETRY_DELAY'],
+        max_retry_delay=app.config['TASK_RETRY_MAX_DELAY']
+    )
+    register_tasks(app)
+    
+    # Product events are summed in memory and flushed as popularity scores
+    app.popularity = None
+    if app.config['POPULARITY_ENABLED']:
+        app.popularity = PopularityTracker(
+            app,
+            weights=app.config['POPULARITY_EVENT_WEIGHTS'],
+            half_life=app.config['POPULARITY_HALF_LIFE'],
+            flush_interval=app.config['POPULARITY_FLUSH_INTERVAL'],
+            max_pending=app.config['POPULARITY_MAX_PENDING'],
+            trending_size=app.config['TRENDING_SIZE'],
+            trending_min_score=app.config['TRENDING_MIN_SCORE']
+        )
+    
+    # Register CLI commands
+    register_commands(app)
     
     # Add a simple index route
     @app.route('/')
@@ -57,4 +241,21 @@ def create_app(test_config=None):
             'version': '1.0.0'
         }
     
-    return app 
\ No newline at end of file
+    @app.route('/api/_cache')
+    @admin_required
+    def cache_stats():
+        return {
+            'product': db.product_cache.stats() if db.product_cache else None,
+            'facet': db.facet_cache.stats() if db.facet_cache else None,
+            'token': db.token_cache.stats() if db.token_cache else None,
+            'compressed': app.compressor.cache.stats() if app.compressor and app.compressor.cache else None
+        }
+    
+    @app.route('/api/_metrics')
+    @admin_required
+    def metrics():
+        if app.metrics is None:
+            return {'message': 'Metrics are disabled'}, 404
+        return app.response_class(app.metrics.render(), mimetype='text/plain; version=0.0.4')
+    
+    return app
@@ -0,0 +1,206 @@
+import json
+import os
+import click
+from flask import current_app
+from database.migrations import MigrationRunner
+from utils.benchmark import BenchmarkScale, EndpointBenchmark, compare, checkout_race, checkout_race_failures
+from utils.catalog_import import (
+    FEED_FORMATS, detect_format, read_feed, import_catalog, generate_catalog, write_feed
+)
+from utils.query_audit import audit_query_plans
+
+def register_commands(app):
+    """Register maintenance commands with the Flask CLI"""
+    
+    @app.cli.command('rebuild-search-index')
+    def rebuild_search_index():
+        """Rebuild the product full-text search index"""
+        if current_app.db.rebuild_search_index():
+            click.echo("Search index rebuilt")
+        else:
+            raise click.ClickException("Search index rebuild failed")
+    
+    @app.cli.command('import-catalog')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--format', 'feed_format', type=click.Choice(FEED_FORMATS), help='Defaults to the file extension')
+    @click.option('--chunk-size', type=int, default=5000, show_default=True, help='Rows per transaction')
+    @click.option('--offline', is_flag=True,
+                  help='Drop indexes and search triggers for the load; only while no server uses the database')
+    def import_catalog_command(path, feed_format, chunk_size, offline):
+        """Upsert products by SKU from a JSONL or CSV feed"""
+        try:
+            feed_format = feed_format or detect_format(path)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+        
+        reported = [0]
+        
+        def report(stats):
+            # Roughly every 100k rows
+            if stats.read // 100000 > reported[0]:
+                reported[0] = stats.read // 100000
+                click.echo(f"  {stats.read} rows read, {stats.rows_per_second:.0f} rows/s")
+        
+        stats = import_catalog(
+            current_app.db.connection,
+            read_feed(path, feed_format),
+            chunk_size=chunk_size,
+            defer_maintenance=offline,
+            progress=report
+        )
+        for cache in (current_app.db.product_cache, current_app.db.facet_cache):
+            if cache is not None:
+                cache.clear()
+        
+        for error in stats.errors:
+            click.echo(f"SKIPPED    {error}")
+        click.echo(
+            f"{stats.read} rows in {stats.seconds:.1f}s ({stats.rows_per_second:.0f} rows/s): "
+            f"{stats.inserted} inserted, {stats.updated} updated, {stats.unchanged} unchanged, "
+            f"{stats.skipped} skipped"
+        )
+    
+    @app.cli.command('generate-catalog')
+    @click.argument('output', type=click.Path(dir_okay=False, writable=True))
+    @click.option('--count', type=int, default=1000000, show_default=True, help='Products to generate')
+    @click.option('--format', 'feed_format', type=click.Choice(FEED_FORMATS), help='Defaults to the file extension')
+    @click.option('--seed', type=int, default=0, show_default=True, help='Random seed')
+    def generate_catalog_command(output, count, feed_format, seed):
+        """Write a synthetic product feed scaled up from sample_data.json"""
+        try:
+            feed_format = feed_format or detect_format(output)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+        
+        sample_data_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                        'database', 'sample_data.json')
+        with open(sample_data_path, 'r') as f:
+            templates = json.load(f)['products']
+        
+        with open(output, 'w', newline='', encoding='utf-8') as f:
+            written = write_feed(generate_catalog(templates, count, seed), f, feed_format)
+        click.echo(f"Wrote {written} products to {output}")
+    
+    @app.cli.command('rebuild-ratings')
+    def rebuild_ratings():
+        """Recompute product review counts, rating sums and histograms"""
+        corrected = current_app.db.rebuild_rating_aggregates()
+        if corrected is None:
+            raise click.ClickException("Rating aggregate rebuild failed")
+        click.echo(f"Rating aggregates rebuilt, {corrected} products corrected")
+    
+    @app.cli.command('tasks')
+    @click.option('--run', 'run_limit', type=int, default=None, help='Run up to this many due tasks first')
+    @click.option('--retry-failed', is_flag=True, help='Make failed tasks due again')
+    @click.option('--name', default=None, help='Only retry tasks of this name')
+    def tasks(run_limit, retry_failed, name):
+        """Show background task counts, optionally retrying or running tasks"""
+        if retry_failed:
+            click.echo(f"{current_app.tasks.retry_failed(name)} failed tasks retried")
+        if run_limit is not None:
+            click.echo(f"{current_app.tasks.run_pending(run_limit)} tasks run")
+        
+        counts = current_app.tasks.stats()
+        if not counts:
+            click.echo("No tasks")
+        for task_name, statuses in sorted(counts.items()):
+            summary = ', '.join(f"{count} {status}" for status, count in sorted(statuses.items()))
+            click.echo(f"{task_name}: {summary}")
+    
+    @app.cli.command('migrate')
+    @click.option('--target', type=int, default=None, help='Stop at this schema version')
+    @click.option('--status', is_flag=True, help='Only show the current and pending versions')
+    def migrate(target, status):
+        """Apply pending schema migrations"""
+        runner = MigrationRunner(current_app.db.connection)
+        if status:
+            click.echo(f"Schema version {runner.current_version()} of {runner.latest_version()}")
+            for migration in runner.pending(target):
+                click.echo(f"  pending {migration.version}: {migration.description}")
+            return
+        
+        if not current_app.db.migrate(target):
+            raise click.ClickException("Migration failed")
+        click.echo(f"Schema version {runner.current_version()}")
+    
+    @app.cli.command('audit-queries')
+    @click.option('--verbose', is_flag=True, help='Print the plan of every statement')
+    def audit_queries(verbose):
+        """EXPLAIN the app's SQL and flag full table scans and unparseable statements"""
+        base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        findings = audit_query_plans(current_app.db.connection, base_dir)
+        
+        flagged = failed = 0
+        for finding in findings:
+            if finding.error:
+                failed += 1
+                click.echo(f"ERROR      {finding.source}: {finding.error}")
+            elif finding.full_scans:
+                flagged += 1
+                click.echo(f"FULL SCAN  {finding.source}: {', '.join(finding.full_scans)}")
+            elif verbose:
+                click.echo(f"ok         {finding.source}: {' | '.join(finding.plan)}")
+        
+        click.echo(f"{len(findings)} statements audited, {flagged} with full scans, {failed} not explainable")
+        if flagged or failed:
+            raise SystemExit(1)
+    
+    @app.cli.command('benchmark')
+    @click.option('--products', type=int, default=2000, show_default=True, help='Generated products')
+    @click.option('--reviews', type=int, default=10000, show_default=True, help='Generated reviews')
+    @click.option('--users', type=int, default=200, show_default=True, help='Generated users')
+    @click.option('--cart-rows', type=int, default=1000, show_default=True, help='Generated cart rows')
+    @click.option('--iterations', type=int, default=50, show_default=True, help='Timed requests per endpoint')
+    @click.option('--warmup', type=int, default=5, show_default=True, help='Untimed requests per endpoint')
+    @click.option('--only', multiple=True, help='Only run endpoints starting with this prefix (repeatable)')
+    @click.option('--output', type=click.Path(dir_okay=False), help='Write the results to this JSON file')
+    @click.option('--baseline', type=click.Path(exists=True, dir_okay=False), help='Results JSON to compare against')
+    @click.option('--threshold', type=float, default=0.2, show_default=True,
+                  help='Allowed latency increase over the baseline, as a fraction')
+    @click.option('--min-delta-ms', type=float, default=1.0, show_default=True,
+                  help='Ignore latency increases smaller than this')
+    def benchmark(products, reviews, users, cart_rows, iterations, warmup, only, output,
+                  baseline, threshold, min_delta_ms):
+        """Benchmark the product, cart, order, auth and event endpoints on a generated database"""
+        scale = BenchmarkScale(products=products, reviews=reviews, users=users, cart_rows=cart_rows)
+        results = EndpointBenchmark(scale, iterations=iterations, warmup=warmup).run(list(only))
+        
+        click.echo(f"{'endpoint':<26}{'p50':>9}{'p90':>9}{'p95':>9}{'p99':>9}{'max':>9}{'queries':>9}{'errors':>8}")
+        for name, result in results['endpoints'].items():
+            click.echo(
+                f"{name:<26}{result['p50Ms']:>9.2f}{result['p90Ms']:>9.2f}{result['p95Ms']:>9.2f}"
+                f"{result['p99Ms']:>9.2f}{result['maxMs']:>9.2f}{result['queries']:>9}{result['errors']:>8}"
+            )
+        
+        if output:
+            with open(output, 'w') as f:
+                json.dump(results, f, indent=2)
+            click.echo(f"Results written to {output}")
+        
+        if baseline:
+            with open(baseline, 'r') as f:
+                regressions = compare(results, json.load(f), threshold, min_delta_ms)
+            for regression in regressions:
+                click.echo(f"REGRESSION {regression}")
+            if regressions:
+                raise SystemExit(1)
+            click.echo(f"No regressions against {baseline}")
+    
+    @app.cli.command('checkout-stress')
+    @click.option('--threads', type=int, default=60, show_default=True, help='Concurrent checkouts per round')
+    @click.option('--stock', type=int, default=25, show_default=True, help='Units of the contested product')
+    @click.option('--rounds', type=int, default=3, show_default=True, help='Races to run, each on a fresh database')
+    def checkout_stress(threads, stock, rounds):
+        """Race concurrent checkouts of one product and verify stock and orders"""
+        failed = False
+        for round_number in range(1, rounds + 1):
+            result = checkout_race(threads, stock)
+            statuses = ', '.join(f"{count} x {status}" for status, count in result['statuses'].items())
+            click.echo(f"Round {round_number}: {statuses}; final stock {result['finalStock']}, "
+                       f"{result['orders']} orders, {result['orderedUnits']} units")
+            for failure in checkout_race_failures(result):
+                failed = True
+                click.echo(f"FAILED {failure}")
+        if failed:
+            raise SystemExit(1)
+        click.echo("Checkout invariants held")
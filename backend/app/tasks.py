@@ -0,0 +1,21 @@
+from flask import current_app
+from models.repositories.product_repository import ProductRepository
+
+def register_tasks(app):
+    """Register background task handlers with the app's task queue"""
+
+    @app.tasks.handler('products.purge_references', batch=True)
+    def purge_product_references(payloads):
+        """Clear the cart and wishlist rows of products deleted by catalog batches"""
+        product_ids = sorted({product_id for payload in payloads for product_id in payload['product_ids']})
+        ProductRepository(current_app.db).purge_references(product_ids)
+    
+    @app.tasks.handler('ratings.repair', every=app.config['RATING_REPAIR_INTERVAL'])
+    def repair_ratings(payload):
+        """Re-derive every product's rating aggregates from the reviews table.
+        
+        Reviews keep them up to date incrementally; this only catches
+        reviews written outside the app.
+        """
+        if current_app.db.rebuild_rating_aggregates() is None:
+            raise RuntimeError("Rating aggregate rebuild failed")
@@ -1,32 +1,153 @@
 import sqlite3
 import os
 import json
+import threading
+import time
+from contextlib import contextmanager
 from pathlib import Path
+from database.pool import ConnectionPool
+from database.migrations import MigrationRunner, restore_deferred_schema
+
+class StreamCursor:
+    """A cursor of its own, returned by Database.stream(), for reading a large
+    result in parts while other statements run on the same connection"""
+    
+    def __init__(self, cursor, query_log):
+        self._cursor = cursor
+        self._query_log = query_log
+    
+    def fetchmany(self, size):
+        """Fetch up to size more rows as dicts"""
+        started = time.perf_counter()
+        rows = [dict(row) for row in self._cursor.fetchmany(size)]
+        if self._query_log is not None:
+            self._query_log.streamed(len(rows), time.perf_counter() - started)
+        return rows
+    
+    def close(self):
+        self._cursor.close()
 
 class Database:
-    def __init__(self, db_path="egadget.db"):
+    def __init__(self, db_path="egadget.db", profile=None, pool_size=16):
         self.db_path = db_path
-        self.connection = None
-        self.cursor = None
+        self.pool = ConnectionPool(db_path, profile, max_size=pool_size)
+        # Each thread works on its own checked-out connection and cursor
+        self._local = threading.local()
+        # Entity caches shared by every repository on this database
+        self.product_cache = None
+        self.facet_cache = None
+        self.token_cache = None
+        # Statement timing (utils.metrics.QueryLog), attached by create_app
+        self.query_log = None
+    
+    @property
+    def connection(self):
+        """Connection bound to the calling thread, checked out on first use"""
+        if getattr(self._local, 'connection', None) is None:
+            self.connect()
+        return getattr(self._local, 'connection', None)
+    
+    @property
+    def cursor(self):
+        """Cursor bound to the calling thread"""
+        if getattr(self._local, 'cursor', None) is None:
+            self.connect()
+        return getattr(self._local, 'cursor', None)
     
     def connect(self):
+        """Bind a pooled connection to the calling thread"""
+        if getattr(self._local, 'connection', None) is not None:
+            return True
+        
         try:
-            self.connection = sqlite3.connect(self.db_path, check_same_thread=False)
-            self.connection.row_factory = sqlite3.Row
-            self.cursor = self.connection.cursor()
+            self._local.connection = self.pool.acquire()
+            self._local.cursor = self._local.connection.cursor()
+            self._local.depth = 0
             return True
         except sqlite3.Error as e:
             print(f"Database connection error: {e}")
             return False
     
+    def release(self):
+        """Return the calling thread's connection to the pool"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            return
+        
+        self._local.cursor.close()
+        self._local.connection = None
+        self._local.cursor = None
+        self.pool.release(connection)
+    
     def close(self):
-        if self.connection:
-            self.connection.close()
-            self.connection = None
-            self.cursor = None
+        self.release()
+        self.pool.close()
+    
+    @contextmanager
+    def session(self):
+        """Bind a connection to the calling thread for the duration of the block.
+        
+        Sessions nest; the connection goes back to the pool when the
+        outermost session exits. Yields the thread's cursor.
+        """
+        if not self.connect():
+            raise sqlite3.OperationalError("Unable to acquire a database connection")
+        
+        self._local.depth += 1
+        try:
+            yield self._local.cursor
+        finally:
+            self._local.depth -= 1
+            if self._local.depth == 0:
+                self.release()
+    
+    @contextmanager
+    def transaction(self, immediate=False):
+        """Run the block as one transaction on the calling thread's connection.
+        
+        Statements executed in the block are not committed one by one: the
+        outermost block commits once when it exits and rolls back if it
+        raises, and execute() raises instead of returning False. Nested
+        blocks join the enclosing transaction. With immediate the write lock
+        is taken up front (BEGIN IMMEDIATE), so a block that reads before it
+        writes works on one consistent state and fails early with
+        OperationalError when the database stays locked. Yields the thread's cursor.
+        """
+        if not self.connect():
+            raise sqlite3.OperationalError("Unable to acquire a database connection")
+        
+        if getattr(self._local, 'transaction_depth', 0):
+            self._local.transaction_depth += 1
+            try:
+                yield self._local.cursor
+            finally:
+                self._local.transaction_depth -= 1
+            return
+        
+        connection = self._local.connection
+        self._local.cursor.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+        self._local.transaction_depth = 1
+        try:
+            yield self._local.cursor
+            connection.commit()
+        except BaseException:
+            connection.rollback()
+            raise
+        finally:
+            self._local.transaction_depth = 0
+    
+    @property
+    def in_transaction(self):
+        """Whether the calling thread is inside a transaction() block"""
+        return getattr(self._local, 'transaction_depth', 0) > 0
+    
+    @property
+    def rowcount(self):
+        """Rows changed by the last statement run with execute()"""
+        return self.cursor.rowcount
     
     def initialize(self):
-        """Create tables if they don't exist"""
+        """Create tables if they don't exist and apply pending migrations"""
         if not self.connection:
             self.connect()
         
@@ -128,12 +249,33 @@ class Database:
             ''')
             
             self.connection.commit()
-            return True
+            
+            # Bring the schema up to date on top of the base tables
+            return self.migrate()
         
         except sqlite3.Error as e:
             print(f"Database initialization error: {e}")
             return False
     
+    def migrate(self, target=None):
+        """Apply pending schema migrations, then recreate any indexes and
+        triggers an interrupted bulk catalog load left dropped"""
+        if not self.connection:
+            self.connect()
+        
+        try:
+            runner = MigrationRunner(self.connection)
+            for migration in runner.migrate(target):
+                print(f"Applied migration {migration.version}: {migration.description}")
+            restored = restore_deferred_schema(self.connection)
+            if restored:
+                print(f"Recreated {restored} indexes and triggers left dropped by a catalog load")
+            return True
+        
+        except sqlite3.Error as e:
+            print(f"Database migration error: {e}")
+            return False
+    
     def seed_data(self, sample_data_path=None):
         """Seed the database with sample data if tables are empty"""
         if not self.connection:
@@ -197,38 +339,171 @@ class Database:
             print(f"Database seeding error: {e}")
             return False
     
+    def rebuild_search_index(self):
+        """Rebuild the full-text search index from the products table"""
+        if not self.connection:
+            self.connect()
+        
+        try:
+            self.cursor.execute("INSERT INTO products_fts (products_fts) VALUES ('rebuild')")
+            self.cursor.execute("INSERT INTO products_fts (products_fts) VALUES ('optimize')")
+            self.connection.commit()
+            return True
+        
+        except sqlite3.Error as e:
+            print(f"Search index rebuild error: {e}")
+            return False
+
+    def rebuild_rating_aggregates(self):
+        """Recompute every product's review count, rating sum and histogram
+        from the reviews table; returns the number of products corrected"""
+        try:
+            # Only rows that drifted are written, so versions of correct rows stay put
+            with self.transaction():
+                self.execute('''
+                UPDATE products SET
+                    review_count = agg.review_count,
+                    rating_sum = agg.rating_sum,
+                    rating_1 = agg.rating_1,
+                    rating_2 = agg.rating_2,
+                    rating_3 = agg.rating_3,
+                    rating_4 = agg.rating_4,
+                    rating_5 = agg.rating_5,
+                    rating = CASE WHEN agg.review_count > 0
+                        THEN CAST(agg.rating_sum AS REAL) / agg.review_count
+                        ELSE products.rating END
+                FROM (
+                    SELECT p.id as product_id,
+                        COUNT(r.id) as review_count,
+                        COALESCE(SUM(r.rating), 0) as rating_sum,
+                        COALESCE(SUM(r.rating = 1), 0) as rating_1,
+                        COALESCE(SUM(r.rating = 2), 0) as rating_2,
+                        COALESCE(SUM(r.rating = 3), 0) as rating_3,
+                        COALESCE(SUM(r.rating = 4), 0) as rating_4,
+                        COALESCE(SUM(r.rating = 5), 0) as rating_5
+                    FROM products p
+                    LEFT JOIN reviews r ON r.product_id = p.id
+                    GROUP BY p.id
+                ) agg
+                WHERE products.id = agg.product_id
+                AND (products.review_count != agg.review_count
+                    OR products.rating_sum != agg.rating_sum
+                    OR products.rating_1 != agg.rating_1
+                    OR products.rating_2 != agg.rating_2
+                    OR products.rating_3 != agg.rating_3
+                    OR products.rating_4 != agg.rating_4
+                    OR products.rating_5 != agg.rating_5)
+                ''')
+                corrected = self.rowcount
+            
+            if self.product_cache is not None and corrected:
+                self.product_cache.clear()
+            return corrected
+        
+        except sqlite3.Error as e:
+            print(f"Rating aggregate rebuild error: {e}")
+            return None
+
     def execute(self, query, params=None):
-        """Execute a query with parameters"""
+        """Execute a query with parameters.
+        
+        Outside transaction() a write is committed on its own; reads never
+        commit. Inside transaction() errors are raised so the block rolls
+        back; outside, the statement is rolled back and False returned.
+        """
         if not self.connection:
             self.connect()
         
+        started = time.perf_counter()
         try:
             if params:
                 self.cursor.execute(query, params)
             else:
                 self.cursor.execute(query)
             
-            self.connection.commit()
+            self._autocommit()
+            self._record(query, started)
             return True
         
         except sqlite3.Error as e:
-            print(f"Query execution error: {e}")
-            return False
+            self._record(query, started, error=True)
+            return self._failed(e)
+    
+    def executemany(self, query, params_seq):
+        """Execute a query once per parameter set, committing once"""
+        if not self.connection:
+            self.connect()
+        
+        started = time.perf_counter()
+        try:
+            self.cursor.executemany(query, params_seq)
+            self._autocommit()
+            self._record(query, started)
+            return True
+        
+        except sqlite3.Error as e:
+            self._record(query, started, error=True)
+            return self._failed(e)
+    
+    def _autocommit(self):
+        # sqlite3 opens a transaction implicitly before a write, never before a read
+        if not self.in_transaction and self.connection.in_transaction:
+            self.connection.commit()
+    
+    def _failed(self, error):
+        if self.in_transaction:
+            raise error
+        if self.connection.in_transaction:
+            self.connection.rollback()
+        print(f"Query execution error: {error}")
+        return False
+    
+    def _record(self, query, started, error=False):
+        if self.query_log is not None:
+            self.query_log.executed(query, time.perf_counter() - started, error=error)
     
     def fetchall(self):
         """Fetch all rows from the last query"""
-        if not self.cursor:
+        cursor = getattr(self._local, 'cursor', None)
+        if not cursor:
             return []
         
-        results = self.cursor.fetchall()
-        return [dict(row) for row in results]
+        started = time.perf_counter()
+        results = [dict(row) for row in cursor.fetchall()]
+        if self.query_log is not None:
+            self.query_log.fetched(len(results), time.perf_counter() - started)
+        return results
+    
+    def stream(self, query, params=None):
+        """Run a query on a cursor of its own and return it as a StreamCursor.
+        
+        Timed like execute(); unlike execute(), an SQLite error is raised.
+        The caller closes the cursor.
+        """
+        if not self.connection:
+            self.connect()
+        
+        cursor = self.connection.cursor()
+        started = time.perf_counter()
+        try:
+            cursor.execute(query, params or ())
+        except sqlite3.Error:
+            cursor.close()
+            self._record(query, started, error=True)
+            raise
+        self._record(query, started)
+        return StreamCursor(cursor, self.query_log)
     
     def fetchone(self):
         """Fetch one row from the last query"""
-        if not self.cursor:
+        cursor = getattr(self._local, 'cursor', None)
+        if not cursor:
             return None
         
-        row = self.cursor.fetchone()
+        started = time.perf_counter()
+        row = cursor.fetchone()
+        if self.query_log is not None:
+            self.query_log.fetched(1 if row else 0, time.perf_counter() - started)
         if row:
             return dict(row)
         return None 
\ No newline at end of file
@@ -0,0 +1,289 @@
+import sqlite3
+from typing import List, Optional
+
+class Migration:
+    """A numbered set of schema statements applied in one transaction"""
+
+    def __init__(self, version: int, description: str, statements: List[str]):
+        self.version = version
+        self.description = description
+        self.statements = statements
+
+# Ordered schema changes on top of the base tables created by
+# Database.initialize. Never edit a released migration; append a new one.
+MIGRATIONS: List[Migration] = [
+    Migration(1, "Full-text search index for products", [
+        '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+            name,
+            description,
+            category,
+            content='products',
+            content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='2 3'
+        )
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS products_fts_insert AFTER INSERT ON products BEGIN
+            INSERT INTO products_fts (rowid, name, description, category)
+            VALUES (new.id, new.name, new.description, new.category);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS products_fts_delete AFTER DELETE ON products BEGIN
+            INSERT INTO products_fts (products_fts, rowid, name, description, category)
+            VALUES ('delete', old.id, old.name, old.description, old.category);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS products_fts_update
+        AFTER UPDATE OF name, description, category ON products BEGIN
+            INSERT INTO products_fts (products_fts, rowid, name, description, category)
+            VALUES ('delete', old.id, old.name, old.description, old.category);
+            INSERT INTO products_fts (rowid, name, description, category)
+            VALUES (new.id, new.name, new.description, new.category);
+        END
+        ''',
+        # Index products that existed before the search index was added
+        "INSERT INTO products_fts (products_fts) VALUES ('rebuild')"
+    ]),
+    Migration(2, "Indexes for foreign keys, category filters and listing sorts", [
+        # cart and wishlist lookups by user_id are already served by their
+        # UNIQUE(user_id, product_id) autoindexes
+        "CREATE INDEX IF NOT EXISTS idx_reviews_product_id ON reviews (product_id)",
+        "CREATE INDEX IF NOT EXISTS idx_orders_user_id ON orders (user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_order_items_order_id ON order_items (order_id)",
+        "CREATE INDEX IF NOT EXISTS idx_products_category ON products (category)",
+        "CREATE INDEX IF NOT EXISTS idx_products_price ON products (price)",
+        "CREATE INDEX IF NOT EXISTS idx_products_rating ON products (rating)",
+        "CREATE INDEX IF NOT EXISTS idx_products_created_at ON products (created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_products_name ON products (name)"
+    ]),
+    Migration(3, "Product and catalog versions for HTTP validators", [
+        "ALTER TABLE products ADD COLUMN version INTEGER NOT NULL DEFAULT 1",
+        "ALTER TABLE products ADD COLUMN updated_at TIMESTAMP",
+        "UPDATE products SET updated_at = COALESCE(created_at, CURRENT_TIMESTAMP)",
+        '''
+        CREATE TABLE IF NOT EXISTS catalog_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL,
+            updated_at TIMESTAMP NOT NULL
+        )
+        ''',
+        "INSERT OR IGNORE INTO catalog_version (id, version, updated_at) VALUES (1, 1, CURRENT_TIMESTAMP)",
+        # New rows start at version 1 and fall back to created_at for Last-Modified
+        '''
+        CREATE TRIGGER IF NOT EXISTS products_version_insert AFTER INSERT ON products BEGIN
+            UPDATE catalog_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP WHERE id = 1;
+        END
+        ''',
+        # Writes that set version themselves are left alone
+        '''
+        CREATE TRIGGER IF NOT EXISTS products_version_update AFTER UPDATE ON products
+        WHEN new.version = old.version BEGIN
+            UPDATE products SET version = old.version + 1, updated_at = CURRENT_TIMESTAMP WHERE id = new.id;
+            UPDATE catalog_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP WHERE id = 1;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS products_version_delete AFTER DELETE ON products BEGIN
+            UPDATE catalog_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP WHERE id = 1;
+        END
+        '''
+    ]),
+    Migration(4, "Incremental rating aggregates on products", [
+        "ALTER TABLE products ADD COLUMN review_count INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE products ADD COLUMN rating_sum INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE products ADD COLUMN rating_1 INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE products ADD COLUMN rating_2 INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE products ADD COLUMN rating_3 INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE products ADD COLUMN rating_4 INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE products ADD COLUMN rating_5 INTEGER NOT NULL DEFAULT 0",
+        # Products without reviews keep their catalog rating
+        '''
+        UPDATE products SET
+            review_count = agg.review_count,
+            rating_sum = agg.rating_sum,
+            rating_1 = agg.rating_1,
+            rating_2 = agg.rating_2,
+            rating_3 = agg.rating_3,
+            rating_4 = agg.rating_4,
+            rating_5 = agg.rating_5,
+            rating = CAST(agg.rating_sum AS REAL) / agg.review_count
+        FROM (
+            SELECT product_id,
+                COUNT(*) as review_count,
+                SUM(rating) as rating_sum,
+                SUM(rating = 1) as rating_1,
+                SUM(rating = 2) as rating_2,
+                SUM(rating = 3) as rating_3,
+                SUM(rating = 4) as rating_4,
+                SUM(rating = 5) as rating_5
+            FROM reviews
+            GROUP BY product_id
+        ) agg
+        WHERE products.id = agg.product_id
+        '''
+    ]),
+    Migration(5, "Stable SKU for catalog imports", [
+        "ALTER TABLE products ADD COLUMN sku TEXT",
+        # Products created through the API have no SKU; NULLs never conflict
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_products_sku ON products (sku)"
+    ]),
+    Migration(6, "Background task queue", [
+        # Times are Unix seconds. A running task's run_at is its lease expiry,
+        # so tasks of a crashed worker become due again on their own
+        '''
+        CREATE TABLE IF NOT EXISTS tasks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            payload TEXT NOT NULL DEFAULT '{}',
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL DEFAULT 5,
+            run_at REAL NOT NULL,
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        # Covers the claim query; finished tasks are deleted and failed ones drop out
+        "CREATE INDEX IF NOT EXISTS idx_tasks_due ON tasks (name, run_at) WHERE status IN ('pending', 'running')"
+    ]),
+    Migration(7, "Product indexes on cart and wishlist", [
+        # Deleting a product clears its cart and wishlist rows; the unique
+        # (user_id, product_id) indexes cannot serve lookups by product alone
+        "CREATE INDEX IF NOT EXISTS idx_cart_product ON cart (product_id)",
+        "CREATE INDEX IF NOT EXISTS idx_wishlist_product ON wishlist (product_id)"
+    ]),
+    Migration(8, "Popularity scores from product events", [
+        # log2 of the decayed event score plus (time / half-life): comparable
+        # across products at any moment without rewriting rows as they decay.
+        # 0 is below every scored product
+        "ALTER TABLE products ADD COLUMN popularity REAL NOT NULL DEFAULT 0",
+        "CREATE INDEX IF NOT EXISTS idx_products_popularity ON products (popularity)",
+        "CREATE INDEX IF NOT EXISTS idx_products_trending ON products (trending)",
+        # Moves when scores are flushed, for the validators of popularity-sorted listings
+        "ALTER TABLE catalog_version ADD COLUMN popularity_version INTEGER NOT NULL DEFAULT 0",
+        # Score flushes leave product and catalog versions alone
+        "DROP TRIGGER IF EXISTS products_version_update",
+        '''
+        CREATE TRIGGER IF NOT EXISTS products_version_update AFTER UPDATE ON products
+        WHEN new.version = old.version AND new.popularity IS old.popularity BEGIN
+            UPDATE products SET version = old.version + 1, updated_at = CURRENT_TIMESTAMP WHERE id = new.id;
+            UPDATE catalog_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP WHERE id = 1;
+        END
+        '''
+    ]),
+    Migration(9, "Record of schema objects dropped for a bulk load", [
+        # A bulk catalog load stores the definitions of the indexes and
+        # triggers it drops here, in the same transaction, and deletes them
+        # once the objects are back. Rows left behind by a killed load are
+        # recreated at the next startup
+        '''
+        CREATE TABLE IF NOT EXISTS deferred_schema (
+            name TEXT PRIMARY KEY,
+            type TEXT NOT NULL,
+            sql TEXT NOT NULL
+        )
+        '''
+    ]),
+    Migration(10, "Task lookups by name", [
+        # Scheduling a periodic task checks for a row of any status, and the
+        # task stats group by name and status; idx_tasks_due only holds due rows
+        "CREATE INDEX IF NOT EXISTS idx_tasks_name_status ON tasks (name, status)"
+    ]),
+    Migration(11, "Token revisions for cached logins", [
+        # Bumped by every user update; a cached token is only honoured while
+        # its user's revision is unchanged, whichever process made the change
+        "ALTER TABLE users ADD COLUMN token_revision INTEGER NOT NULL DEFAULT 0"
+    ]),
+    Migration(12, "Index for new-arrival listings", [
+        # Like trending, the flag filter walks this index in id order, so a
+        # page stops after LIMIT rows instead of filtering the whole table
+        "CREATE INDEX IF NOT EXISTS idx_products_is_new ON products (is_new)"
+    ]),
+]
+
+def restore_deferred_schema(connection: sqlite3.Connection, rebuild_search: bool = True) -> int:
+    """Recreate the objects listed in deferred_schema and rebuild the search
+    index, in one transaction; returns how many objects were listed"""
+    if connection.in_transaction:
+        connection.commit()
+    # Plain reads first, so the usual startup takes no write lock
+    if not connection.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'deferred_schema'"
+    ).fetchone():
+        return 0
+    if not connection.execute("SELECT 1 FROM deferred_schema LIMIT 1").fetchone():
+        return 0
+
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        deferred = connection.execute("SELECT name, type, sql FROM deferred_schema").fetchall()
+        for name, object_type, sql in deferred:
+            exists = connection.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = ? AND name = ?", (object_type, name)
+            ).fetchone()
+            if not exists:
+                connection.execute(sql)
+        if deferred and rebuild_search:
+            connection.execute("INSERT INTO products_fts (products_fts) VALUES ('rebuild')")
+        connection.execute("DELETE FROM deferred_schema")
+        connection.commit()
+    except sqlite3.Error:
+        connection.rollback()
+        raise
+    return len(deferred)
+
+class MigrationRunner:
+    """Applies pending migrations and tracks the version in PRAGMA user_version"""
+
+    def __init__(self, connection: sqlite3.Connection, migrations: Optional[List[Migration]] = None):
+        self.connection = connection
+        self.migrations = sorted(migrations or MIGRATIONS, key=lambda m: m.version)
+
+    def current_version(self) -> int:
+        """Schema version recorded in the database file"""
+        return self.connection.execute("PRAGMA user_version").fetchone()[0]
+
+    def latest_version(self) -> int:
+        """Version the database reaches once every migration is applied"""
+        return self.migrations[-1].version if self.migrations else 0
+
+    def pending(self, target: Optional[int] = None) -> List[Migration]:
+        """Migrations newer than the current version, up to target"""
+        current = self.current_version()
+        return [
+            m for m in self.migrations
+            if m.version > current and (target is None or m.version <= target)
+        ]
+
+    def migrate(self, target: Optional[int] = None) -> List[Migration]:
+        """Apply pending migrations in order, each in its own transaction.
+
+        A failing migration is rolled back and the error re-raised; the
+        migrations before it stay applied.
+        """
+        applied = []
+        for migration in self.pending(target):
+            if self.connection.in_transaction:
+                self.connection.commit()
+
+            # DDL only joins a transaction when it is opened explicitly
+            self.connection.execute("BEGIN IMMEDIATE")
+            if self.current_version() >= migration.version:
+                # Another process applied it while we waited for the lock
+                self.connection.rollback()
+                continue
+            try:
+                for statement in migration.statements:
+                    self.connection.execute(statement)
+                self.connection.execute(f"PRAGMA user_version = {int(migration.version)}")
+                self.connection.commit()
+            except sqlite3.Error:
+                self.connection.rollback()
+                raise
+
+            applied.append(migration)
+        return applied
@@ -0,0 +1,113 @@
+import sqlite3
+import queue
+import threading
+from typing import Optional, Dict, Any, List, Callable
+
+class StorageProfile:
+    """SQLite PRAGMA settings applied to every pooled connection"""
+
+    def __init__(self, journal_mode: str = "WAL", synchronous: str = "NORMAL",
+                 cache_size: int = -64000, mmap_size: int = 268435456,
+                 busy_timeout: int = 5000):
+        self.journal_mode = journal_mode
+        self.synchronous = synchronous
+        self.cache_size = cache_size  # negative values are KiB, positive are pages
+        self.mmap_size = mmap_size
+        self.busy_timeout = busy_timeout  # milliseconds
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> 'StorageProfile':
+        """Create a StorageProfile from DATABASE_* keys of a Flask config"""
+        defaults = cls()
+        return cls(
+            journal_mode=config.get('DATABASE_JOURNAL_MODE', defaults.journal_mode),
+            synchronous=config.get('DATABASE_SYNCHRONOUS', defaults.synchronous),
+            cache_size=int(config.get('DATABASE_CACHE_SIZE', defaults.cache_size)),
+            mmap_size=int(config.get('DATABASE_MMAP_SIZE', defaults.mmap_size)),
+            busy_timeout=int(config.get('DATABASE_BUSY_TIMEOUT', defaults.busy_timeout))
+        )
+
+    def pragmas(self) -> List[str]:
+        """PRAGMA statements that apply this profile to a connection"""
+        return [
+            f"PRAGMA journal_mode = {self.journal_mode}",
+            f"PRAGMA synchronous = {self.synchronous}",
+            f"PRAGMA cache_size = {self.cache_size}",
+            f"PRAGMA mmap_size = {self.mmap_size}",
+            f"PRAGMA busy_timeout = {self.busy_timeout}"
+        ]
+
+class ConnectionPool:
+    """Bounded pool of SQLite connections shared between threads.
+
+    A connection is used by one thread at a time: it is checked out with
+    acquire() and handed back with release(). In WAL mode readers on
+    different connections never block each other or the single writer.
+    """
+
+    def __init__(self, db_path: str, profile: Optional[StorageProfile] = None,
+                 max_size: int = 16, timeout: float = 30.0):
+        self.db_path = db_path
+        self.profile = profile or StorageProfile()
+        self.max_size = max_size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._size = 0
+        self._lock = threading.Lock()
+        # Called with every newly opened connection, e.g. to install tracing
+        self.connect_hooks: List[Callable[[sqlite3.Connection], None]] = []
+
+    def _create_connection(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(
+            self.db_path,
+            timeout=self.profile.busy_timeout / 1000.0,
+            check_same_thread=False
+        )
+        connection.row_factory = sqlite3.Row
+        for pragma in self.profile.pragmas():
+            connection.execute(pragma)
+        for hook in self.connect_hooks:
+            hook(connection)
+        return connection
+
+    def acquire(self) -> sqlite3.Connection:
+        """Check out a connection, opening a new one while below max_size"""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            can_create = self._size < self.max_size
+            if can_create:
+                self._size += 1
+
+        if can_create:
+            try:
+                return self._create_connection()
+            except sqlite3.Error:
+                with self._lock:
+                    self._size -= 1
+                raise
+
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError("Timed out waiting for a database connection")
+
+    def release(self, connection: sqlite3.Connection) -> None:
+        """Return a connection to the pool, discarding any open transaction"""
+        if connection.in_transaction:
+            connection.rollback()
+        self._idle.put(connection)
+
+    def close(self) -> None:
+        """Close all idle connections; the pool reopens connections on demand"""
+        while True:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            connection.close()
+            with self._lock:
+                self._size -= 1
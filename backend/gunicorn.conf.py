@@ -0,0 +1,80 @@
+"""Gunicorn settings for running the API in production.
+
+Start with `gunicorn -c gunicorn.conf.py` (or `python run.py --production`)
+from the backend/ directory. Every setting can be overridden through the
+environment variables below.
+"""
+import multiprocessing
+import os
+import tempfile
+
+def _int_env(name, default):
+    return int(os.environ.get(name, default))
+
+# The app factory runs once in every worker after the fork, so each worker
+# opens its own SQLite connections, password worker pool and task workers
+wsgi_app = 'app:create_app()'
+preload_app = False
+
+# One listening socket, shared by every worker
+bind = os.environ.get('BIND', f"0.0.0.0:{os.environ.get('PORT', '5000')}")
+backlog = _int_env('BACKLOG', 2048)
+
+# Worker processes scale with cores. With THREADS > 1 each worker serves
+# requests from a thread pool (gthread); the default single-threaded sync
+# worker recycles without dropping connections it has already accepted
+workers = _int_env('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1)
+threads = _int_env('THREADS', 1)
+worker_class = os.environ.get('WORKER_CLASS', 'gthread' if threads > 1 else 'sync')
+
+# Recycle workers after a number of requests (jittered so they do not all
+# restart together) to bound memory growth
+max_requests = _int_env('MAX_REQUESTS', 10000)
+max_requests_jitter = _int_env('MAX_REQUESTS_JITTER', 1000)
+
+timeout = _int_env('TIMEOUT', 30)
+# Seconds in-flight requests get to finish on restart (SIGHUP) or shutdown
+graceful_timeout = _int_env('GRACEFUL_TIMEOUT', 30)
+# Seconds an idle keep-alive connection is held open (threaded workers only)
+keepalive = _int_env('KEEPALIVE', 5)
+
+accesslog = os.environ.get('ACCESS_LOG', '-')
+errorlog = os.environ.get('ERROR_LOG', '-')
+loglevel = os.environ.get('LOG_LEVEL', 'info')
+
+def on_starting(server):
+    """Create, migrate and seed the database once, before any worker starts,
+    and give the workers a fresh directory to share their metrics through"""
+    from app import create_app
+    from utils.metrics import clear_shared_metrics
+    if not os.environ.get('METRICS_DIR'):
+        os.environ['METRICS_DIR'] = tempfile.mkdtemp(prefix='egadget-metrics-')
+    os.makedirs(os.environ['METRICS_DIR'], exist_ok=True)
+    clear_shared_metrics(os.environ['METRICS_DIR'])
+    app = create_app()
+    app.password_hasher.shutdown()
+    app.db.close()
+
+def post_worker_init(worker):
+    """Start the worker's task and popularity threads once its app is loaded"""
+    from app import start_background
+    start_background(worker.wsgi)
+
+def worker_exit(server, worker):
+    """Save the worker's metrics, stop its task threads and release its
+    connections and password pool when it stops"""
+    app = getattr(worker, 'wsgi', None)
+    if app is None:
+        return
+    if getattr(app, 'metrics', None) is not None:
+        # Keep the worker's last requests in the shared totals
+        app.metrics.sync()
+    if hasattr(app, 'tasks'):
+        app.tasks.shutdown()
+    if getattr(app, 'popularity', None) is not None:
+        # Write the worker's unflushed event scores
+        app.popularity.shutdown()
+    if hasattr(app, 'password_hasher'):
+        app.password_hasher.shutdown()
+    if hasattr(app, 'db'):
+        app.db.close()
@@ -1,14 +1,86 @@
 import json
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Tuple, Sequence
+
+# API field -> products columns it is built from, in serialization order
+FIELD_COLUMNS: Dict[str, Tuple[str, ...]] = {
+    'id': ('id',),
+    'sku': ('sku',),
+    'name': ('name',),
+    'description': ('description',),
+    'price': ('price',),
+    'originalPrice': ('original_price',),
+    'discount': ('discount',),
+    'stock': ('stock',),
+    'category': ('category',),
+    'images': ('images',),
+    'image': ('images',),  # first image only
+    'isNew': ('is_new',),
+    'trending': ('trending',),
+    'rating': ('rating',),
+    'createdAt': ('created_at',),
+    'reviewCount': ('review_count',),
+    'ratingSum': ('rating_sum',),
+    'ratingHistogram': tuple(f'rating_{star}' for star in range(1, 6)),
+    'reviews': (),
+    'inWishlist': ()
+}
+
+# Named field sets accepted by fields=
+FIELD_PROFILES: Dict[str, Tuple[str, ...]] = {
+    'card': ('id', 'name', 'price', 'originalPrice', 'discount', 'stock', 'image',
+             'isNew', 'rating', 'reviewCount', 'inWishlist'),
+    'detail': tuple(field for field in FIELD_COLUMNS if field != 'image')
+}
 
 class Product:
+    @staticmethod
+    def parse_fields(spec: Optional[str]) -> Optional[Tuple[str, ...]]:
+        """Resolve a comma-separated fields= value (field names and profiles).
+        
+        Returns None (every field) for an empty value. The result always
+        contains id and is in serialization order; raises ValueError on
+        unknown names.
+        """
+        if not spec or not spec.strip():
+            return None
+        
+        requested = {'id'}
+        for name in spec.split(','):
+            name = name.strip()
+            if not name:
+                continue
+            if name in FIELD_PROFILES:
+                requested.update(FIELD_PROFILES[name])
+            elif name in FIELD_COLUMNS:
+                requested.add(name)
+            else:
+                raise ValueError(f"Unknown field '{name}'")
+        
+        return tuple(field for field in FIELD_COLUMNS if field in requested)
+    
+    @staticmethod
+    def columns_for(fields: Optional[Sequence[str]]) -> Optional[List[str]]:
+        """products columns needed to serialize fields (None means all)"""
+        if fields is None:
+            return None
+        columns = ['id']
+        for field in fields:
+            for column in FIELD_COLUMNS[field]:
+                if column not in columns:
+                    columns.append(column)
+        return columns
+    
     def __init__(self, id: Optional[int] = None, name: str = "", description: str = "",
                  price: float = 0.0, original_price: Optional[float] = None, 
                  discount: int = 0, stock: int = 0, category: str = "", 
                  images: List[str] = None, is_new: bool = False, 
                  trending: bool = False, rating: float = 0.0,
-                 created_at: Optional[str] = None):
+                 created_at: Optional[str] = None, version: int = 1,
+                 updated_at: Optional[str] = None, review_count: Optional[int] = None,
+                 rating_sum: int = 0, rating_histogram: Optional[Dict[str, int]] = None,
+                 sku: Optional[str] = None):
         self.id = id
+        self.sku = sku
         self.name = name
         self.description = description
         self.price = price
@@ -21,7 +93,14 @@ class Product:
         self.trending = trending
         self.rating = rating
         self.created_at = created_at
+        self.version = version
+        self.updated_at = updated_at or created_at
         self.reviews = []
+        # Maintained incrementally in the products row by add_review
+        self.review_count = review_count
+        self.rating_sum = rating_sum
+        self.rating_histogram = rating_histogram or {str(star): 0 for star in range(1, 6)}
+        self.in_wishlist = None  # None unless resolved for a signed-in user
     
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> 'Product':
@@ -47,13 +126,20 @@ class Product:
             is_new=bool(data.get('is_new', 0)),
             trending=bool(data.get('trending', 0)),
             rating=float(data.get('rating', 0.0)),
-            created_at=data.get('created_at')
+            created_at=data.get('created_at'),
+            version=int(data.get('version', 1)),
+            updated_at=data.get('updated_at'),
+            review_count=int(data['review_count']) if data.get('review_count') is not None else None,
+            rating_sum=int(data.get('rating_sum') or 0),
+            rating_histogram={str(star): int(data.get(f'rating_{star}') or 0) for star in range(1, 6)},
+            sku=data.get('sku')
         )
     
-    def to_dict(self) -> Dict[str, Any]:
-        """Convert Product instance to dictionary"""
-        return {
+    def to_dict(self, fields: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+        """Convert Product instance to dictionary, limited to fields if given"""
+        data = {
             'id': self.id,
+            'sku': self.sku,
             'name': self.name,
             'description': self.description,
             'price': self.price,
@@ -66,9 +152,22 @@ class Product:
             'trending': self.trending,
             'rating': self.rating,
             'createdAt': self.created_at,
-            'reviews': self.reviews
+            'reviewCount': self.review_count,
+            'ratingSum': self.rating_sum,
+            'ratingHistogram': self.rating_histogram,
+            'reviews': self.reviews,
+            'inWishlist': self.in_wishlist
         }
+        if fields is None:
+            return data
+        
+        data['image'] = self.images[0] if self.images else None
+        return {field: data[field] for field in fields}
     
-    def load_reviews(self, reviews):
-        """Load reviews for this product"""
-        self.reviews = reviews 
\ No newline at end of file
+    def load_reviews(self, reviews, review_count: Optional[int] = None):
+        """Load reviews for this product; reviews may be a preview of review_count"""
+        self.reviews = reviews
+        if review_count is not None:
+            self.review_count = review_count
+        elif self.review_count is None:
+            self.review_count = len(reviews) 
\ No newline at end of file
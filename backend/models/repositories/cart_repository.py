@@ -0,0 +1,152 @@
+from typing import List, Dict, Any, Tuple
+import json
+from database.db import Database
+
+class CartRepository:
+    def __init__(self, db: Database):
+        self.db = db
+
+    def get_cart(self, user_id: int) -> Dict[str, Any]:
+        """Get a user's cart items with their products and the cart total"""
+        self.db.execute("""
+            SELECT c.*, p.name, p.price, p.original_price, p.discount, p.stock, p.images,
+            p.is_new, p.trending, p.rating
+            FROM cart c
+            JOIN products p ON c.product_id = p.id
+            WHERE c.user_id = ?
+        """, (user_id,))
+
+        cart_items = self.db.fetchall()
+
+        # Process cart items
+        items = []
+        total = 0
+
+        for item in cart_items:
+            # Parse product images
+            images = item['images']
+            if isinstance(images, str):
+                try:
+                    images = json.loads(images)
+                except json.JSONDecodeError:
+                    images = []
+
+            product = {
+                'id': item['product_id'],
+                'name': item['name'],
+                'price': item['price'],
+                'originalPrice': item['original_price'],
+                'discount': item['discount'],
+                'stock': item['stock'],
+                'images': images,
+                'isNew': bool(item['is_new']),
+                'trending': bool(item['trending']),
+                'rating': item['rating']
+            }
+
+            cart_item = {
+                'id': item['id'],
+                'product': product,
+                'quantity': item['quantity'],
+                'subtotal': item['price'] * item['quantity']
+            }
+
+            items.append(cart_item)
+            total += cart_item['subtotal']
+
+        return {
+            'items': items,
+            'total': total,
+            'count': len(items)
+        }
+
+    def apply_changes(self, user_id: int, upserts: List[Tuple[int, int]], removals: List[int],
+                      mode: str = 'set', clamp_to_stock: bool = False
+                      ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Apply many cart upserts and removals in one transaction.
+
+        upserts are (product_id, quantity) pairs. mode decides how quantity
+        combines with what is already in the cart: 'set' replaces it, 'add'
+        adds to it and 'max' keeps the larger of the two. Stock is checked
+        for every product with one query; with clamp_to_stock quantities
+        above stock are lowered instead of rejected. 'max' merges a cart kept
+        elsewhere (e.g. in the browser), so products that no longer exist are
+        skipped rather than failing the merge.
+
+        Returns (errors, adjustments, skipped). Nothing is written when there
+        are errors.
+        """
+        errors: List[Dict[str, Any]] = []
+        adjustments: List[Dict[str, Any]] = []
+        skipped: List[Dict[str, Any]] = []
+
+        # Later entries for the same product win
+        requested: Dict[int, int] = {}
+        for product_id, quantity in upserts:
+            requested[product_id] = quantity
+        removals = [product_id for product_id in removals if product_id not in requested]
+
+        # Hold the write lock from the stock check until the writes land
+        with self.db.transaction(immediate=True):
+            rows_to_write: List[Tuple[int, int, int]] = []
+            if requested:
+                product_ids = list(requested)
+                placeholders = ', '.join('?' for _ in product_ids)
+
+                self.db.execute(
+                    f"SELECT id, stock FROM products WHERE id IN ({placeholders})",
+                    product_ids
+                )
+                stock = {row['id']: row['stock'] for row in self.db.fetchall()}
+
+                existing: Dict[int, int] = {}
+                if mode != 'set':
+                    self.db.execute(
+                        f"SELECT product_id, quantity FROM cart WHERE user_id = ? AND product_id IN ({placeholders})",
+                        [user_id] + product_ids
+                    )
+                    existing = {row['product_id']: row['quantity'] for row in self.db.fetchall()}
+
+                for product_id, quantity in requested.items():
+                    if product_id not in stock:
+                        missing = {'product_id': product_id, 'message': 'Product not found'}
+                        (skipped if mode == 'max' else errors).append(missing)
+                        continue
+
+                    current = existing.get(product_id, 0)
+                    if mode == 'add':
+                        quantity = current + quantity
+                    elif mode == 'max':
+                        quantity = max(current, quantity)
+
+                    if quantity > stock[product_id]:
+                        if not clamp_to_stock:
+                            errors.append({'product_id': product_id, 'message': 'Insufficient stock'})
+                            continue
+                        adjustments.append({
+                            'product_id': product_id,
+                            'requested': quantity,
+                            'quantity': stock[product_id]
+                        })
+                        quantity = stock[product_id]
+
+                    if quantity <= 0:
+                        removals.append(product_id)
+                    else:
+                        rows_to_write.append((user_id, product_id, quantity))
+
+            if errors:
+                return errors, [], []
+
+            self.db.executemany(
+                """
+                INSERT INTO cart (user_id, product_id, quantity) VALUES (?, ?, ?)
+                ON CONFLICT (user_id, product_id) DO UPDATE SET quantity = excluded.quantity
+                """,
+                rows_to_write
+            )
+            self.db.executemany(
+                "DELETE FROM cart WHERE user_id = ? AND product_id = ?",
+                [(user_id, product_id) for product_id in removals]
+            )
+        return [], adjustments, skipped
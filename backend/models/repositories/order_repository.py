@@ -0,0 +1,127 @@
+from typing import Optional, List, Dict, Any
+import json
+from database.db import Database
+
+class OutOfStockError(Exception):
+    """Raised when a product cannot cover the quantity being ordered"""
+
+    def __init__(self, product_id: int, name: str):
+        super().__init__(f"Insufficient stock for {name}")
+        self.product_id = product_id
+        self.name = name
+
+class OrderRepository:
+    def __init__(self, db: Database):
+        self.db = db
+        # Stock changes must reach the shared product cache
+        self.product_cache = getattr(db, 'product_cache', None)
+
+    def create_from_cart(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """Turn a user's cart into an order in a single transaction.
+
+        Stock is taken with conditional updates (stock >= quantity), so
+        concurrent checkouts of the same product can never oversell; the
+        one that finds too little stock rolls back and raises
+        OutOfStockError. Returns None when the cart is empty.
+        """
+        # Take the write lock up front so the cart read and stock updates
+        # see one consistent state; any error rolls everything back
+        with self.db.transaction(immediate=True):
+            self.db.execute("""
+                SELECT c.product_id, c.quantity, p.name, p.price
+                FROM cart c
+                JOIN products p ON c.product_id = p.id
+                WHERE c.user_id = ?
+            """, (user_id,))
+            cart_items = self.db.fetchall()
+
+            if not cart_items:
+                return None
+
+            for item in cart_items:
+                self.db.execute(
+                    "UPDATE products SET stock = stock - ? WHERE id = ? AND stock >= ?",
+                    (item['quantity'], item['product_id'], item['quantity'])
+                )
+                if self.db.rowcount == 0:
+                    raise OutOfStockError(item['product_id'], item['name'])
+
+            total_amount = sum(item['price'] * item['quantity'] for item in cart_items)
+            self.db.execute(
+                "INSERT INTO orders (user_id, total_amount) VALUES (?, ?) RETURNING id",
+                (user_id, total_amount)
+            )
+            order_id = self.db.fetchone()['id']
+
+            self.db.executemany(
+                "INSERT INTO order_items (order_id, product_id, quantity, price) VALUES (?, ?, ?, ?)",
+                [(order_id, item['product_id'], item['quantity'], item['price']) for item in cart_items]
+            )
+            self.db.execute("DELETE FROM cart WHERE user_id = ?", (user_id,))
+
+        if self.product_cache is not None:
+            for item in cart_items:
+                self.product_cache.delete(item['product_id'])
+
+        return self.find_by_id(order_id, user_id)
+
+    def find_by_id(self, order_id: int, user_id: int) -> Optional[Dict[str, Any]]:
+        """Find one of a user's orders by ID"""
+        self.db.execute(
+            "SELECT * FROM orders WHERE id = ? AND user_id = ?",
+            (order_id, user_id)
+        )
+        order = self.db.fetchone()
+        if not order:
+            return None
+        return self._with_items([order])[0]
+
+    def find_by_user(self, user_id: int, limit: int = 50, offset: int = 0) -> List[Dict[str, Any]]:
+        """Find a user's orders, newest first"""
+        self.db.execute(
+            "SELECT * FROM orders WHERE user_id = ? ORDER BY id DESC LIMIT ? OFFSET ?",
+            (user_id, limit, offset)
+        )
+        return self._with_items(self.db.fetchall())
+
+    def _with_items(self, orders: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Attach the items of a page of orders with a single query"""
+        if not orders:
+            return []
+
+        order_ids = [order['id'] for order in orders]
+        placeholders = ', '.join('?' for _ in order_ids)
+        self.db.execute(f"""
+            SELECT oi.*, p.name, p.images
+            FROM order_items oi
+            LEFT JOIN products p ON oi.product_id = p.id
+            WHERE oi.order_id IN ({placeholders})
+            ORDER BY oi.id
+        """, tuple(order_ids))
+
+        items_by_order: Dict[int, List[Dict[str, Any]]] = {order_id: [] for order_id in order_ids}
+        for item in self.db.fetchall():
+            images = item['images']
+            if isinstance(images, str):
+                try:
+                    images = json.loads(images)
+                except json.JSONDecodeError:
+                    images = []
+
+            items_by_order[item['order_id']].append({
+                'id': item['id'],
+                'productId': item['product_id'],
+                'name': item['name'],
+                'image': images[0] if images else None,
+                'price': item['price'],
+                'quantity': item['quantity'],
+                'subtotal': item['price'] * item['quantity']
+            })
+
+        return [{
+            'id': order['id'],
+            'status': order['status'],
+            'totalAmount': order['total_amount'],
+            'createdAt': order['created_at'],
+            'items': items_by_order[order['id']]
+        } for order in orders]
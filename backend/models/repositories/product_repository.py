@@ -1,35 +1,159 @@
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple, Iterator, Sequence
+import base64
 import json
+import re
+import sqlite3
 from database.db import Database
 from models.product import Product
+from utils.popularity import add_to_popularity
 
 class ProductRepository:
     def __init__(self, db: Database):
         self.db = db
+        # Shared entity cache attached to the database by create_app, if enabled
+        self.cache = getattr(db, 'product_cache', None)
+        self.facet_cache = getattr(db, 'facet_cache', None)
     
-    def find_by_id(self, product_id: int) -> Optional[Product]:
-        """Find a product by ID"""
-        self.db.execute("SELECT * FROM products WHERE id = ?", (product_id,))
+    def find_by_id(self, product_id: int, version: Optional[int] = None,
+                   fields: Optional[Sequence[str]] = None) -> Optional[Product]:
+        """Find a product by ID.
+        
+        The entity cache only sees this process's writes, so a cached
+        product is served only while its version matches the products row.
+        Pass version when it was just read, to skip reading it again. With
+        fields, a cache miss selects only the columns those fields need and
+        loads reviews only if they are among them; such partial products
+        are not cached.
+        """
+        generation = None
+        if self.cache is not None:
+            product = self.cache.get(product_id)
+            if product is not None:
+                if version is None:
+                    current = self.find_version(product_id)
+                    version = current[0] if current else None
+                if version == product.version:
+                    return product
+                # Written by another process since it was cached
+                self.cache.delete(product_id)
+            generation = self.cache.generation
+        
+        columns = Product.columns_for(fields)
+        if columns is None:
+            select = "*"
+        else:
+            # Validators need the version and modification time whatever the fields
+            select = ", ".join(columns + ['version', 'COALESCE(updated_at, created_at) as updated_at'])
+        
+        self.db.execute(f"SELECT {select} FROM products WHERE id = ?", (product_id,))
         product_data = self.db.fetchone()
         if product_data:
             product = Product.from_dict(product_data)
-            self._load_reviews(product)
+            if columns is None or 'reviews' in fields:
+                self._load_reviews(product)
+            if self.cache is not None and columns is None:
+                self.cache.set(product_id, product, generation=generation)
             return product
         return None
     
-    def find_all(self, limit: int = 100, offset: int = 0) -> List[Product]:
+    def find_version(self, product_id: int) -> Optional[Tuple[int, Optional[str]]]:
+        """Return (version, updated_at) of a product without loading it.
+        
+        Always read from the row: other processes write to the same database.
+        """
+        self.db.execute(
+            "SELECT version, COALESCE(updated_at, created_at) as updated_at FROM products WHERE id = ?",
+            (product_id,)
+        )
+        row = self.db.fetchone()
+        if row:
+            return row['version'], row['updated_at']
+        return None
+    
+    def catalog_version(self) -> Tuple[int, Optional[str]]:
+        """Return (version, updated_at) of the catalog as a whole"""
+        self.db.execute("SELECT version, updated_at FROM catalog_version WHERE id = 1")
+        row = self.db.fetchone()
+        if row:
+            return row['version'], row['updated_at']
+        return 0, None
+    
+    def popularity_version(self) -> int:
+        """Counter moved by every flush of popularity scores"""
+        self.db.execute("SELECT popularity_version FROM catalog_version WHERE id = 1")
+        row = self.db.fetchone()
+        return row['popularity_version'] if row else 0
+    
+    def add_popularity(self, scores: Dict[int, float], at: float, half_life: float) -> int:
+        """Add event scores valued at time at to product popularity.
+        
+        Reads the current keys and writes the merged ones with executemany
+        in one transaction, without touching product or catalog versions.
+        Returns the number of products updated (unknown ids are skipped).
+        """
+        product_ids = list(scores)
+        rows = []
+        with self.db.transaction(immediate=True):
+            for start in range(0, len(product_ids), 500):
+                chunk = product_ids[start:start + 500]
+                placeholders = ', '.join('?' for _ in chunk)
+                self.db.execute(f"SELECT id, popularity FROM products WHERE id IN ({placeholders})", tuple(chunk))
+                for row in self.db.fetchall():
+                    rows.append((add_to_popularity(row['popularity'], scores[row['id']], at, half_life), row['id']))
+            
+            if rows:
+                self.db.executemany("UPDATE products SET popularity = ? WHERE id = ?", rows)
+                self.db.execute("UPDATE catalog_version SET popularity_version = popularity_version + 1 WHERE id = 1")
+        return len(rows)
+    
+    def refresh_trending(self, size: int, min_popularity: float) -> int:
+        """Flag the size most popular products with a popularity of at least
+        min_popularity as trending and clear the flag elsewhere; returns the
+        number of products whose flag changed"""
+        with self.db.transaction(immediate=True):
+            self.db.execute(
+                "SELECT id FROM products WHERE popularity >= ? ORDER BY popularity DESC LIMIT ?",
+                (min_popularity, size)
+            )
+            trending_ids = [row['id'] for row in self.db.fetchall()]
+            placeholders = ', '.join('?' for _ in trending_ids)
+            
+            # Only rows whose flag flips are written, so only they get new versions
+            self.db.execute(
+                f"UPDATE products SET trending = 0 WHERE trending = 1 AND id NOT IN ({placeholders}) RETURNING id",
+                tuple(trending_ids)
+            )
+            changed = [row['id'] for row in self.db.fetchall()]
+            if trending_ids:
+                self.db.execute(
+                    f"UPDATE products SET trending = 1 WHERE trending = 0 AND id IN ({placeholders}) RETURNING id",
+                    tuple(trending_ids)
+                )
+                changed.extend(row['id'] for row in self.db.fetchall())
+        
+        for product_id in changed:
+            self._invalidate(product_id)
+        return len(changed)
+    
+    def _invalidate(self, product_id: int) -> None:
+        """Drop a product from the entity cache after a write"""
+        if self.cache is not None:
+            self.cache.delete(product_id)
+    
+    def find_all(self, limit: int = 100, offset: int = 0, include_reviews: bool = True,
+                 review_limit: Optional[int] = None) -> List[Product]:
         """Find all products with pagination"""
-        self.db.execute("SELECT * FROM products LIMIT ? OFFSET ?", (limit, offset))
+        self.db.execute("SELECT * FROM products ORDER BY id LIMIT ? OFFSET ?", (limit, offset))
         product_data_list = self.db.fetchall()
         products = [Product.from_dict(data) for data in product_data_list]
         
-        # Load reviews for each product
-        for product in products:
-            self._load_reviews(product)
+        if include_reviews:
+            self._load_reviews_batch(products, review_limit)
         
         return products
     
-    def find_by_category(self, category: str, limit: int = 100, offset: int = 0) -> List[Product]:
+    def find_by_category(self, category: str, limit: int = 100, offset: int = 0,
+                         include_reviews: bool = True, review_limit: Optional[int] = None) -> List[Product]:
         """Find products by category"""
         self.db.execute(
             "SELECT * FROM products WHERE category = ? LIMIT ? OFFSET ?", 
@@ -38,14 +162,229 @@ class ProductRepository:
         product_data_list = self.db.fetchall()
         products = [Product.from_dict(data) for data in product_data_list]
         
-        # Load reviews for each product
-        for product in products:
-            self._load_reviews(product)
+        if include_reviews:
+            self._load_reviews_batch(products, review_limit)
         
         return products
     
-    def find_by_filters(self, filters: Dict[str, Any], limit: int = 100, offset: int = 0) -> List[Product]:
+    def find_by_filters(self, filters: Dict[str, Any], limit: int = 100, offset: int = 0,
+                        include_reviews: bool = True, review_limit: Optional[int] = None) -> List[Product]:
         """Find products based on multiple filters"""
+        products, _ = self.find_page(
+            filters, limit, offset=offset,
+            include_reviews=include_reviews,
+            review_limit=review_limit
+        )
+        return products
+    
+    def _page_query(self, filters: Dict[str, Any], limit: int, cursor: Optional[str],
+                    offset: int, fields: Optional[Sequence[str]] = None) -> Tuple[str, Tuple[Any, ...], str, str]:
+        """Build the page query (fetching limit + 1 rows) for find_page and stream_page.
+        
+        With fields, only the columns those fields are built from (plus the
+        sort key) are selected. Returns (query, params, sort token, sort column).
+        """
+        from_clause, where_parts, params, search_query = self._build_filter_query(filters)
+        sort_token, sort_column, sort_order = self._resolve_sort(filters.get('sort'), search_query)
+        
+        columns = Product.columns_for(fields)
+        if columns is None:
+            select = "products.*"
+        else:
+            if sort_column != "search.search_rank" and sort_column not in columns:
+                columns.append(sort_column)
+            select = ", ".join(f"products.{column}" for column in columns)
+        if search_query:
+            select += ", search.search_rank"
+        
+        if cursor:
+            sort_value, last_id = self._decode_cursor(cursor, sort_token)
+            comparison = "<" if sort_order == "DESC" else ">"
+            if sort_column == "id":
+                where_parts.append(f"id {comparison} ?")
+                params.append(last_id)
+            else:
+                where_parts.append(f"({sort_column}, id) {comparison} (?, ?)")
+                params.extend([sort_value, last_id])
+            offset = 0
+        
+        query = f"SELECT {select} FROM {from_clause} WHERE {' AND '.join(where_parts)}"
+        
+        if sort_column == "id":
+            query += f" ORDER BY id {sort_order}"
+        else:
+            query += f" ORDER BY {sort_column} {sort_order}, id {sort_order}"
+        
+        # Fetch one extra row to find out whether there is a next page
+        query += " LIMIT ? OFFSET ?"
+        params.append(limit + 1)
+        params.append(offset)
+        
+        return query, tuple(params), sort_token, sort_column
+    
+    def _next_cursor(self, sort_token: str, sort_column: str, last_row: Dict[str, Any]) -> str:
+        return self._encode_cursor(
+            sort_token,
+            last_row['search_rank'] if sort_column == "search.search_rank" else last_row[sort_column],
+            last_row['id']
+        )
+    
+    def find_page(self, filters: Dict[str, Any], limit: int = 100, cursor: Optional[str] = None,
+                  offset: int = 0, include_reviews: bool = True,
+                  review_limit: Optional[int] = None,
+                  fields: Optional[Sequence[str]] = None) -> Tuple[List[Product], Optional[str]]:
+        """Find a page of filtered products and the cursor of the page after it.
+        
+        With a cursor the page starts right after the row it was encoded from,
+        using an index seek on (sort key, id) instead of OFFSET. Raises
+        ValueError if the cursor is malformed or was issued for another sort.
+        With fields (see Product.parse_fields) only the columns they need are
+        read; the other attributes keep their defaults.
+        """
+        query, params, sort_token, sort_column = self._page_query(filters, limit, cursor, offset, fields)
+        
+        self.db.execute(query, params)
+        product_data_list = self.db.fetchall()
+        
+        next_cursor = None
+        if len(product_data_list) > limit:
+            product_data_list = product_data_list[:limit]
+            if limit > 0:
+                next_cursor = self._next_cursor(sort_token, sort_column, product_data_list[-1])
+        
+        products = [Product.from_dict(data) for data in product_data_list]
+        
+        if include_reviews:
+            self._load_reviews_batch(products, review_limit)
+        
+        return products, next_cursor
+    
+    def stream_page(self, filters: Dict[str, Any], limit: int = 100, cursor: Optional[str] = None,
+                    offset: int = 0, include_reviews: bool = True, review_limit: Optional[int] = None,
+                    fields: Optional[Sequence[str]] = None,
+                    chunk_size: int = 500) -> Iterator[Tuple[List[Product], Optional[str]]]:
+        """Like find_page, but yields the page in chunks of chunk_size products.
+        
+        Each chunk is (products, next_cursor); next_cursor is only set on the
+        last chunk. The query runs before this returns, so a bad cursor raises
+        ValueError right away, and rows are then read from a dedicated cursor
+        with fetchmany, so only one chunk is held in memory.
+        """
+        query, params, sort_token, sort_column = self._page_query(filters, limit, cursor, offset, fields)
+        
+        rows_cursor = self.db.stream(query, params)
+        
+        def chunks():
+            try:
+                remaining = limit
+                last_row = None
+                while True:
+                    wanted = min(chunk_size, remaining + 1)
+                    rows = rows_cursor.fetchmany(wanted)
+                    
+                    # The extra row only tells us that another page exists
+                    has_more = len(rows) > remaining
+                    done = has_more or len(rows) < wanted
+                    rows = rows[:remaining]
+                    remaining -= len(rows)
+                    if rows:
+                        last_row = rows[-1]
+                    
+                    next_cursor = None
+                    if has_more and limit > 0:
+                        next_cursor = self._next_cursor(sort_token, sort_column, last_row)
+                    
+                    products = [Product.from_dict(data) for data in rows]
+                    if include_reviews:
+                        self._load_reviews_batch(products, review_limit)
+                    
+                    if products or done:
+                        yield products, next_cursor
+                    if done:
+                        return
+            finally:
+                rows_cursor.close()
+        
+        return chunks()
+    
+    def find_facets(self, filters: Dict[str, Any], price_bounds: List[float]) -> Dict[str, Any]:
+        """Count the products matching a filter set, grouped for the filter sidebar.
+        
+        Runs two aggregate queries over the same WHERE clause as find_page:
+        one for the total, price range, flag counts and price buckets
+        (split at price_bounds), and one grouped by category. Results are
+        cached per (catalog version, generated SQL and parameters), so any
+        catalog write invalidates them and equivalent filter sets share an entry.
+        """
+        from_clause, where_parts, params, _ = self._build_filter_query(filters)
+        where = ' AND '.join(where_parts)
+        bounds = sorted(set(float(bound) for bound in price_bounds))
+        
+        cache_key = None
+        if self.facet_cache is not None:
+            catalog_version, _ = self.catalog_version()
+            cache_key = (catalog_version, from_clause, where, tuple(params), tuple(bounds))
+            facets = self.facet_cache.get(cache_key)
+            if facets is not None:
+                return facets
+        
+        # Bucket i holds bounds[i-1] <= price < bounds[i]; the ends are open
+        edges = [None] + bounds + [None]
+        bucket_columns = []
+        bucket_params: List[Any] = []
+        for i in range(len(edges) - 1):
+            low, high = edges[i], edges[i + 1]
+            conditions = []
+            if low is not None:
+                conditions.append("price >= ?")
+                bucket_params.append(low)
+            if high is not None:
+                conditions.append("price < ?")
+                bucket_params.append(high)
+            bucket_columns.append(f"COALESCE(SUM({' AND '.join(conditions) or '1'}), 0) as bucket_{i}")
+        
+        self.db.execute(f"""
+            SELECT COUNT(*) as total, MIN(price) as min_price, MAX(price) as max_price,
+            COALESCE(SUM(is_new), 0) as new_count, COALESCE(SUM(trending), 0) as trending_count,
+            {', '.join(bucket_columns)}
+            FROM {from_clause} WHERE {where}
+        """, tuple(bucket_params + params))
+        totals = self.db.fetchone() or {}
+        
+        self.db.execute(f"""
+            SELECT category, COUNT(*) as count
+            FROM {from_clause} WHERE {where}
+            GROUP BY category
+            ORDER BY count DESC, category
+        """, tuple(params))
+        categories = [
+            {'value': row['category'], 'count': row['count']}
+            for row in self.db.fetchall()
+        ]
+        
+        facets = {
+            'total': totals.get('total', 0),
+            'categories': categories,
+            'price': {
+                'min': totals.get('min_price'),
+                'max': totals.get('max_price'),
+                'buckets': [
+                    {'min': edges[i], 'max': edges[i + 1], 'count': totals.get(f'bucket_{i}', 0)}
+                    for i in range(len(edges) - 1)
+                ]
+            },
+            'flags': {
+                'isNew': totals.get('new_count', 0),
+                'trending': totals.get('trending_count', 0)
+            }
+        }
+        
+        if cache_key is not None:
+            self.facet_cache.set(cache_key, facets)
+        return facets
+    
+    def _build_filter_query(self, filters: Dict[str, Any]) -> Tuple[str, List[str], List[Any], Optional[str]]:
+        """Build the FROM clause, WHERE conditions and parameters for a filter set"""
         query_parts = ["1=1"]  # Base condition that's always true
         params = []
         
@@ -69,115 +408,191 @@ class ProductRepository:
             query_parts.append("trending = ?")
             params.append(1 if filters['trending'] else 0)
         
+        # Full-text search goes through the FTS5 index, joined ahead of the filters
+        search_query = None
         if 'search' in filters and filters['search']:
-            # Add search condition for name and description
-            query_parts.append("(name LIKE ? OR description LIKE ?)")
-            search_term = f"%{filters['search']}%"
-            params.append(search_term)
-            params.append(search_term)
-        
-        # Build the query
-        query = f"SELECT * FROM products WHERE {' AND '.join(query_parts)}"
-        
-        # Add sorting
-        if 'sort' in filters and filters['sort']:
-            sort_field = filters['sort']
-            sort_order = "DESC" if sort_field.startswith("-") else "ASC"
-            sort_field = sort_field.lstrip("-")
-            
-            # Map frontend sort fields to database fields
-            sort_field_map = {
-                "price": "price",
-                "rating": "rating",
-                "createdAt": "created_at",
-                "name": "name"
-            }
-            
-            if sort_field in sort_field_map:
-                query += f" ORDER BY {sort_field_map[sort_field]} {sort_order}"
+            search_query = self._build_search_query(filters['search'])
+        
+        if search_query:
+            from_clause = """products
+                JOIN (
+                    SELECT rowid, bm25(products_fts, 10.0, 1.0, 2.0) as search_rank
+                    FROM products_fts
+                    WHERE products_fts MATCH ?
+                ) AS search ON search.rowid = products.id"""
+            params.insert(0, search_query)
         else:
-            # Default sorting by ID
-            query += " ORDER BY id DESC"
+            from_clause = "products"
         
-        # Add limit and offset
-        query += " LIMIT ? OFFSET ?"
-        params.append(limit)
-        params.append(offset)
+        return from_clause, query_parts, params, search_query
+    
+    @staticmethod
+    def _resolve_sort(sort: Optional[str], search_query: Optional[str]) -> Tuple[str, str, str]:
+        """Map a sort parameter to (sort token, column, direction)"""
+        if sort == "popular":
+            # Most popular first, by the decayed event score
+            return sort, "popularity", "DESC"
         
-        # Execute the query
-        self.db.execute(query, tuple(params))
-        product_data_list = self.db.fetchall()
-        products = [Product.from_dict(data) for data in product_data_list]
+        # Map frontend sort fields to database fields
+        sort_field_map = {
+            "price": "price",
+            "rating": "rating",
+            "createdAt": "created_at",
+            "name": "name"
+        }
         
-        # Load reviews for each product
-        for product in products:
-            self._load_reviews(product)
+        if sort and sort.lstrip("-") in sort_field_map:
+            sort_order = "DESC" if sort.startswith("-") else "ASC"
+            return sort, sort_field_map[sort.lstrip("-")], sort_order
         
-        return products
+        if search_query:
+            # Best BM25 match first (lower scores rank higher)
+            return "relevance", "search.search_rank", "ASC"
+        
+        # Default sorting by ID
+        return "-id", "id", "DESC"
+    
+    @staticmethod
+    def _encode_cursor(sort_token: str, sort_value: Any, last_id: int) -> str:
+        """Encode the position after a row as an opaque URL-safe cursor"""
+        payload = json.dumps([sort_token, sort_value, last_id], separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+    
+    @staticmethod
+    def _decode_cursor(cursor: str, sort_token: str) -> Tuple[Any, int]:
+        """Decode a cursor into (sort value, id), checking it matches the sort"""
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            token, sort_value, last_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        except (ValueError, TypeError, UnicodeError):
+            raise ValueError("Malformed cursor")
+        
+        if token != sort_token or not isinstance(last_id, int):
+            raise ValueError("Cursor does not match the requested sort")
+        
+        return sort_value, last_id
+    
+    @staticmethod
+    def _build_search_query(search: str) -> Optional[str]:
+        """Turn free text into an FTS5 query matching every token as a prefix"""
+        tokens = re.findall(r"\w+", search.lower())
+        if not tokens:
+            return None
+        return ' '.join(f'"{token}"*' for token in tokens)
     
     def _load_reviews(self, product: Product) -> None:
         """Load reviews for a product"""
-        self.db.execute("""
-            SELECT r.*, u.name as user_name 
-            FROM reviews r
-            JOIN users u ON r.user_id = u.id
-            WHERE r.product_id = ?
-        """, (product.id,))
-        
-        reviews = self.db.fetchall()
-        product.load_reviews([{
-            'id': r['id'],
-            'rating': r['rating'],
-            'comment': r['comment'],
-            'user': {
-                'id': r['user_id'],
-                'name': r['user_name']
-            },
-            'createdAt': r['created_at']
-        } for r in reviews])
+        self._load_reviews_batch([product])
     
-    def create(self, product: Product) -> Optional[Product]:
-        """Create a new product"""
-        self.db.execute(
+    def _load_reviews_batch(self, products: List[Product], review_limit: Optional[int] = None) -> None:
+        """Load reviews for a page of products with one query per 500 products.
+        
+        With review_limit set, only the newest review_limit reviews of each
+        product are loaded; review_count comes from the product row.
+        """
+        if not products:
+            return
+        
+        product_ids = [product.id for product in products]
+        reviews_by_product: Dict[int, List[Dict[str, Any]]] = {pid: [] for pid in product_ids}
+        
+        # Chunked to stay under SQLite's bound parameter limit on large pages
+        for start in range(0, len(product_ids), 500):
+            chunk = product_ids[start:start + 500]
+            placeholders = ', '.join('?' for _ in chunk)
+            query = f"""
+                SELECT * FROM (
+                    SELECT r.*, u.name as user_name,
+                    ROW_NUMBER() OVER (PARTITION BY r.product_id ORDER BY r.id DESC) as review_rank
+                    FROM reviews r
+                    JOIN users u ON r.user_id = u.id
+                    WHERE r.product_id IN ({placeholders})
+                )
             """
-            INSERT INTO products 
-            (name, description, price, original_price, discount, stock, category,
-            images, is_new, trending, rating)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-            (
-                product.name,
-                product.description,
-                product.price,
-                product.original_price,
-                product.discount,
-                product.stock,
-                product.category,
-                json.dumps(product.images),
-                1 if product.is_new else 0,
-                1 if product.trending else 0,
-                product.rating
-            )
-        )
+            params = list(chunk)
+            
+            if review_limit is not None:
+                query += " WHERE review_rank <= ?"
+                params.append(review_limit)
+            
+            query += " ORDER BY product_id, id"
+            
+            self.db.execute(query, tuple(params))
+            
+            # Group the rows by product
+            for r in self.db.fetchall():
+                reviews_by_product[r['product_id']].append({
+                    'id': r['id'],
+                    'rating': r['rating'],
+                    'comment': r['comment'],
+                    'user': {
+                        'id': r['user_id'],
+                        'name': r['user_name']
+                    },
+                    'createdAt': r['created_at']
+                })
         
-        # Get the last inserted ID
-        self.db.execute("SELECT last_insert_rowid()")
-        last_id = self.db.fetchone()['last_insert_rowid()']
+        for product in products:
+            product.load_reviews(reviews_by_product[product.id])
+    
+    INSERT_SQL = """
+        INSERT INTO products
+        (sku, name, description, price, original_price, discount, stock, category,
+        images, is_new, trending, rating)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        RETURNING *
+    """
+    
+    # Fields a batch update may change; anything else goes through update()
+    BATCH_UPDATE_FIELDS = ('price', 'stock', 'discount')
+    
+    @staticmethod
+    def _insert_params(product: Product) -> Tuple[Any, ...]:
+        return (
+            product.sku,
+            product.name,
+            product.description,
+            product.price,
+            product.original_price,
+            product.discount,
+            product.stock,
+            product.category,
+            json.dumps(product.images),
+            1 if product.is_new else 0,
+            1 if product.trending else 0,
+            product.rating
+        )
+    
+    def _write_returning(self, query: str, params: Tuple[Any, ...]) -> Optional[Dict[str, Any]]:
+        """Run one write with RETURNING in its own transaction and return the row"""
+        with self.db.transaction():
+            self.db.execute(query, params)
+            return self.db.fetchone()
+    
+    def create(self, product: Product) -> Optional[Product]:
+        """Create a new product; the stored row comes back through RETURNING"""
+        row = self._write_returning(self.INSERT_SQL, self._insert_params(product))
+        if not row:
+            return None
         
-        return self.find_by_id(last_id)
+        # A new product has no reviews yet
+        created = Product.from_dict(row)
+        created.load_reviews([], review_count=0)
+        return created
     
     def update(self, product: Product) -> Optional[Product]:
         """Update an existing product"""
         if not product.id:
             return None
         
-        self.db.execute(
+        row = self._write_returning(
             """
             UPDATE products SET
             name = ?, description = ?, price = ?, original_price = ?,
             discount = ?, stock = ?, category = ?, images = ?,
-            is_new = ?, trending = ?, rating = ?
+            is_new = ?, trending = ?, rating = ?, updated_at = CURRENT_TIMESTAMP
             WHERE id = ?
+            RETURNING *
             """,
             (
                 product.name,
@@ -194,29 +609,151 @@ class ProductRepository:
                 product.id
             )
         )
+        self._invalidate(product.id)
+        if not row:
+            return None
         
-        return self.find_by_id(product.id)
+        # RETURNING reports the row before the version trigger ran; updated_at
+        # is set by the statement itself, version only by the trigger
+        updated = Product.from_dict(row)
+        updated.version += 1
+        self._load_reviews(updated)
+        return updated
     
     def delete(self, product_id: int) -> bool:
-        """Delete a product by ID"""
-        self.db.execute("DELETE FROM products WHERE id = ?", (product_id,))
-        return True
+        """Delete a product by ID, together with its cart and wishlist rows"""
+        with self.db.transaction():
+            self.db.execute("DELETE FROM products WHERE id = ?", (product_id,))
+            deleted = self.db.rowcount > 0
+            self.db.execute("DELETE FROM cart WHERE product_id = ?", (product_id,))
+            self.db.execute("DELETE FROM wishlist WHERE product_id = ?", (product_id,))
+        self._invalidate(product_id)
+        return deleted
+    
+    def apply_batch(self, creates: List[Product], updates: List[Dict[str, Any]],
+                    deletes: List[int], purge: bool = True) -> Dict[str, List[Dict[str, Any]]]:
+        """Apply many creates, partial updates and deletes in one transaction.
+        
+        updates are dicts with an id and any of BATCH_UPDATE_FIELDS. Every
+        row gets a status without re-reading products: creates report the
+        id from RETURNING, and updates and deletes are matched against one
+        lookup of the current rows before executemany writes the rest.
+        Updates that would not change anything are skipped, so they keep
+        their version. A row that fails (e.g. a duplicate SKU) is reported
+        as an error without affecting the others. With purge=False the cart
+        and wishlist rows of deleted products are left for purge_references();
+        the joins that read carts and wishlists skip them meanwhile.
+        """
+        results: Dict[str, List[Dict[str, Any]]] = {'created': [], 'updated': [], 'deleted': []}
+        
+        with self.db.transaction(immediate=True):
+            for index, product in enumerate(creates):
+                try:
+                    self.db.execute(self.INSERT_SQL, self._insert_params(product))
+                    row = self.db.fetchone()
+                    results['created'].append({
+                        'index': index, 'status': 'created', 'id': row['id'], 'version': row['version']
+                    })
+                except sqlite3.IntegrityError as e:
+                    results['created'].append({'index': index, 'status': 'error', 'message': str(e)})
+            
+            # One lookup covers every product an update or delete refers to
+            referenced = list({item['id'] for item in updates} | set(deletes))
+            current: Dict[int, Dict[str, Any]] = {}
+            for start in range(0, len(referenced), 500):
+                ids = referenced[start:start + 500]
+                placeholders = ', '.join('?' for _ in ids)
+                self.db.execute(
+                    f"SELECT id, version, price, stock, discount FROM products WHERE id IN ({placeholders})",
+                    ids
+                )
+                current.update({row['id']: row for row in self.db.fetchall()})
+            
+            update_rows = []
+            for index, item in enumerate(updates):
+                row = current.get(item['id'])
+                if row is None:
+                    results['updated'].append({'index': index, 'id': item['id'], 'status': 'not_found'})
+                    continue
+                
+                values = {field: item.get(field, row[field]) for field in self.BATCH_UPDATE_FIELDS}
+                if all(values[field] == row[field] for field in self.BATCH_UPDATE_FIELDS):
+                    results['updated'].append({
+                        'index': index, 'id': item['id'], 'status': 'unchanged', 'version': row['version']
+                    })
+                    continue
+                
+                # Later updates of the same product build on earlier ones
+                row.update(values)
+                row['version'] += 1
+                update_rows.append((values['price'], values['stock'], values['discount'], item['id']))
+                results['updated'].append({
+                    'index': index, 'id': item['id'], 'status': 'updated', 'version': row['version']
+                })
+            
+            self.db.executemany(
+                "UPDATE products SET price = ?, stock = ?, discount = ? WHERE id = ?",
+                update_rows
+            )
+            
+            delete_ids = []
+            for index, product_id in enumerate(deletes):
+                if product_id in current and product_id not in delete_ids:
+                    delete_ids.append(product_id)
+                    results['deleted'].append({'index': index, 'id': product_id, 'status': 'deleted'})
+                else:
+                    results['deleted'].append({'index': index, 'id': product_id, 'status': 'not_found'})
+            
+            delete_params = [(product_id,) for product_id in delete_ids]
+            self.db.executemany("DELETE FROM products WHERE id = ?", delete_params)
+            if purge:
+                self.purge_references(delete_ids)
+        
+        for row in update_rows:
+            self._invalidate(row[-1])
+        for product_id in delete_ids:
+            self._invalidate(product_id)
+        
+        return results
+    
+    def purge_references(self, product_ids: Sequence[int]) -> None:
+        """Delete the cart and wishlist rows of deleted products.
+        
+        Product ids are never reused (AUTOINCREMENT), so this can run any
+        time after the delete.
+        """
+        params = [(product_id,) for product_id in product_ids]
+        with self.db.transaction():
+            self.db.executemany("DELETE FROM cart WHERE product_id = ?", params)
+            self.db.executemany("DELETE FROM wishlist WHERE product_id = ?", params)
     
     def add_review(self, product_id: int, user_id: int, rating: int, comment: str) -> bool:
-        """Add a review to a product"""
-        self.db.execute(
-            "INSERT INTO reviews (product_id, user_id, rating, comment) VALUES (?, ?, ?, ?)",
-            (product_id, user_id, rating, comment)
-        )
+        """Add a review to a product.
         
-        # Update the average rating for the product
-        self.db.execute(
-            """
-            UPDATE products SET
-            rating = (SELECT AVG(rating) FROM reviews WHERE product_id = ?)
-            WHERE id = ?
-            """,
-            (product_id, product_id)
-        )
+        The review count, rating sum, star histogram and average are moved
+        by this one review in the same transaction as the insert, instead of
+        re-aggregating every review of the product.
+        """
+        with self.db.transaction(immediate=True):
+            self.db.execute(
+                "INSERT INTO reviews (product_id, user_id, rating, comment) VALUES (?, ?, ?, ?)",
+                (product_id, user_id, rating, comment)
+            )
+            self.db.execute(
+                """
+                UPDATE products SET
+                review_count = review_count + 1,
+                rating_sum = rating_sum + ?,
+                rating_1 = rating_1 + (? = 1),
+                rating_2 = rating_2 + (? = 2),
+                rating_3 = rating_3 + (? = 3),
+                rating_4 = rating_4 + (? = 4),
+                rating_5 = rating_5 + (? = 5),
+                rating = CAST(rating_sum + ? AS REAL) / (review_count + 1)
+                WHERE id = ?
+                """,
+                (rating, rating, rating, rating, rating, rating, rating, product_id)
+            )
         
-        return True 
\ No newline at end of file
+        self._invalidate(product_id)
+        return True
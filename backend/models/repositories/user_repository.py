@@ -1,10 +1,14 @@
 from typing import Optional, List
+import sqlite3
 from database.db import Database
 from models.user import User
+from utils.passwords import PasswordHasher
 
 class UserRepository:
-    def __init__(self, db: Database):
+    def __init__(self, db: Database, password_hasher: Optional[PasswordHasher] = None):
         self.db = db
+        # Without a hasher, bcrypt runs inline on the calling thread
+        self.password_hasher = password_hasher
     
     def find_by_id(self, user_id: int) -> Optional[User]:
         """Find a user by ID"""
@@ -14,6 +18,17 @@ class UserRepository:
             return User.from_dict(user_data)
         return None
     
+    def find_token_revision(self, user_id: int) -> Optional[int]:
+        """Return a user's token revision, or None if the user is gone.
+        
+        Always read from the row: other processes write to the same database.
+        """
+        self.db.execute("SELECT token_revision FROM users WHERE id = ?", (user_id,))
+        row = self.db.fetchone()
+        if row:
+            return row['token_revision']
+        return None
+    
     def find_by_email(self, email: str) -> Optional[User]:
         """Find a user by email"""
         self.db.execute("SELECT * FROM users WHERE email = ?", (email,))
@@ -25,18 +40,21 @@ class UserRepository:
     def create(self, user: User) -> Optional[User]:
         """Create a new user"""
         # Hash the password before storing
-        hashed_password = User.hash_password(user.password)
-        
-        self.db.execute(
-            "INSERT INTO users (name, email, password) VALUES (?, ?, ?)",
-            (user.name, user.email, hashed_password)
-        )
+        hashed_password = self._hash(user.password)
         
-        # Get the last inserted ID
-        self.db.execute("SELECT last_insert_rowid()")
-        last_id = self.db.fetchone()['last_insert_rowid()']
+        # The stored row comes back from the insert itself
+        try:
+            with self.db.transaction():
+                self.db.execute(
+                    "INSERT INTO users (name, email, password) VALUES (?, ?, ?) RETURNING *",
+                    (user.name, user.email, hashed_password)
+                )
+                user_data = self.db.fetchone()
+        except sqlite3.IntegrityError:
+            # The email was taken between the caller's check and the insert
+            return None
         
-        return self.find_by_id(last_id)
+        return User.from_dict(user_data) if user_data else None
     
     def update(self, user: User) -> Optional[User]:
         """Update an existing user"""
@@ -56,13 +74,16 @@ class UserRepository:
         
         if user.password:
             # Hash the new password before storing
-            hashed_password = User.hash_password(user.password)
+            hashed_password = self._hash(user.password)
             fields_to_update.append("password = ?")
             params.append(hashed_password)
         
         if not fields_to_update:
             return self.find_by_id(user.id)
         
+        # Retire cached tokens of the user in every process
+        fields_to_update.append("token_revision = token_revision + 1")
+        
         # Add the user ID to the params
         params.append(user.id)
         
@@ -73,7 +94,20 @@ class UserRepository:
         
         return self.find_by_id(user.id)
     
+    def set_password_hash(self, user_id: int, hashed_password: str) -> bool:
+        """Store an already hashed password, e.g. after a cost upgrade"""
+        self.db.execute(
+            "UPDATE users SET password = ?, token_revision = token_revision + 1 WHERE id = ?",
+            (hashed_password, user_id)
+        )
+        return True
+    
     def delete(self, user_id: int) -> bool:
         """Delete a user by ID"""
         self.db.execute("DELETE FROM users WHERE id = ?", (user_id,))
-        return True 
\ No newline at end of file
+        return True
+    
+    def _hash(self, password: str) -> str:
+        if self.password_hasher is not None:
+            return self.password_hasher.hash(password)
+        return User.hash_password(password)
\ No newline at end of file
@@ -0,0 +1,85 @@
+from typing import List, Set, Tuple
+from database.db import Database
+from models.product import Product
+
+class WishlistRepository:
+    def __init__(self, db: Database):
+        self.db = db
+    
+    def find_products(self, user_id: int, limit: int = 100, offset: int = 0) -> List[Product]:
+        """Find the products on a user's wishlist, most recently added first"""
+        self.db.execute("""
+            SELECT p.*
+            FROM wishlist w
+            JOIN products p ON w.product_id = p.id
+            WHERE w.user_id = ?
+            ORDER BY w.id DESC
+            LIMIT ? OFFSET ?
+        """, (user_id, limit, offset))
+        
+        products = [Product.from_dict(data) for data in self.db.fetchall()]
+        for product in products:
+            product.in_wishlist = True
+        return products
+    
+    def contains(self, user_id: int, product_ids: List[int]) -> Set[int]:
+        """Return which of the given products are on a user's wishlist"""
+        if not product_ids:
+            return set()
+        
+        # Chunked to stay under SQLite's bound parameter limit on large pages
+        found: Set[int] = set()
+        for start in range(0, len(product_ids), 500):
+            chunk = product_ids[start:start + 500]
+            placeholders = ', '.join('?' for _ in chunk)
+            self.db.execute(
+                f"SELECT product_id FROM wishlist WHERE user_id = ? AND product_id IN ({placeholders})",
+                (user_id, *chunk)
+            )
+            found.update(row['product_id'] for row in self.db.fetchall())
+        return found
+    
+    def version(self, user_id: int) -> Tuple[int, int]:
+        """Cheap fingerprint of a user's wishlist that changes on every add or remove"""
+        self.db.execute(
+            "SELECT COUNT(*) as count, COALESCE(MAX(id), 0) as last_id FROM wishlist WHERE user_id = ?",
+            (user_id,)
+        )
+        row = self.db.fetchone()
+        return (row['count'], row['last_id']) if row else (0, 0)
+    
+    def add_many(self, user_id: int, product_ids: List[int]) -> Tuple[List[int], List[int]]:
+        """Add products to a wishlist; returns (added or already present, not found)"""
+        product_ids = list(dict.fromkeys(product_ids))
+        if not product_ids:
+            return [], []
+        
+        placeholders = ', '.join('?' for _ in product_ids)
+        # The existence check and the insert see the same products
+        with self.db.transaction(immediate=True):
+            self.db.execute(
+                f"SELECT id FROM products WHERE id IN ({placeholders})",
+                tuple(product_ids)
+            )
+            existing = {row['id'] for row in self.db.fetchall()}
+            
+            found = [product_id for product_id in product_ids if product_id in existing]
+            missing = [product_id for product_id in product_ids if product_id not in existing]
+            
+            if found:
+                self.db.executemany(
+                    "INSERT OR IGNORE INTO wishlist (user_id, product_id) VALUES (?, ?)",
+                    [(user_id, product_id) for product_id in found]
+                )
+        
+        return found, missing
+    
+    def remove_many(self, user_id: int, product_ids: List[int]) -> bool:
+        """Remove products from a wishlist"""
+        if not product_ids:
+            return True
+        
+        return self.db.executemany(
+            "DELETE FROM wishlist WHERE user_id = ? AND product_id = ?",
+            [(user_id, product_id) for product_id in dict.fromkeys(product_ids)]
+        )
@@ -5,12 +5,14 @@ from typing import Optional, Dict, Any, List
 
 class User:
     def __init__(self, id: Optional[int] = None, name: str = "", email: str = "", 
-                 password: str = "", created_at: Optional[str] = None):
+                 password: str = "", created_at: Optional[str] = None, token_revision: int = 0):
         self.id = id
         self.name = name
         self.email = email
         self.password = password
         self.created_at = created_at
+        # Bumped on every update; retires the user's cached tokens
+        self.token_revision = token_revision
     
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> 'User':
@@ -20,7 +22,8 @@ class User:
             name=data.get('name', ''),
             email=data.get('email', ''),
             password=data.get('password', ''),
-            created_at=data.get('created_at')
+            created_at=data.get('created_at'),
+            token_revision=data.get('token_revision') or 0
         )
     
     def to_dict(self, include_password: bool = False) -> Dict[str, Any]:
@@ -38,10 +41,10 @@ class User:
         return user_dict
     
     @staticmethod
-    def hash_password(password: str) -> str:
+    def hash_password(password: str, rounds: int = 12) -> str:
         """Hash a password for storage"""
         password_bytes = password.encode('utf-8')
-        salt = bcrypt.gensalt()
+        salt = bcrypt.gensalt(rounds)
         hashed = bcrypt.hashpw(password_bytes, salt)
         return hashed.decode('utf-8')
     
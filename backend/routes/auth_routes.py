@@ -1,10 +1,15 @@
 from flask import Blueprint, request, jsonify, current_app
 from models.user import User
 from models.repositories.user_repository import UserRepository
-from utils.auth import token_required, get_token_from_request
+from utils.auth import token_required, get_token_from_request, resolve_token
+from utils.passwords import PasswordPoolBusy
 
 auth_bp = Blueprint('auth', __name__)
 
+def server_busy():
+    """Fail fast while the password workers are saturated"""
+    return jsonify({'message': 'Server is busy, please try again shortly'}), 503, {'Retry-After': '1'}
+
 @auth_bp.route('/register', methods=['POST'])
 def register():
     data = request.json
@@ -14,7 +19,7 @@ def register():
         return jsonify({'message': 'Missing required fields'}), 400
     
     # Check if user already exists
-    user_repo = UserRepository(current_app.db)
+    user_repo = UserRepository(current_app.db, current_app.password_hasher)
     existing_user = user_repo.find_by_email(data['email'])
     
     if existing_user:
@@ -27,7 +32,10 @@ def register():
         password=data['password']
     )
     
-    created_user = user_repo.create(new_user)
+    try:
+        created_user = user_repo.create(new_user)
+    except PasswordPoolBusy:
+        return server_busy()
     
     if not created_user:
         return jsonify({'message': 'Failed to create user'}), 500
@@ -50,15 +58,23 @@ def login():
         return jsonify({'message': 'Missing email or password'}), 400
     
     # Find user by email
-    user_repo = UserRepository(current_app.db)
+    password_hasher = current_app.password_hasher
+    user_repo = UserRepository(current_app.db, password_hasher)
     user = user_repo.find_by_email(data['email'])
     
     if not user:
         return jsonify({'message': 'Invalid email or password'}), 401
     
-    # Check password
-    if not User.check_password(data['password'], user.password):
-        return jsonify({'message': 'Invalid email or password'}), 401
+    try:
+        # Check password
+        if not password_hasher.check(data['password'], user.password):
+            return jsonify({'message': 'Invalid email or password'}), 401
+        
+        # Re-hash transparently when the configured bcrypt cost changed
+        if password_hasher.needs_rehash(user.password):
+            user_repo.set_password_hash(user.id, password_hasher.hash(data['password']))
+    except PasswordPoolBusy:
+        return server_busy()
     
     # Generate token
     token = User.generate_token(user.id, current_app.config['SECRET_KEY'])
@@ -84,15 +100,11 @@ def check_auth():
         return jsonify({'authenticated': False}), 200
     
     try:
-        # Verify the token
-        payload = User.verify_token(token, current_app.config['SECRET_KEY'])
+        # Verify the token and get the user, through the token cache
+        payload, user = resolve_token(token)
         if not payload:
             return jsonify({'authenticated': False}), 200
         
-        # Get the user from the database
-        user_repo = UserRepository(current_app.db)
-        user = user_repo.find_by_id(payload['user_id'])
-        
         if not user:
             return jsonify({'authenticated': False}), 200
         
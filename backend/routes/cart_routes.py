@@ -1,5 +1,6 @@
 from flask import Blueprint, request, jsonify, current_app
 from models.repositories.product_repository import ProductRepository
+from models.repositories.cart_repository import CartRepository
 from utils.auth import token_required
 
 cart_bp = Blueprint('cart', __name__)
@@ -8,61 +9,46 @@ cart_bp = Blueprint('cart', __name__)
 @token_required
 def get_cart(current_user):
     """Get the current user's cart"""
-    db = current_app.db
+    cart_repo = CartRepository(current_app.db)
+    return jsonify(cart_repo.get_cart(current_user.id)), 200
+
+@cart_bp.route('', methods=['PATCH'])
+@token_required
+def sync_cart(current_user):
+    """Apply many cart upserts and removals at once"""
+    data = request.json or {}
+    
+    mode = data.get('mode', 'set')
+    if mode not in ('set', 'add', 'max'):
+        return jsonify({'message': "Mode must be one of 'set', 'add' or 'max'"}), 400
+    
+    try:
+        upserts = [
+            (int(item['product_id']), int(item['quantity']))
+            for item in data.get('upsert', [])
+        ]
+        removals = [int(product_id) for product_id in data.get('remove', [])]
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'message': 'Each upsert needs a product_id and quantity'}), 400
     
-    # Get cart items for the current user
-    db.execute("""
-        SELECT c.*, p.name, p.price, p.original_price, p.discount, p.stock, p.images,
-        p.is_new, p.trending, p.rating
-        FROM cart c
-        JOIN products p ON c.product_id = p.id
-        WHERE c.user_id = ?
-    """, (current_user.id,))
-    
-    cart_items = db.fetchall()
-    
-    # Process cart items
-    items = []
-    total = 0
-    
-    for item in cart_items:
-        # Parse product images
-        images = item['images']
-        if isinstance(images, str):
-            try:
-                import json
-                images = json.loads(images)
-            except json.JSONDecodeError:
-                images = []
-        
-        product = {
-            'id': item['product_id'],
-            'name': item['name'],
-            'price': item['price'],
-            'originalPrice': item['original_price'],
-            'discount': item['discount'],
-            'stock': item['stock'],
-            'images': images,
-            'isNew': bool(item['is_new']),
-            'trending': bool(item['trending']),
-            'rating': item['rating']
-        }
-        
-        cart_item = {
-            'id': item['id'],
-            'product': product,
-            'quantity': item['quantity'],
-            'subtotal': item['price'] * item['quantity']
-        }
-        
-        items.append(cart_item)
-        total += cart_item['subtotal']
+    # Validate quantity
+    if any(quantity <= 0 for _, quantity in upserts):
+        return jsonify({'message': 'Quantity must be greater than 0'}), 400
     
-    return jsonify({
-        'items': items,
-        'total': total,
-        'count': len(items)
-    }), 200
+    cart_repo = CartRepository(current_app.db)
+    errors, adjustments, skipped = cart_repo.apply_changes(
+        current_user.id, upserts, removals,
+        mode=mode,
+        clamp_to_stock=bool(data.get('clamp_to_stock', False))
+    )
+    
+    if errors:
+        return jsonify({'message': 'Cart was not updated', 'errors': errors}), 400
+    
+    cart = cart_repo.get_cart(current_user.id)
+    cart['adjustments'] = adjustments
+    cart['skipped'] = skipped
+    return jsonify(cart), 200
 
 @cart_bp.route('', methods=['POST'])
 @token_required
@@ -93,34 +79,36 @@ def add_to_cart(current_user):
     
     db = current_app.db
     
-    # Check if product is already in cart
-    db.execute(
-        "SELECT * FROM cart WHERE user_id = ? AND product_id = ?",
-        (current_user.id, product_id)
-    )
-    
-    existing_item = db.fetchone()
-    
-    if existing_item:
-        # Update quantity
-        new_quantity = existing_item['quantity'] + quantity
-        
-        if new_quantity > product.stock:
-            return jsonify({'message': 'Insufficient stock'}), 400
-        
+    # Read the existing line and write the new quantity under one write lock,
+    # so concurrent adds of the same product cannot both insert
+    with db.transaction(immediate=True):
         db.execute(
-            "UPDATE cart SET quantity = ? WHERE id = ?",
-            (new_quantity, existing_item['id'])
-        )
-    else:
-        # Add new item to cart
-        db.execute(
-            "INSERT INTO cart (user_id, product_id, quantity) VALUES (?, ?, ?)",
-            (current_user.id, product_id, quantity)
+            "SELECT * FROM cart WHERE user_id = ? AND product_id = ?",
+            (current_user.id, product_id)
         )
+        
+        existing_item = db.fetchone()
+        
+        if existing_item:
+            # Update quantity
+            new_quantity = existing_item['quantity'] + quantity
+            
+            if new_quantity > product.stock:
+                return jsonify({'message': 'Insufficient stock'}), 400
+            
+            db.execute(
+                "UPDATE cart SET quantity = ? WHERE id = ?",
+                (new_quantity, existing_item['id'])
+            )
+        else:
+            # Add new item to cart
+            db.execute(
+                "INSERT INTO cart (user_id, product_id, quantity) VALUES (?, ?, ?)",
+                (current_user.id, product_id, quantity)
+            )
     
     # Return updated cart
-    return get_cart(current_user)
+    return jsonify(CartRepository(db).get_cart(current_user.id)), 200
 
 @cart_bp.route('/<int:item_id>', methods=['PUT'])
 @token_required
@@ -140,29 +128,30 @@ def update_cart_item(current_user, item_id):
     
     db = current_app.db
     
-    # Check if cart item exists and belongs to the current user
-    db.execute(
-        "SELECT c.*, p.stock FROM cart c JOIN products p ON c.product_id = p.id WHERE c.id = ? AND c.user_id = ?",
-        (item_id, current_user.id)
-    )
-    
-    cart_item = db.fetchone()
-    
-    if not cart_item:
-        return jsonify({'message': 'Cart item not found'}), 404
-    
-    # Check if quantity is within stock limits
-    if quantity > cart_item['stock']:
-        return jsonify({'message': 'Insufficient stock'}), 400
-    
-    # Update quantity
-    db.execute(
-        "UPDATE cart SET quantity = ? WHERE id = ?",
-        (quantity, item_id)
-    )
+    with db.transaction(immediate=True):
+        # Check if cart item exists and belongs to the current user
+        db.execute(
+            "SELECT c.*, p.stock FROM cart c JOIN products p ON c.product_id = p.id WHERE c.id = ? AND c.user_id = ?",
+            (item_id, current_user.id)
+        )
+        
+        cart_item = db.fetchone()
+        
+        if not cart_item:
+            return jsonify({'message': 'Cart item not found'}), 404
+        
+        # Check if quantity is within stock limits
+        if quantity > cart_item['stock']:
+            return jsonify({'message': 'Insufficient stock'}), 400
+        
+        # Update quantity
+        db.execute(
+            "UPDATE cart SET quantity = ? WHERE id = ?",
+            (quantity, item_id)
+        )
     
     # Return updated cart
-    return get_cart(current_user)
+    return jsonify(CartRepository(db).get_cart(current_user.id)), 200
 
 @cart_bp.route('/<int:item_id>', methods=['DELETE'])
 @token_required
@@ -170,22 +159,14 @@ def remove_from_cart(current_user, item_id):
     """Remove a product from the cart"""
     db = current_app.db
     
-    # Check if cart item exists and belongs to the current user
-    db.execute(
-        "SELECT * FROM cart WHERE id = ? AND user_id = ?",
-        (item_id, current_user.id)
-    )
+    # Only the current user's items match, so one statement checks and deletes
+    db.execute("DELETE FROM cart WHERE id = ? AND user_id = ?", (item_id, current_user.id))
     
-    cart_item = db.fetchone()
-    
-    if not cart_item:
+    if db.rowcount == 0:
         return jsonify({'message': 'Cart item not found'}), 404
     
-    # Delete cart item
-    db.execute("DELETE FROM cart WHERE id = ?", (item_id,))
-    
     # Return updated cart
-    return get_cart(current_user)
+    return jsonify(CartRepository(db).get_cart(current_user.id)), 200
 
 @cart_bp.route('', methods=['DELETE'])
 @token_required
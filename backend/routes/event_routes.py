@@ -0,0 +1,36 @@
+from flask import Blueprint, request, jsonify, current_app
+
+event_bp = Blueprint('events', __name__)
+
+@event_bp.route('', methods=['POST'])
+def record_events():
+    """Record a batch of product events (view, add_to_cart, purchase)"""
+    tracker = current_app.popularity
+    if tracker is None:
+        return jsonify({'message': 'Event tracking is disabled'}), 404
+    
+    events = (request.get_json(silent=True) or {}).get('events')
+    if not isinstance(events, list):
+        return jsonify({'message': 'events must be a list'}), 400
+    if len(events) > current_app.config['EVENT_BATCH_MAX']:
+        return jsonify({'message': f"At most {current_app.config['EVENT_BATCH_MAX']} events per batch"}), 413
+    
+    # Reject the whole batch on malformed events, before anything is counted
+    parsed, errors = [], []
+    for index, event in enumerate(events):
+        try:
+            if not isinstance(event, dict) or event.get('type') not in tracker.weights:
+                raise ValueError(f"type must be one of {', '.join(tracker.weights)}")
+            product_id = event.get('product_id')
+            if isinstance(product_id, bool) or not isinstance(product_id, int) or product_id <= 0:
+                raise ValueError('product_id must be a positive integer')
+        except ValueError as e:
+            errors.append({'index': index, 'message': str(e)})
+            continue
+        parsed.append((product_id, event['type']))
+    
+    if errors:
+        return jsonify({'message': 'Events were not recorded', 'errors': errors}), 400
+    
+    # Counted in memory only; scores reach the database with the next flush
+    return jsonify({'accepted': tracker.record(parsed)}), 202
@@ -0,0 +1,57 @@
+import sqlite3
+from flask import Blueprint, request, jsonify, current_app
+from models.repositories.order_repository import OrderRepository, OutOfStockError
+from utils.auth import token_required
+
+order_bp = Blueprint('orders', __name__)
+
+@order_bp.route('', methods=['POST'])
+@token_required
+def create_order(current_user):
+    """Check out the current user's cart"""
+    order_repo = OrderRepository(current_app.db)
+    
+    try:
+        order = order_repo.create_from_cart(current_user.id)
+    except OutOfStockError as e:
+        return jsonify({'message': str(e), 'product_id': e.product_id}), 409
+    except sqlite3.OperationalError:
+        # The write lock could not be taken within the busy timeout
+        return jsonify({'message': 'Checkout is busy, please try again'}), 503, {'Retry-After': '1'}
+    
+    if not order:
+        return jsonify({'message': 'Cart is empty'}), 400
+    
+    return jsonify({
+        'message': 'Order placed successfully',
+        'order': order
+    }), 201
+
+@order_bp.route('', methods=['GET'])
+@token_required
+def get_orders(current_user):
+    """Get the current user's orders"""
+    limit = int(request.args.get('limit', 50))
+    offset = int(request.args.get('offset', 0))
+    
+    order_repo = OrderRepository(current_app.db)
+    orders = order_repo.find_by_user(current_user.id, limit, offset)
+    
+    return jsonify({
+        'orders': orders,
+        'count': len(orders)
+    }), 200
+
+@order_bp.route('/<int:order_id>', methods=['GET'])
+@token_required
+def get_order(current_user, order_id):
+    """Get one of the current user's orders"""
+    order_repo = OrderRepository(current_app.db)
+    order = order_repo.find_by_id(order_id, current_user.id)
+    
+    if not order:
+        return jsonify({'message': 'Order not found'}), 404
+    
+    return jsonify({
+        'order': order
+    }), 200
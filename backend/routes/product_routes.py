@@ -1,15 +1,18 @@
-from flask import Blueprint, request, jsonify, current_app
+import sqlite3
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context
 from models.product import Product
 from models.repositories.product_repository import ProductRepository
-from utils.auth import token_required
+from models.repositories.wishlist_repository import WishlistRepository
+from utils.auth import token_required, get_optional_user, admin_required
+from utils.http_cache import (
+    make_etag, normalized_args, parse_timestamp, is_not_modified, set_cache_headers, not_modified
+)
+from utils.compression import precompressed
 
 product_bp = Blueprint('products', __name__)
 
-@product_bp.route('', methods=['GET'])
-def get_products():
-    """Get all products with optional filtering"""
-    product_repo = ProductRepository(current_app.db)
-    
+def _filters_from_request():
+    """Build the product filter set from the query string"""
     # Extract query parameters
     category = request.args.get('category')
     search = request.args.get('search')
@@ -18,8 +21,6 @@ def get_products():
     sort = request.args.get('sort')
     is_new = request.args.get('is_new')
     trending = request.args.get('trending')
-    limit = int(request.args.get('limit', 100))
-    offset = int(request.args.get('offset', 0))
     
     # Convert string values to appropriate types
     if min_price:
@@ -53,26 +54,279 @@ def get_products():
         filters['trending'] = True
         filters.pop('category', None)
     
-    products = product_repo.find_by_filters(filters, limit, offset)
+    return filters
+
+def _product_from_json(data):
+    """Build a Product from an API (camelCase) payload; raises ValueError if invalid"""
+    if not isinstance(data, dict) or not data.get('name') or data.get('price') is None:
+        raise ValueError('name and price are required')
     
-    return jsonify({
-        'products': [product.to_dict() for product in products],
+    images = data.get('images', [])
+    if not isinstance(images, list):
+        raise ValueError('images must be a list')
+    
+    return Product(
+        sku=data.get('sku'),
+        name=data['name'],
+        description=data.get('description', ''),
+        price=float(data['price']),
+        original_price=float(data['originalPrice']) if data.get('originalPrice') is not None else None,
+        discount=int(data.get('discount', 0)),
+        stock=int(data.get('stock', 0)),
+        category=data.get('category', ''),
+        images=images,
+        is_new=bool(data.get('isNew', False)),
+        trending=bool(data.get('trending', False)),
+        rating=float(data.get('rating', 0.0))
+    )
+
+def _batch_update_from_json(data):
+    """Validate a partial update: an id plus any of price, stock and discount"""
+    if not isinstance(data, dict) or 'id' not in data:
+        raise ValueError('id is required')
+    
+    update = {'id': int(data['id'])}
+    if data.get('price') is not None:
+        update['price'] = float(data['price'])
+    if data.get('stock') is not None:
+        update['stock'] = int(data['stock'])
+    if data.get('discount') is not None:
+        update['discount'] = int(data['discount'])
+    
+    if len(update) == 1:
+        raise ValueError('one of price, stock or discount is required')
+    if update.get('price', 0) < 0 or update.get('stock', 0) < 0:
+        raise ValueError('price and stock cannot be negative')
+    return update
+
+@product_bp.route('', methods=['GET'])
+def get_products():
+    """Get all products with optional filtering"""
+    product_repo = ProductRepository(current_app.db)
+    wishlist_repo = WishlistRepository(current_app.db)
+    current_user = get_optional_user()
+    cache_control = current_app.config['PRODUCT_LIST_CACHE_CONTROL']
+    
+    # Any catalog write bumps the catalog version, so it validates every listing
+    catalog_version, catalog_updated_at = product_repo.catalog_version()
+    validators = ['catalog', catalog_version, normalized_args()]
+    last_modified = parse_timestamp(catalog_updated_at)
+    if request.args.get('sort') == 'popular':
+        # Score flushes reorder the listing without a catalog write
+        validators += ['popularity', product_repo.popularity_version()]
+        last_modified = None
+    if current_user:
+        # inWishlist makes the listing personal: validate on the wishlist too
+        validators += ['user', current_user.id, wishlist_repo.version(current_user.id)]
+        last_modified = None
+        cache_control = current_app.config['PRIVATE_CACHE_CONTROL']
+    etag = make_etag(*validators)
+    if is_not_modified(etag, last_modified):
+        return not_modified(etag, last_modified, cache_control, vary='Authorization')
+    cached = precompressed(etag, last_modified, cache_control, vary='Authorization')
+    if cached is not None:
+        return cached
+    
+    # Extract query parameters
+    filters = _filters_from_request()
+    limit = int(request.args.get('limit', 100))
+    offset = int(request.args.get('offset', 0))
+    cursor = request.args.get('cursor')
+    include_reviews = request.args.get('include_reviews', 'true').lower() == 'true'
+    review_limit = int(request.args.get('review_limit', current_app.config['REVIEW_PREVIEW_LIMIT']))
+    try:
+        fields = Product.parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({'message': f'Invalid fields: {str(e)}'}), 400
+    if fields is not None:
+        include_reviews = include_reviews and 'reviews' in fields
+        if 'inWishlist' not in fields:
+            current_user = None
+    
+    stream = request.args.get('stream')
+    if stream is None:
+        stream = limit >= current_app.config['PRODUCT_STREAM_MIN_LIMIT']
+    else:
+        stream = stream.lower() == 'true'
+    
+    if stream:
+        try:
+            chunks = product_repo.stream_page(
+                filters, limit,
+                cursor=cursor,
+                offset=offset,
+                include_reviews=include_reviews,
+                review_limit=review_limit,
+                fields=fields,
+                chunk_size=current_app.config['PRODUCT_STREAM_CHUNK_SIZE']
+            )
+        except ValueError as e:
+            return jsonify({'message': f'Invalid cursor: {str(e)}'}), 400
+        
+        response = Response(
+            stream_with_context(_stream_listing(chunks, filters, fields, wishlist_repo, current_user)),
+            mimetype='application/json'
+        )
+        return set_cache_headers(response, etag, last_modified, cache_control, vary='Authorization'), 200
+    
+    # A cursor (keyset pagination) takes precedence over offset
+    try:
+        products, next_cursor = product_repo.find_page(
+            filters, limit,
+            cursor=cursor,
+            offset=offset,
+            include_reviews=include_reviews,
+            review_limit=review_limit,
+            fields=fields
+        )
+    except ValueError as e:
+        return jsonify({'message': f'Invalid cursor: {str(e)}'}), 400
+    
+    # One membership query for the whole page
+    if current_user:
+        wishlisted = wishlist_repo.contains(current_user.id, [product.id for product in products])
+        for product in products:
+            product.in_wishlist = product.id in wishlisted
+    
+    response = jsonify({
+        'products': [product.to_dict(fields) for product in products],
         'count': len(products),
+        'filters': filters,
+        'next_cursor': next_cursor
+    })
+    return set_cache_headers(response, etag, last_modified, cache_control, vary='Authorization'), 200
+
+def _stream_listing(chunks, filters, fields, wishlist_repo, current_user):
+    """Yield a product listing as JSON text, one chunk of products at a time"""
+    def dumps(value):
+        return current_app.json.dumps(value, separators=(',', ':'))
+    
+    yield '{"filters":' + dumps(filters) + ',"products":['
+    
+    count = 0
+    next_cursor = None
+    for products, chunk_cursor in chunks:
+        if current_user:
+            wishlisted = wishlist_repo.contains(current_user.id, [product.id for product in products])
+            for product in products:
+                product.in_wishlist = product.id in wishlisted
+        
+        if products:
+            yield (',' if count else '') + ','.join(dumps(product.to_dict(fields)) for product in products)
+        count += len(products)
+        next_cursor = chunk_cursor
+    
+    yield '],"count":' + dumps(count) + ',"next_cursor":' + dumps(next_cursor) + '}\n'
+
+@product_bp.route('/facets', methods=['GET'])
+def get_product_facets():
+    """Get the total hit count and facet counts for a filter set"""
+    product_repo = ProductRepository(current_app.db)
+    cache_control = current_app.config['PRODUCT_LIST_CACHE_CONTROL']
+    
+    catalog_version, catalog_updated_at = product_repo.catalog_version()
+    etag = make_etag('facets', catalog_version, normalized_args())
+    last_modified = parse_timestamp(catalog_updated_at)
+    if is_not_modified(etag, last_modified):
+        return not_modified(etag, last_modified, cache_control)
+    cached = precompressed(etag, last_modified, cache_control)
+    if cached is not None:
+        return cached
+    
+    filters = _filters_from_request()
+    filters.pop('sort', None)
+    facets = product_repo.find_facets(filters, current_app.config['FACET_PRICE_BOUNDS'])
+    
+    response = jsonify({
+        'facets': facets,
         'filters': filters
-    }), 200
+    })
+    return set_cache_headers(response, etag, last_modified, cache_control), 200
+
+@product_bp.route('/batch', methods=['POST'])
+@admin_required
+def batch_products():
+    """Create, partially update and delete many products in one transaction"""
+    data = request.json or {}
+    raw_creates = data.get('create', [])
+    raw_updates = data.get('update', [])
+    raw_deletes = data.get('delete', [])
+    
+    if not all(isinstance(items, list) for items in (raw_creates, raw_updates, raw_deletes)):
+        return jsonify({'message': 'create, update and delete must be lists'}), 400
+    
+    total = len(raw_creates) + len(raw_updates) + len(raw_deletes)
+    if total > current_app.config['PRODUCT_BATCH_MAX']:
+        return jsonify({'message': f"At most {current_app.config['PRODUCT_BATCH_MAX']} rows per batch"}), 413
+    
+    # Reject the whole batch on malformed rows, before anything is written
+    errors = []
+    creates, updates, deletes = [], [], []
+    for section, items, parse in (
+        ('create', raw_creates, _product_from_json),
+        ('update', raw_updates, _batch_update_from_json),
+        ('delete', raw_deletes, int)
+    ):
+        target = {'create': creates, 'update': updates, 'delete': deletes}[section]
+        for index, item in enumerate(items):
+            try:
+                target.append(parse(item))
+            except (TypeError, ValueError) as e:
+                errors.append({'section': section, 'index': index, 'message': str(e)})
+    
+    if errors:
+        return jsonify({'message': 'Batch was not applied', 'errors': errors}), 400
+    
+    product_repo = ProductRepository(current_app.db)
+    try:
+        with current_app.db.transaction(immediate=True):
+            results = product_repo.apply_batch(creates, updates, deletes, purge=False)
+            deleted = [row['id'] for row in results['deleted'] if row['status'] == 'deleted']
+            if deleted:
+                # Stored with the deletes; carts and wishlists are cleared off the request path
+                current_app.tasks.enqueue('products.purge_references', {'product_ids': deleted})
+    except sqlite3.OperationalError:
+        # The write lock could not be taken within the busy timeout
+        return jsonify({'message': 'Catalog is busy, please try again'}), 503, {'Retry-After': '1'}
+    
+    return jsonify(results), 200
 
 @product_bp.route('/<int:product_id>', methods=['GET'])
 def get_product(product_id):
     """Get a single product by ID"""
     product_repo = ProductRepository(current_app.db)
-    product = product_repo.find_by_id(product_id)
+    cache_control = current_app.config['PRODUCT_DETAIL_CACHE_CONTROL']
+    
+    # Answer revalidations from the product version alone
+    try:
+        fields = Product.parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({'message': f'Invalid fields: {str(e)}'}), 400
+    
+    version = product_repo.find_version(product_id)
+    if not version:
+        return jsonify({'message': 'Product not found'}), 404
+    
+    etag = make_etag('product', product_id, version[0], *(fields or ()))
+    last_modified = parse_timestamp(version[1])
+    if is_not_modified(etag, last_modified):
+        return not_modified(etag, last_modified, cache_control)
+    cached = precompressed(etag, last_modified, cache_control)
+    if cached is not None:
+        return cached
+    
+    product = product_repo.find_by_id(product_id, version=version[0], fields=fields)
     
     if not product:
         return jsonify({'message': 'Product not found'}), 404
     
-    return jsonify({
-        'product': product.to_dict()
-    }), 200
+    # Validators follow the loaded product in case it changed in between
+    etag = make_etag('product', product_id, product.version, *(fields or ()))
+    last_modified = parse_timestamp(product.updated_at)
+    response = jsonify({
+        'product': product.to_dict(fields)
+    })
+    return set_cache_headers(response, etag, last_modified, cache_control), 200
 
 @product_bp.route('/<int:product_id>/reviews', methods=['POST'])
 @token_required
@@ -0,0 +1,85 @@
+from flask import Blueprint, request, jsonify, current_app
+from models.repositories.wishlist_repository import WishlistRepository
+from utils.auth import token_required
+
+wishlist_bp = Blueprint('wishlist', __name__)
+
+def _product_ids_from_request():
+    """Read product_id or product_ids from the JSON body"""
+    data = request.json or {}
+    if 'product_ids' in data:
+        return [int(product_id) for product_id in data['product_ids']]
+    if 'product_id' in data:
+        return [int(data['product_id'])]
+    return None
+
+@wishlist_bp.route('', methods=['GET'])
+@token_required
+def get_wishlist(current_user):
+    """Get the products on the current user's wishlist"""
+    limit = int(request.args.get('limit', 100))
+    offset = int(request.args.get('offset', 0))
+    
+    wishlist_repo = WishlistRepository(current_app.db)
+    products = wishlist_repo.find_products(current_user.id, limit, offset)
+    
+    return jsonify({
+        'products': [product.to_dict() for product in products],
+        'count': len(products)
+    }), 200
+
+@wishlist_bp.route('', methods=['POST'])
+@token_required
+def add_to_wishlist(current_user):
+    """Add one (product_id) or many (product_ids) products to the wishlist"""
+    try:
+        product_ids = _product_ids_from_request()
+    except (TypeError, ValueError):
+        return jsonify({'message': 'Product IDs must be integers'}), 400
+    
+    if not product_ids:
+        return jsonify({'message': 'Missing product_id or product_ids'}), 400
+    
+    wishlist_repo = WishlistRepository(current_app.db)
+    added, missing = wishlist_repo.add_many(current_user.id, product_ids)
+    
+    if not added:
+        return jsonify({'message': 'Product not found', 'missing': missing}), 404
+    
+    return jsonify({
+        'message': 'Wishlist updated',
+        'added': added,
+        'missing': missing
+    }), 200
+
+@wishlist_bp.route('/<int:product_id>', methods=['DELETE'])
+@token_required
+def remove_from_wishlist(current_user, product_id):
+    """Remove a product from the wishlist"""
+    wishlist_repo = WishlistRepository(current_app.db)
+    wishlist_repo.remove_many(current_user.id, [product_id])
+    
+    return jsonify({
+        'message': 'Wishlist updated',
+        'removed': [product_id]
+    }), 200
+
+@wishlist_bp.route('', methods=['DELETE'])
+@token_required
+def bulk_remove_from_wishlist(current_user):
+    """Remove many products (product_ids) from the wishlist"""
+    try:
+        product_ids = _product_ids_from_request()
+    except (TypeError, ValueError):
+        return jsonify({'message': 'Product IDs must be integers'}), 400
+    
+    if not product_ids:
+        return jsonify({'message': 'Missing product_id or product_ids'}), 400
+    
+    wishlist_repo = WishlistRepository(current_app.db)
+    wishlist_repo.remove_many(current_user.id, product_ids)
+    
+    return jsonify({
+        'message': 'Wishlist updated',
+        'removed': product_ids
+    }), 200
@@ -1,60 +1,30 @@
-from flask import Flask
-from flask_cors import CORS
-from database.db import Database
-from routes.auth_routes import auth_bp
-from routes.product_routes import product_bp
-from routes.cart_routes import cart_bp
+import argparse
 import os
+import sys
 
-def create_app(test_config=None):
-    """Create and configure the Flask application"""
-    app = Flask(__name__, instance_relative_config=True)
-    
-    # Enable CORS
-    CORS(app, resources={r"/*": {"origins": "*"}})
-    
-    # Apply configuration
-    app.config.from_mapping(
-        SECRET_KEY=os.environ.get('SECRET_KEY', 'dev_secret_key'),
-        DATABASE=os.path.join(app.instance_path, 'egadget.db'),
-    )
-    
-    if test_config is None:
-        # Load the instance config, if it exists, when not testing
-        app.config.from_pyfile('config.py', silent=True)
-    else:
-        # Load the test config if passed in
-        app.config.from_mapping(test_config)
-    
-    # Ensure the instance folder exists
-    os.makedirs(app.instance_path, exist_ok=True)
-    
-    # Initialize database
-    db = Database(app.config['DATABASE'])
-    app.db = db
-    
-    # Initialize database tables and seed data
-    with app.app_context():
-        db.connect()
-        db.initialize()
-        db.seed_data()
-    
-    # Register blueprints
-    app.register_blueprint(auth_bp, url_prefix='/api/auth')
-    app.register_blueprint(product_bp, url_prefix='/api/products')
-    app.register_blueprint(cart_bp, url_prefix='/api/cart')
-    
-    # Add a simple index route
-    @app.route('/')
-    def index():
-        return {
-            'message': 'Egadget API is running',
-            'version': '1.0.0'
-        }
-    
-    return app
+def run_production():
+    """Serve with the pre-forking Gunicorn server configured in gunicorn.conf.py"""
+    from gunicorn.app.wsgiapp import run
+    config = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gunicorn.conf.py')
+    sys.argv = ['gunicorn', '-c', config]
+    run()
 
-app = create_app()
+def run_development():
+    """Serve with the single-process Werkzeug debug server"""
+    from app import create_app, start_background
+    app = create_app()
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        # Only the reloader's child serves requests
+        start_background(app)
+    app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 5000)), debug=True)
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True) 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Run the Egadget API')
+    parser.add_argument('--production', action='store_true',
+                        help='Run the multi-worker production server instead of the debug server')
+    args = parser.parse_args()
+
+    if args.production:
+        run_production()
+    else:
+        run_development()
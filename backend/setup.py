@@ -9,6 +9,7 @@ setup(
         "flask-cors",
         "pyjwt",
         "bcrypt",
-        "python-dotenv"
+        "python-dotenv",
+        'gunicorn; sys_platform != "win32"'
     ],
 ) 
\ No newline at end of file
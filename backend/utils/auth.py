@@ -1,8 +1,45 @@
 from functools import wraps
 from flask import request, jsonify, current_app
 from models.user import User
+from utils.cache import LRUCache
+from typing import Optional, Dict, Any, Tuple
+import hashlib
+import hmac
+import time
 import os
 
+class TokenCache:
+    """Maps a token digest to its verified (payload, User).
+    
+    Entries expire with the token's exp claim at the latest. The User keeps
+    the token_revision it was loaded with; resolve_token() checks it against
+    the users row on every hit, so an update or delete in any process
+    retires the user's entries.
+    """
+    
+    def __init__(self, max_size: int = 4096, ttl: float = 300.0):
+        self._cache = LRUCache(max_size=max_size, ttl=ttl)
+    
+    @staticmethod
+    def digest(token: str) -> str:
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()
+    
+    def get(self, token: str) -> Optional[Tuple[Dict[str, Any], User]]:
+        return self._cache.get(self.digest(token))
+    
+    def set(self, token: str, payload: Dict[str, Any], user: User) -> None:
+        remaining = payload.get('exp', 0) - time.time()
+        if remaining <= 0:
+            return
+        ttl = min(self._cache.ttl, remaining)
+        self._cache.set(self.digest(token), (payload, user), ttl=ttl)
+    
+    def delete(self, token: str) -> None:
+        self._cache.delete(self.digest(token))
+    
+    def stats(self) -> Dict[str, Any]:
+        return self._cache.stats()
+
 def get_token_from_request():
     """Extract token from the Authorization header"""
     auth_header = request.headers.get('Authorization')
@@ -10,6 +47,53 @@ def get_token_from_request():
         return auth_header.split(' ')[1]
     return None
 
+def resolve_token(token: str) -> Tuple[Optional[Dict[str, Any]], Optional[User]]:
+    """Verify a token and load its user, going through the token cache.
+    
+    Returns (None, None) for an invalid or expired token and (payload, None)
+    when the user no longer exists.
+    """
+    from models.repositories.user_repository import UserRepository
+    user_repo = UserRepository(current_app.db)
+    
+    token_cache = getattr(current_app.db, 'token_cache', None)
+    if token_cache is not None:
+        cached = token_cache.get(token)
+        if cached is not None:
+            payload, user = cached
+            # One primary-key read instead of JWT verification and the user row
+            revision = user_repo.find_token_revision(user.id)
+            if revision == user.token_revision:
+                return payload, user
+            token_cache.delete(token)
+            if revision is None:
+                return payload, None
+    
+    # Verify the token
+    payload = User.verify_token(token, current_app.config['SECRET_KEY'])
+    if not payload:
+        return None, None
+    
+    # Get the user from the database
+    user = user_repo.find_by_id(payload['user_id'])
+    
+    if user and token_cache is not None:
+        token_cache.set(token, payload, user)
+    
+    return payload, user
+
+def get_optional_user() -> Optional[User]:
+    """Return the signed-in user for routes that also serve anonymous requests"""
+    token = get_token_from_request()
+    if not token:
+        return None
+    
+    try:
+        _, user = resolve_token(token)
+        return user
+    except Exception:
+        return None
+
 def token_required(f):
     """Decorator to require a valid token for a route"""
     @wraps(f)
@@ -20,16 +104,10 @@ def token_required(f):
             return jsonify({'message': 'Token is missing', 'authenticated': False}), 401
         
         try:
-            # Verify the token
-            payload = User.verify_token(token, current_app.config['SECRET_KEY'])
+            payload, user = resolve_token(token)
             if not payload:
                 return jsonify({'message': 'Token is invalid or expired', 'authenticated': False}), 401
             
-            # Get the user from the database
-            from models.repositories.user_repository import UserRepository
-            user_repo = UserRepository(current_app.db)
-            user = user_repo.find_by_id(payload['user_id'])
-            
             if not user:
                 return jsonify({'message': 'User not found', 'authenticated': False}), 401
             
@@ -40,4 +118,21 @@ def token_required(f):
         except Exception as e:
             return jsonify({'message': f'Authentication failed: {str(e)}', 'authenticated': False}), 401
     
-    return decorated 
\ No newline at end of file
+    return decorated
+
+def admin_required(f):
+    """Decorator for admin routes: requires the X-Admin-Key header to match
+    ADMIN_API_KEY. Admin routes are disabled while no key is configured."""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        admin_key = current_app.config.get('ADMIN_API_KEY')
+        if not admin_key:
+            return jsonify({'message': 'Admin API is disabled'}), 403
+        
+        provided = request.headers.get('X-Admin-Key', '')
+        if not hmac.compare_digest(provided.encode('utf-8'), admin_key.encode('utf-8')):
+            return jsonify({'message': 'Invalid admin key'}), 401
+        
+        return f(*args, **kwargs)
+    
+    return decorated
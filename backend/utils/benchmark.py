@@ -0,0 +1,494 @@
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Optional, List, Dict, Any, Callable, Tuple
+
+from models.user import User
+
+SQL_PREFIXES = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH')
+
+BENCHMARK_PASSWORD = 'benchmark-password'
+
+CATEGORIES = ['laptops', 'phones', 'tablets', 'accessories', 'smart gadgets', 'audio', 'cameras', 'gaming']
+
+WORDS = ['pro', 'max', 'ultra', 'lite', 'air', 'mini', 'plus', 'neo', 'edge', 'wave',
+         'core', 'nova', 'flex', 'prime', 'zoom', 'pulse', 'volt', 'sonic', 'pixel', 'aero']
+
+PERCENTILES = (50, 90, 95, 99)
+
+class BenchmarkScale:
+    """How much data the benchmark database holds"""
+
+    def __init__(self, products: int = 2000, reviews: int = 10000, users: int = 200,
+                 cart_rows: int = 1000):
+        self.products = products
+        self.reviews = reviews
+        self.users = users
+        self.cart_rows = cart_rows
+
+    def to_dict(self) -> Dict[str, int]:
+        return {
+            'products': self.products,
+            'reviews': self.reviews,
+            'users': self.users,
+            'cartRows': self.cart_rows
+        }
+
+class QueryCounter:
+    """Counts the data statements run on the connections it is installed on"""
+
+    def __init__(self):
+        self.count = 0
+
+    def install(self, connection: sqlite3.Connection) -> None:
+        connection.set_trace_callback(self._trace)
+
+    def _trace(self, statement: str) -> None:
+        if statement.lstrip().upper().startswith(SQL_PREFIXES):
+            self.count += 1
+
+class BenchmarkCase:
+    """One endpoint request, prepared (untimed) and then timed per iteration.
+
+    prepare receives the benchmark and the iteration number and returns
+    (path, json body); it may issue setup requests of its own. auth sends
+    the benchmark user's token, admin the admin API key.
+    """
+
+    def __init__(self, name: str, method: str, prepare: Callable[['EndpointBenchmark', int], Tuple[str, Any]],
+                 auth: bool = False, expected_status: Tuple[int, ...] = (200,), admin: bool = False):
+        self.name = name
+        self.method = method
+        self.prepare = prepare
+        self.auth = auth
+        self.expected_status = expected_status
+        self.admin = admin
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a list of samples"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(1, int(round(pct / 100.0 * len(ordered))))
+    return ordered[min(rank, len(ordered)) - 1]
+
+def populate(db, scale: BenchmarkScale, seed: int = 0) -> Dict[str, Any]:
+    """Fill a freshly initialized database with generated rows.
+
+    Every generated user shares BENCHMARK_PASSWORD. Returns the ids and
+    values the benchmark cases draw from.
+    """
+    rng = random.Random(seed)
+    connection = db.connection
+
+    products = []
+    for i in range(scale.products):
+        name = f"{rng.choice(WORDS).title()} {rng.choice(WORDS).title()} {i}"
+        price = round(rng.uniform(500, 120000), 2)
+        products.append((
+            name,
+            f"{name} with {' '.join(rng.sample(WORDS, 5))}",
+            price,
+            round(price * 1.2, 2),
+            rng.choice([0, 0, 10, 20]),
+            1000000,
+            rng.choice(CATEGORIES),
+            json.dumps([f"/images/{i}.jpg"]),
+            rng.random() < 0.2,
+            rng.random() < 0.1,
+            0
+        ))
+    connection.executemany(
+        """
+        INSERT INTO products
+        (name, description, price, original_price, discount, stock, category,
+        images, is_new, trending, rating)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        products
+    )
+
+    password = User.hash_password(BENCHMARK_PASSWORD, rounds=4)
+    connection.executemany(
+        "INSERT INTO users (name, email, password) VALUES (?, ?, ?)",
+        [(f"Benchmark User {i}", f"bench{i}@example.com", password) for i in range(scale.users)]
+    )
+    connection.commit()
+
+    product_ids = [row[0] for row in connection.execute("SELECT id FROM products")]
+    user_ids = [row[0] for row in connection.execute("SELECT id FROM users WHERE email LIKE 'bench%'")]
+
+    if user_ids:
+        connection.executemany(
+            "INSERT INTO reviews (product_id, user_id, rating, comment) VALUES (?, ?, ?, ?)",
+            [
+                (rng.choice(product_ids), rng.choice(user_ids), rng.randint(1, 5), ' '.join(rng.sample(WORDS, 6)))
+                for _ in range(scale.reviews)
+            ]
+        )
+        connection.executemany(
+            "INSERT OR IGNORE INTO cart (user_id, product_id, quantity) VALUES (?, ?, ?)",
+            [(rng.choice(user_ids), rng.choice(product_ids), rng.randint(1, 3)) for _ in range(scale.cart_rows)]
+        )
+    connection.commit()
+    db.rebuild_rating_aggregates()
+
+    return {
+        'product_ids': product_ids,
+        'emails': [f"bench{i}@example.com" for i in range(scale.users)],
+        'categories': CATEGORIES,
+        'words': WORDS
+    }
+
+class EndpointBenchmark:
+    """Drives API endpoints through the Flask test client against a generated database"""
+
+    def __init__(self, scale: Optional[BenchmarkScale] = None, iterations: int = 50,
+                 warmup: int = 5, seed: int = 0, config: Optional[Dict[str, Any]] = None):
+        self.scale = scale or BenchmarkScale()
+        self.iterations = iterations
+        self.warmup = warmup
+        self.seed = seed
+        self.config = config or {}
+        self.rng = random.Random(seed)
+        self.directory = None
+        self.app = None
+        self.client = None
+        self.data: Dict[str, Any] = {}
+        self.token = None
+        self.counter = QueryCounter()
+
+    def setup(self) -> None:
+        """Build the app on a temporary database and log a benchmark user in"""
+        # Imported here so that loading this module does not pull in the app
+        from app import create_app
+
+        self.directory = tempfile.mkdtemp(prefix='egadget-bench-')
+        config = {
+            'DATABASE': os.path.join(self.directory, 'benchmark.db'),
+            'BCRYPT_ROUNDS': 4,
+            'ADMIN_API_KEY': 'benchmark-admin-key'
+        }
+        config.update(self.config)
+        self.app = create_app(config)
+
+        with self.app.app_context():
+            self.data = populate(self.app.db, self.scale, self.seed)
+
+        # Reopen every connection with the query counter installed
+        self.app.db.pool.connect_hooks.append(self.counter.install)
+        self.app.db.close()
+
+        self.client = self.app.test_client()
+        response = self.client.post('/api/auth/login', json={
+            'email': self.data['emails'][0] if self.data['emails'] else 'demo@example.com',
+            'password': BENCHMARK_PASSWORD if self.data['emails'] else 'password123'
+        })
+        self.token = (response.get_json() or {}).get('token')
+
+    def teardown(self) -> None:
+        if self.app is not None:
+            self.app.password_hasher.shutdown()
+            self.app.db.close()
+        if self.directory:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+    def request(self, method: str, path: str, body: Any = None, auth: bool = False, admin: bool = False):
+        headers = {'Authorization': f'Bearer {self.token}'} if auth and self.token else {}
+        if admin:
+            headers['X-Admin-Key'] = self.app.config['ADMIN_API_KEY']
+        return self.client.open(path, method=method, json=body, headers=headers)
+
+    def random_product_id(self) -> int:
+        return self.rng.choice(self.data['product_ids'])
+
+    def cases(self) -> List[BenchmarkCase]:
+        """Every route of product_routes, cart_routes, order_routes, auth_routes and event_routes"""
+        categories = self.data['categories']
+        words = self.data['words']
+
+        def first_cursor():
+            response = self.request('GET', '/api/products?limit=20&sort=price')
+            return (response.get_json() or {}).get('next_cursor') or ''
+
+        def cart_item_id(i):
+            self.request('POST', '/api/cart', {'product_id': self.random_product_id(), 'quantity': 1}, auth=True)
+            items = self.request('GET', '/api/cart', auth=True).get_json()['items']
+            return items[-1]['id']
+
+        def fill_cart(i):
+            self.request('POST', '/api/cart', {'product_id': self.random_product_id(), 'quantity': 1}, auth=True)
+            return '/api/orders'
+
+        def batch(i):
+            # Delete what the previous iteration created, so the catalog keeps its size;
+            # stock stays as deep as the seeded catalog's so carts and orders never run out
+            with self.app.app_context():
+                self.app.db.execute("SELECT id FROM products WHERE sku LIKE 'BATCH-%'")
+                created = [row['id'] for row in self.app.db.fetchall()]
+            return '/api/products/batch', {
+                'create': [
+                    {'sku': f'BATCH-{i}-{k}', 'name': f'Batch product {i}-{k}', 'stock': 1000000,
+                     'price': round(self.rng.uniform(100, 100000), 2), 'category': self.rng.choice(categories)}
+                    for k in range(10)
+                ],
+                'update': [
+                    {'id': self.random_product_id(), 'price': round(self.rng.uniform(100, 100000), 2),
+                     'stock': self.rng.randint(500000, 1000000)}
+                    for _ in range(40)
+                ],
+                'delete': created
+            }
+
+        return [
+            BenchmarkCase('products.list', 'GET',
+                          lambda b, i: ('/api/products?limit=20', None)),
+            BenchmarkCase('products.list_category', 'GET',
+                          lambda b, i: (f'/api/products?limit=20&category={categories[i % len(categories)]}', None)),
+            BenchmarkCase('products.list_search', 'GET',
+                          lambda b, i: (f'/api/products?limit=20&search={words[i % len(words)]}', None)),
+            BenchmarkCase('products.list_sorted', 'GET',
+                          lambda b, i: ('/api/products?limit=20&sort=-price', None)),
+            BenchmarkCase('products.list_popular', 'GET',
+                          lambda b, i: ('/api/products?limit=20&sort=popular', None)),
+            BenchmarkCase('products.list_card', 'GET',
+                          lambda b, i: ('/api/products?limit=20&fields=card', None)),
+            BenchmarkCase('products.list_cursor', 'GET',
+                          lambda b, i: (f'/api/products?limit=20&sort=price&cursor={first_cursor()}', None)),
+            BenchmarkCase('products.facets', 'GET',
+                          lambda b, i: (f'/api/products/facets?category={categories[i % len(categories)]}', None)),
+            BenchmarkCase('products.detail', 'GET',
+                          lambda b, i: (f'/api/products/{b.random_product_id()}', None)),
+            BenchmarkCase('products.batch', 'POST',
+                          lambda b, i: batch(i), admin=True),
+            BenchmarkCase('products.add_review', 'POST',
+                          lambda b, i: (f'/api/products/{b.random_product_id()}/reviews',
+                                        {'rating': b.rng.randint(1, 5), 'comment': 'Benchmark review'}),
+                          auth=True, expected_status=(201,)),
+            BenchmarkCase('events.record', 'POST',
+                          lambda b, i: ('/api/events', {'events': [
+                              {'type': b.rng.choice(('view', 'view', 'view', 'add_to_cart', 'purchase')),
+                               'product_id': b.random_product_id()} for _ in range(50)
+                          ]}), expected_status=(202,)),
+            BenchmarkCase('cart.get', 'GET',
+                          lambda b, i: ('/api/cart', None), auth=True),
+            BenchmarkCase('cart.add', 'POST',
+                          lambda b, i: ('/api/cart', {'product_id': b.random_product_id(), 'quantity': 1}),
+                          auth=True),
+            BenchmarkCase('cart.sync', 'PATCH',
+                          lambda b, i: ('/api/cart', {
+                              'upsert': [{'product_id': b.random_product_id(), 'quantity': 2} for _ in range(5)],
+                              'mode': 'max'
+                          }), auth=True),
+            BenchmarkCase('cart.update', 'PUT',
+                          lambda b, i: (f'/api/cart/{cart_item_id(i)}', {'quantity': 2}), auth=True),
+            BenchmarkCase('cart.remove', 'DELETE',
+                          lambda b, i: (f'/api/cart/{cart_item_id(i)}', None), auth=True),
+            BenchmarkCase('cart.clear', 'DELETE',
+                          lambda b, i: ('/api/cart', None), auth=True),
+            BenchmarkCase('orders.create', 'POST',
+                          lambda b, i: (fill_cart(i), None),
+                          auth=True, expected_status=(201,)),
+            BenchmarkCase('orders.list', 'GET',
+                          lambda b, i: ('/api/orders?limit=20', None), auth=True),
+            BenchmarkCase('auth.register', 'POST',
+                          lambda b, i: ('/api/auth/register', {
+                              'name': 'Benchmark', 'email': f'register{b.rng.random()}@example.com',
+                              'password': BENCHMARK_PASSWORD
+                          }), expected_status=(201,)),
+            BenchmarkCase('auth.login', 'POST',
+                          lambda b, i: ('/api/auth/login', {
+                              'email': b.rng.choice(b.data['emails']) if b.data['emails'] else 'demo@example.com',
+                              'password': BENCHMARK_PASSWORD if b.data['emails'] else 'password123'
+                          })),
+            BenchmarkCase('auth.me', 'GET',
+                          lambda b, i: ('/api/auth/me', None), auth=True),
+            BenchmarkCase('auth.check', 'GET',
+                          lambda b, i: ('/api/auth/check', None), auth=True)
+        ]
+
+    def run_case(self, case: BenchmarkCase) -> Dict[str, Any]:
+        """Time one case; the first `warmup` iterations are not recorded"""
+        latencies: List[float] = []
+        queries: List[int] = []
+        errors = 0
+
+        for i in range(self.warmup + self.iterations):
+            path, body = case.prepare(self, i)
+
+            self.counter.count = 0
+            start = time.perf_counter()
+            response = self.request(case.method, path, body, auth=case.auth, admin=case.admin)
+            elapsed = (time.perf_counter() - start) * 1000.0
+            statements = self.counter.count
+
+            if response.status_code not in case.expected_status:
+                errors += 1
+            if i >= self.warmup:
+                latencies.append(elapsed)
+                queries.append(statements)
+
+        result = {
+            'iterations': len(latencies),
+            'errors': errors,
+            'meanMs': round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+            'maxMs': round(max(latencies), 3) if latencies else 0.0,
+            'queries': round(sum(queries) / len(queries), 2) if queries else 0.0
+        }
+        for pct in PERCENTILES:
+            result[f'p{pct}Ms'] = round(percentile(latencies, pct), 3)
+        return result
+
+    def run(self, only: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Run every case (or those whose name starts with one of `only`)"""
+        self.setup()
+        try:
+            endpoints = {}
+            for case in self.cases():
+                if only and not any(case.name.startswith(prefix) for prefix in only):
+                    continue
+                endpoints[case.name] = self.run_case(case)
+        finally:
+            self.teardown()
+
+        return {
+            'meta': {
+                'createdAt': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                'python': platform.python_version(),
+                'sqlite': sqlite3.sqlite_version,
+                'scale': self.scale.to_dict(),
+                'iterations': self.iterations,
+                'warmup': self.warmup,
+                'seed': self.seed
+            },
+            'endpoints': endpoints
+        }
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float = 0.2,
+            min_delta_ms: float = 1.0, metrics: Tuple[str, ...] = ('p50Ms', 'p95Ms')) -> List[str]:
+    """List regressions of results against a baseline.
+
+    A latency metric regresses when it is more than `threshold` (a fraction)
+    and at least min_delta_ms above the baseline; the query count regresses
+    on any increase, since it does not depend on timing noise.
+    """
+    regressions = []
+    for name, current in results.get('endpoints', {}).items():
+        previous = baseline.get('endpoints', {}).get(name)
+        if not previous:
+            continue
+
+        for metric in metrics:
+            before, after = previous.get(metric), current.get(metric)
+            if before is None or after is None:
+                continue
+            if after > before * (1 + threshold) and after - before >= min_delta_ms:
+                regressions.append(
+                    f"{name}: {metric} {before:.2f} -> {after:.2f} ms "
+                    f"(+{(after / before - 1) * 100 if before else float('inf'):.0f}%)"
+                )
+
+        if current.get('queries', 0) > previous.get('queries', 0):
+            regressions.append(f"{name}: queries {previous['queries']} -> {current['queries']}")
+
+        if current.get('errors', 0) > previous.get('errors', 0):
+            regressions.append(f"{name}: errors {previous['errors']} -> {current['errors']}")
+
+    return regressions
+
+def checkout_race(threads: int = 60, stock: int = 25) -> Dict[str, Any]:
+    """Race `threads` users, each with one unit of the same product in their
+    cart, to check out at once against `stock` units.
+
+    Logins and cart fills happen first, one at a time; a barrier then
+    releases every POST /api/orders together, each on its own thread and
+    database connection. Returns the response status counts and what the
+    database holds afterwards; checkout_race_failures() checks them.
+    """
+    # Imported here so that loading this module does not pull in the app
+    from app import create_app
+
+    directory = tempfile.mkdtemp(prefix='egadget-checkout-')
+    app = create_app({'DATABASE': os.path.join(directory, 'checkout.db'), 'BCRYPT_ROUNDS': 4})
+    try:
+        with app.app_context():
+            data = populate(app.db, BenchmarkScale(products=1, reviews=0, users=threads, cart_rows=0))
+            product_id = data['product_ids'][0]
+            app.db.execute("UPDATE products SET stock = ? WHERE id = ?", (stock, product_id))
+
+        tokens = []
+        client = app.test_client()
+        for email in data['emails']:
+            token = client.post('/api/auth/login', json={
+                'email': email, 'password': BENCHMARK_PASSWORD
+            }).get_json()['token']
+            client.post('/api/cart', json={'product_id': product_id, 'quantity': 1},
+                        headers={'Authorization': f'Bearer {token}'})
+            tokens.append(token)
+
+        barrier = threading.Barrier(len(tokens))
+        statuses: List[int] = []
+        lock = threading.Lock()
+
+        def check_out(token: str) -> None:
+            thread_client = app.test_client()
+            barrier.wait()
+            response = thread_client.post('/api/orders', headers={'Authorization': f'Bearer {token}'})
+            with lock:
+                statuses.append(response.status_code)
+
+        workers = [threading.Thread(target=check_out, args=(token,)) for token in tokens]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        with app.app_context():
+            app.db.execute("SELECT stock FROM products WHERE id = ?", (product_id,))
+            final_stock = app.db.fetchone()['stock']
+            app.db.execute(
+                "SELECT COUNT(DISTINCT order_id) AS orders, COALESCE(SUM(quantity), 0) AS units "
+                "FROM order_items WHERE product_id = ?",
+                (product_id,)
+            )
+            ordered = app.db.fetchone()
+
+        return {
+            'threads': len(tokens),
+            'stock': stock,
+            'statuses': {str(status): statuses.count(status) for status in sorted(set(statuses))},
+            'finalStock': final_stock,
+            'orders': ordered['orders'],
+            'orderedUnits': ordered['units']
+        }
+    finally:
+        app.password_hasher.shutdown()
+        app.db.close()
+        shutil.rmtree(directory, ignore_errors=True)
+
+def checkout_race_failures(result: Dict[str, Any]) -> List[str]:
+    """Invariants a checkout race must keep: no overselling, every unit sold
+    exactly once, and every losing checkout rejected with 409"""
+    failures = []
+    expected_orders = min(result['threads'], result['stock'])
+    created = result['statuses'].get('201', 0)
+    if result['finalStock'] < 0:
+        failures.append(f"stock went negative: {result['finalStock']}")
+    if created != expected_orders:
+        failures.append(f"{created} checkouts succeeded, expected {expected_orders}")
+    if result['orders'] != created or result['orderedUnits'] != created:
+        failures.append(f"{result['orders']} orders with {result['orderedUnits']} units stored "
+                        f"for {created} successful checkouts")
+    if result['finalStock'] != result['stock'] - result['orderedUnits']:
+        failures.append(f"final stock {result['finalStock']} does not match "
+                        f"{result['stock']} - {result['orderedUnits']} ordered")
+    unexpected = {status: count for status, count in result['statuses'].items() if status not in ('201', '409')}
+    if unexpected:
+        failures.append(f"unexpected responses: {unexpected}")
+    return failures
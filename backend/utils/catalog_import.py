@@ -0,0 +1,292 @@
+import csv
+import itertools
+import json
+import math
+import os
+import random
+import sqlite3
+import time
+from typing import Optional, List, Dict, Any, Iterable, Iterator, Tuple, Callable
+from database.migrations import restore_deferred_schema
+
+FEED_FORMATS = ('jsonl', 'csv')
+
+CSV_COLUMNS = ['sku', 'name', 'description', 'price', 'originalPrice', 'discount', 'stock',
+               'category', 'images', 'isNew', 'trending', 'rating']
+
+# Unchanged rows are left alone so re-importing a feed does not bump product
+# versions (and with them every ETag). Ratings of reviewed products belong to
+# the review aggregates, not the feed.
+UPSERT_SQL = """
+    INSERT INTO products
+    (sku, name, description, price, original_price, discount, stock, category,
+    images, is_new, trending, rating)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (sku) DO UPDATE SET
+    name = excluded.name,
+    description = excluded.description,
+    price = excluded.price,
+    original_price = excluded.original_price,
+    discount = excluded.discount,
+    stock = excluded.stock,
+    category = excluded.category,
+    images = excluded.images,
+    is_new = excluded.is_new,
+    trending = excluded.trending,
+    rating = CASE WHEN products.review_count > 0 THEN products.rating ELSE excluded.rating END
+    WHERE (products.name, products.description, products.price, products.original_price,
+           products.discount, products.stock, products.category, products.images,
+           products.is_new, products.trending, products.rating)
+    IS NOT (excluded.name, excluded.description, excluded.price, excluded.original_price,
+            excluded.discount, excluded.stock, excluded.category, excluded.images,
+            excluded.is_new, excluded.trending,
+            CASE WHEN products.review_count > 0 THEN products.rating ELSE excluded.rating END)
+"""
+
+class CatalogImportStats:
+    """Counters for one import run"""
+
+    def __init__(self):
+        self.read = 0
+        self.inserted = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.skipped = 0
+        self.errors: List[str] = []
+        self.seconds = 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.read / self.seconds if self.seconds else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'read': self.read,
+            'inserted': self.inserted,
+            'updated': self.updated,
+            'unchanged': self.unchanged,
+            'skipped': self.skipped,
+            'seconds': round(self.seconds, 3),
+            'rowsPerSecond': round(self.rows_per_second, 1)
+        }
+
+def detect_format(path: str) -> str:
+    """Feed format from the file extension"""
+    extension = os.path.splitext(path)[1].lower().lstrip('.')
+    if extension in ('jsonl', 'ndjson'):
+        return 'jsonl'
+    if extension == 'csv':
+        return 'csv'
+    raise ValueError(f"Cannot tell the feed format of {path}; pass jsonl or csv")
+
+def read_feed(path: str, feed_format: Optional[str] = None) -> Iterator[Tuple[int, Any]]:
+    """Yield (line number, record) from a JSONL or CSV feed, one at a time.
+
+    Lines that are not valid JSON are yielded as ValueError instances so the
+    importer can count them without stopping.
+    """
+    feed_format = feed_format or detect_format(path)
+    with open(path, 'r', newline='', encoding='utf-8') as f:
+        if feed_format == 'csv':
+            reader = csv.DictReader(f)
+            for record in reader:
+                yield reader.line_num, record
+            return
+
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield line_number, json.loads(line)
+            except json.JSONDecodeError as e:
+                yield line_number, ValueError(f"invalid JSON: {e.msg}")
+
+def _flag(value: Any) -> int:
+    if isinstance(value, str):
+        return 1 if value.strip().lower() in ('1', 'true', 'yes', 'y') else 0
+    return 1 if value else 0
+
+def _images(value: Any) -> str:
+    if isinstance(value, list):
+        return json.dumps(value)
+    if isinstance(value, str) and value.strip():
+        value = value.strip()
+        if value.startswith('['):
+            return json.dumps(json.loads(value))
+        return json.dumps([image for image in value.split('|') if image])
+    return '[]'
+
+def _number(value: Any, field: str) -> float:
+    """float() that also rejects inf and nan, which SQLite cannot store faithfully"""
+    number = float(value)
+    if not math.isfinite(number):
+        raise ValueError(f"{field} must be a finite number")
+    return number
+
+def _integer(value: Any, field: str) -> int:
+    """Whole number within SQLite's 64-bit INTEGER range"""
+    number = int(_number(value, field))
+    if not -2 ** 63 <= number < 2 ** 63:
+        raise ValueError(f"{field} is out of range")
+    return number
+
+def _pick(record: Dict[str, Any], *keys: str, default: Any = None) -> Any:
+    """First non-empty value among camelCase / snake_case spellings"""
+    for key in keys:
+        value = record.get(key)
+        if value not in (None, ''):
+            return value
+    return default
+
+def to_row(record: Dict[str, Any]) -> Tuple[Any, ...]:
+    """Turn a feed record into UPSERT_SQL parameters; raises ValueError if invalid"""
+    if not isinstance(record, dict):
+        raise ValueError("record is not an object")
+
+    sku = _pick(record, 'sku')
+    name = _pick(record, 'name')
+    price = _pick(record, 'price')
+    if sku is None or name is None or price is None:
+        raise ValueError("sku, name and price are required")
+
+    original_price = _pick(record, 'originalPrice', 'original_price')
+    return (
+        str(sku).strip(),
+        str(name),
+        str(_pick(record, 'description', default='')),
+        _number(price, 'price'),
+        _number(original_price, 'originalPrice') if original_price is not None else None,
+        _integer(_pick(record, 'discount', default=0), 'discount'),
+        _integer(_pick(record, 'stock', default=0), 'stock'),
+        str(_pick(record, 'category', default='Other')),
+        _images(record.get('images')),
+        _flag(_pick(record, 'isNew', 'is_new', default=0)),
+        _flag(_pick(record, 'trending', default=0)),
+        _number(_pick(record, 'rating', default=0), 'rating')
+    )
+
+def _deferred_objects(connection: sqlite3.Connection) -> List[Tuple[str, str, str]]:
+    """Secondary indexes and search triggers on products that a bulk load can skip"""
+    return connection.execute("""
+        SELECT type, name, sql FROM sqlite_master
+        WHERE tbl_name = 'products' AND sql IS NOT NULL
+        AND ((type = 'index' AND name != 'idx_products_sku')
+            OR (type = 'trigger' AND name LIKE 'products_fts_%'))
+    """).fetchall()
+
+def import_catalog(connection: sqlite3.Connection, records: Iterable[Tuple[int, Any]],
+                   chunk_size: int = 5000, defer_maintenance: bool = False,
+                   progress: Optional[Callable[[CatalogImportStats], None]] = None) -> CatalogImportStats:
+    """Upsert feed records into products by SKU in chunked transactions.
+
+    Only one chunk is held in memory at a time. With defer_maintenance the
+    secondary product indexes and full-text triggers are dropped for the
+    load, then recreated and the search index rebuilt once at the end (also
+    when the load fails part-way). Listings and search are slow or stale
+    meanwhile, so only defer on a database nothing is serving from. The
+    dropped definitions are kept in deferred_schema, and if the process
+    dies, the next Database.migrate() recreates them.
+    """
+    stats = CatalogImportStats()
+    started = time.perf_counter()
+
+    if connection.in_transaction:
+        connection.commit()
+
+    before = connection.execute("SELECT COUNT(*) FROM products").fetchone()[0]
+
+    deferred = []
+    if defer_maintenance:
+        deferred = _deferred_objects(connection)
+        connection.execute("BEGIN IMMEDIATE")
+        for object_type, name, sql in deferred:
+            connection.execute(
+                "INSERT OR REPLACE INTO deferred_schema (name, type, sql) VALUES (?, ?, ?)",
+                (name, object_type, sql)
+            )
+            connection.execute(f'DROP {object_type.upper()} IF EXISTS "{name}"')
+        connection.commit()
+
+    written = 0
+    try:
+        records = iter(records)
+        while True:
+            chunk = list(itertools.islice(records, chunk_size))
+            if not chunk:
+                break
+
+            rows = []
+            for line_number, record in chunk:
+                stats.read += 1
+                try:
+                    if isinstance(record, Exception):
+                        raise record
+                    rows.append(to_row(record))
+                except (ValueError, TypeError, OverflowError) as e:
+                    stats.skipped += 1
+                    if len(stats.errors) < 20:
+                        stats.errors.append(f"line {line_number}: {e}")
+
+            if rows:
+                connection.execute("BEGIN IMMEDIATE")
+                try:
+                    cursor = connection.executemany(UPSERT_SQL, rows)
+                    written += max(cursor.rowcount, 0)
+                    connection.commit()
+                except sqlite3.Error:
+                    connection.rollback()
+                    raise
+
+            if progress:
+                stats.seconds = time.perf_counter() - started
+                progress(stats)
+
+    finally:
+        if deferred:
+            restore_deferred_schema(connection, rebuild_search=written > 0)
+
+    after = connection.execute("SELECT COUNT(*) FROM products").fetchone()[0]
+    stats.inserted = after - before
+    stats.updated = written - stats.inserted
+    stats.unchanged = stats.read - stats.skipped - written
+    stats.seconds = time.perf_counter() - started
+    return stats
+
+def generate_catalog(templates: List[Dict[str, Any]], count: int, seed: int = 0) -> Iterator[Dict[str, Any]]:
+    """Yield `count` synthetic products varied from template products"""
+    rng = random.Random(seed)
+    for i in range(count):
+        template = templates[i % len(templates)]
+        price = round(float(template.get('price', 1000)) * rng.uniform(0.5, 1.5), 2)
+        discount = rng.choice([0, 0, 5, 10, 15, 20])
+        yield {
+            'sku': f"GEN-{i:07d}",
+            'name': f"{template.get('name', 'Product')} #{i}",
+            'description': template.get('description', ''),
+            'price': price,
+            'originalPrice': round(price / (1 - discount / 100), 2) if discount else None,
+            'discount': discount,
+            'stock': rng.randint(0, 500),
+            'category': template.get('category', 'Other'),
+            'images': template.get('images', []),
+            'isNew': rng.random() < 0.1,
+            'trending': rng.random() < 0.05,
+            'rating': round(rng.uniform(3.0, 5.0), 1)
+        }
+
+def write_feed(records: Iterable[Dict[str, Any]], f, feed_format: str = 'jsonl') -> int:
+    """Stream records to an open text file as JSONL or CSV; returns the count"""
+    written = 0
+    if feed_format == 'csv':
+        writer = csv.DictWriter(f, fieldnames=CSV_COLUMNS, extrasaction='ignore')
+        writer.writeheader()
+        for record in records:
+            writer.writerow(dict(record, images='|'.join(record.get('images') or [])))
+            written += 1
+        return written
+
+    for record in records:
+        f.write(json.dumps(record, separators=(',', ':')))
+        f.write('\n')
+        written += 1
+    return written
@@ -0,0 +1,124 @@
+import gzip
+import zlib
+from typing import Optional, Iterable, Iterator
+from flask import request, current_app
+from utils.cache import LRUCache
+from utils.http_cache import GZIP_ETAG_SUFFIX, set_cache_headers
+
+COMPRESSIBLE_MIMETYPES = (
+    'application/json',
+    'application/javascript',
+    'image/svg+xml'
+)
+
+def _is_compressible(mimetype: Optional[str]) -> bool:
+    return bool(mimetype) and (mimetype.startswith('text/') or mimetype in COMPRESSIBLE_MIMETYPES)
+
+def accepts_gzip() -> bool:
+    """Whether the request's Accept-Encoding allows gzip"""
+    return request.accept_encodings['gzip'] > 0
+
+class ResponseCompressor:
+    """Gzip responses for clients that accept it.
+
+    Bodies below min_size are sent as they are. Streamed responses are
+    compressed chunk by chunk and flushed after every chunk, so they keep
+    their early first byte. Compressed bodies of responses with an ETag are
+    kept in an LRU cache under that ETag: an ETag identifies one
+    representation, so a cached body never goes stale and a repeat request
+    can be answered with precompressed() before anything is serialized.
+    """
+
+    def __init__(self, min_size: int = 1024, level: int = 6,
+                 cache: Optional[LRUCache] = None, cache_max_body: int = 1048576):
+        self.min_size = min_size
+        self.level = level
+        self.cache = cache
+        self.cache_max_body = cache_max_body
+
+    def process(self, response):
+        """after_request hook: compress the response if the client allows it"""
+        if response.status_code == 304:
+            # Confirm the gzip variant if that is the one the client revalidated
+            etag, weak = response.get_etag()
+            if etag and accepts_gzip() and request.if_none_match.contains(etag + GZIP_ETAG_SUFFIX):
+                response.set_etag(etag + GZIP_ETAG_SUFFIX, weak=weak)
+                response.vary.add('Accept-Encoding')
+            return response
+
+        if (response.status_code < 200 or response.status_code == 204
+                or response.direct_passthrough
+                or 'Content-Encoding' in response.headers
+                or not _is_compressible(response.mimetype)):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        if not accepts_gzip():
+            return response
+
+        if response.is_streamed:
+            body = response.response
+            response.response = self._compress_stream(response.iter_encoded(), body)
+            response.headers.pop('Content-Length', None)
+        else:
+            body = response.get_data()
+            if len(body) < self.min_size:
+                return response
+            compressed = gzip.compress(body, compresslevel=self.level, mtime=0)
+            response.set_data(compressed)
+            self._store(response, compressed)
+
+        response.headers['Content-Encoding'] = 'gzip'
+        etag, weak = response.get_etag()
+        if etag:
+            response.set_etag(etag + GZIP_ETAG_SUFFIX, weak=weak)
+        return response
+
+    def _compress_stream(self, chunks: Iterable[bytes], body: Iterable) -> Iterator[bytes]:
+        # wbits=31 writes a gzip header and trailer around the deflate stream
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        try:
+            for chunk in chunks:
+                data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+                if data:
+                    yield data
+            yield compressor.flush()
+        finally:
+            # Closing the original body runs its cleanup (e.g. stream_with_context)
+            if hasattr(body, 'close'):
+                body.close()
+
+    def _store(self, response, compressed: bytes) -> None:
+        etag, weak = response.get_etag()
+        if (self.cache is None or not etag or weak or response.status_code != 200
+                or len(compressed) > self.cache_max_body
+                or 'no-store' in response.headers.get('Cache-Control', '')):
+            return
+        self.cache.set(etag, (compressed, response.mimetype))
+
+    def precompressed(self, etag: str, last_modified, cache_control: str,
+                      vary: Optional[str] = None):
+        """Cached gzip response for etag, or None.
+
+        Call after the conditional-request check, with the validators the
+        full response would carry.
+        """
+        if self.cache is None or not accepts_gzip():
+            return None
+        entry = self.cache.get(etag)
+        if entry is None:
+            return None
+
+        compressed, mimetype = entry
+        response = current_app.response_class(compressed, mimetype=mimetype)
+        set_cache_headers(response, etag + GZIP_ETAG_SUFFIX, last_modified, cache_control, vary)
+        response.headers['Content-Encoding'] = 'gzip'
+        response.vary.add('Accept-Encoding')
+        return response
+
+def precompressed(etag: str, last_modified, cache_control: str, vary: Optional[str] = None):
+    """Cached gzip response from the app's compressor, or None if there is none"""
+    compressor = getattr(current_app, 'compressor', None)
+    if compressor is None:
+        return None
+    return compressor.precompressed(etag, last_modified, cache_control, vary)
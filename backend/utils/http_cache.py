@@ -0,0 +1,61 @@
+import hashlib
+import datetime
+from typing import Optional, Iterable, Tuple
+from flask import request, current_app
+from werkzeug.http import unquote_etag
+
+# Appended to the ETag of gzip-encoded responses, so each encoding has its own validator
+GZIP_ETAG_SUFFIX = '-gzip'
+
+def make_etag(*parts) -> str:
+    """Build a strong ETag value from the parts that identify a representation"""
+    digest = hashlib.sha1('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+    return digest[:32]
+
+def normalized_args(exclude: Iterable[str] = ()) -> Tuple[Tuple[str, str], ...]:
+    """Query arguments in a stable order, so equivalent URLs share an ETag"""
+    return tuple(sorted(
+        (key, value) for key, values in request.args.lists() if key not in exclude
+        for value in values
+    ))
+
+def parse_timestamp(value: Optional[str]) -> Optional[datetime.datetime]:
+    """Parse an SQLite CURRENT_TIMESTAMP value (UTC) into an aware datetime"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.datetime.strptime(value[:19], '%Y-%m-%d %H:%M:%S')
+    except ValueError:
+        return None
+    return parsed.replace(tzinfo=datetime.timezone.utc)
+
+def is_not_modified(etag: str, last_modified: Optional[datetime.datetime]) -> bool:
+    """Evaluate If-None-Match, or If-Modified-Since when no ETag was sent.
+
+    If-None-Match uses the weak comparison of RFC 9110: W/ is ignored on both
+    sides, so a tag weakened by a proxy (e.g. when it recompresses) still matches.
+    """
+    if request.if_none_match:
+        tag, _ = unquote_etag(etag)
+        return (request.if_none_match.contains_weak(tag)
+                or request.if_none_match.contains_weak(tag + GZIP_ETAG_SUFFIX))
+    if request.if_modified_since and last_modified:
+        return last_modified <= request.if_modified_since
+    return False
+
+def set_cache_headers(response, etag: str, last_modified: Optional[datetime.datetime],
+                      cache_control: str, vary: Optional[str] = None):
+    """Attach validators, Cache-Control and Vary to a response"""
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = cache_control
+    if vary:
+        response.vary.add(vary)
+    return response
+
+def not_modified(etag: str, last_modified: Optional[datetime.datetime], cache_control: str,
+                 vary: Optional[str] = None):
+    """Empty 304 response carrying the same validators"""
+    response = current_app.response_class(status=304)
+    return set_cache_headers(response, etag, last_modified, cache_control, vary)
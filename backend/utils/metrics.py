@@ -0,0 +1,328 @@
+import glob
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from typing import Dict, Any, List, Optional, Tuple
+from flask import request, g
+
+slow_query_logger = logging.getLogger('egadget.sql')
+
+# Request latency histogram bounds, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+def normalize_sql(sql: str) -> str:
+    """Collapse a statement to its shape: literals become ? and IN lists (?, ...)"""
+    sql = _STRING_LITERAL.sub('?', sql)
+    sql = _NUMBER_LITERAL.sub('?', sql)
+    sql = _WHITESPACE.sub(' ', sql).strip()
+    return _PLACEHOLDER_LIST.sub('(?, ...)', sql)
+
+class QueryLog:
+    """Times the statements run through Database and totals them per request.
+
+    A statement's time covers execute() and the fetch*() calls that read
+    its rows; it is complete once the next statement starts or the request
+    ends. Rows read from a streamed cursor are added with streamed(), as
+    other statements may run in between. Statements at or above
+    slow_threshold seconds are logged in normalized form.
+    """
+
+    def __init__(self, slow_threshold: float = 0.1):
+        self.slow_threshold = slow_threshold
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.slow_queries = 0
+        self.errors = 0
+
+    def _state(self) -> Dict[str, Any]:
+        state = getattr(self._local, 'state', None)
+        if state is None:
+            state = self._local.state = {'pending': None, 'count': 0, 'seconds': 0.0, 'rows': 0}
+        return state
+
+    def executed(self, sql: str, seconds: float, error: bool = False) -> None:
+        """Record a statement run by Database.execute/executemany"""
+        state = self._state()
+        self._finish(state)
+        if error:
+            with self._lock:
+                self.errors += 1
+        state['pending'] = [sql, seconds, 0]
+
+    def fetched(self, rows: int, seconds: float) -> None:
+        """Add rows read from the current statement and the time spent reading them"""
+        pending = self._state()['pending']
+        if pending is not None:
+            pending[1] += seconds
+            pending[2] += rows
+
+    def streamed(self, rows: int, seconds: float) -> None:
+        """Add rows read from a Database.stream() cursor to the request's totals"""
+        state = self._state()
+        state['seconds'] += seconds
+        state['rows'] += rows
+
+    def _finish(self, state: Dict[str, Any]) -> None:
+        pending = state['pending']
+        if pending is None:
+            return
+        state['pending'] = None
+
+        sql, seconds, rows = pending
+        state['count'] += 1
+        state['seconds'] += seconds
+        state['rows'] += rows
+        if seconds >= self.slow_threshold:
+            with self._lock:
+                self.slow_queries += 1
+            slow_query_logger.warning("Slow query (%.1f ms, %d rows): %s",
+                                      seconds * 1000, rows, normalize_sql(sql))
+
+    def begin(self) -> None:
+        """Start totalling a new request on the calling thread"""
+        self._local.state = None
+
+    def totals(self) -> Tuple[int, float, int]:
+        """The calling thread's request so far: (statements, seconds, rows)"""
+        state = self._state()
+        self._finish(state)
+        return state['count'], state['seconds'], state['rows']
+
+    def end(self) -> Tuple[int, float, int]:
+        """Finish the calling thread's request: (statements, seconds, rows)"""
+        state = self._state()
+        self._finish(state)
+        self._local.state = None
+        return state['count'], state['seconds'], state['rows']
+
+class _RouteMetrics:
+    def __init__(self):
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.count = 0
+        self.seconds = 0.0
+        self.statuses: Dict[int, int] = {}
+        self.errors = 0
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.db_rows = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = dict(vars(self))
+        data['statuses'] = {str(status): count for status, count in self.statuses.items()}
+        return data
+
+    def add(self, data: Dict[str, Any]) -> None:
+        """Add the counters of another process's to_dict()"""
+        self.buckets = [mine + theirs for mine, theirs in zip(self.buckets, data['buckets'])]
+        for status, count in data['statuses'].items():
+            self.statuses[int(status)] = self.statuses.get(int(status), 0) + count
+        for name in ('count', 'seconds', 'errors', 'db_queries', 'db_seconds', 'db_rows'):
+            setattr(self, name, getattr(self, name) + data[name])
+
+class RequestMetrics:
+    """Per-route request latency, status and database totals.
+
+    Installed on the app with install(); every response gets a
+    Server-Timing header with its database and total time, and render()
+    returns everything in the Prometheus text format.
+
+    Counters are kept per process. With a shared_dir, each process also
+    writes them to metrics-<pid>.json there (after a request, at most every
+    sync_interval seconds), and render() sums the files of every process
+    that has used the directory, so any worker reports the totals of all
+    of them. Files of exited processes are kept, so totals never go down
+    while the directory lives.
+    """
+
+    def __init__(self, query_log: QueryLog, server_timing: bool = True,
+                 shared_dir: Optional[str] = None, sync_interval: float = 1.0):
+        self.query_log = query_log
+        self.server_timing = server_timing
+        self.shared_dir = shared_dir
+        self.sync_interval = sync_interval
+        self._routes: Dict[Tuple[str, str], _RouteMetrics] = {}
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._synced = 0.0
+        if shared_dir:
+            os.makedirs(shared_dir, exist_ok=True)
+
+    def install(self, app) -> None:
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+
+    def _before_request(self) -> None:
+        g.request_started = time.perf_counter()
+        self.query_log.begin()
+
+    def _after_request(self, response):
+        started = g.pop('request_started', None)
+        if started is None:
+            return response
+        method = request.method
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        status = response.status_code
+
+        if response.is_streamed:
+            # The body is generated after this hook, on the same thread, and
+            # its statements belong to the request: record it once the body
+            # is sent. The header can only cover the time until now.
+            queries, db_seconds, rows = self.query_log.totals()
+            response.call_on_close(lambda: self._finish(method, route, status, started))
+        else:
+            queries, db_seconds, rows = self._finish(method, route, status, started)
+
+        if self.server_timing:
+            seconds = time.perf_counter() - started
+            response.headers['Server-Timing'] = (
+                f'db;dur={db_seconds * 1000:.2f};desc="{queries} queries, {rows} rows", '
+                f'total;dur={seconds * 1000:.2f}'
+            )
+        return response
+
+    def _finish(self, method: str, route: str, status: int, started: float) -> Tuple[int, float, int]:
+        seconds = time.perf_counter() - started
+        queries, db_seconds, rows = self.query_log.end()
+        self.observe(method, route, status, seconds, queries, db_seconds, rows)
+        if self.shared_dir and time.monotonic() - self._synced >= self.sync_interval:
+            self.sync()
+        return queries, db_seconds, rows
+
+    def observe(self, method: str, route: str, status: int, seconds: float,
+                queries: int = 0, db_seconds: float = 0.0, rows: int = 0) -> None:
+        """Record one finished request"""
+        with self._lock:
+            metrics = self._routes.get((method, route))
+            if metrics is None:
+                metrics = self._routes[(method, route)] = _RouteMetrics()
+
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    metrics.buckets[i] += 1
+            metrics.count += 1
+            metrics.seconds += seconds
+            metrics.statuses[status] = metrics.statuses.get(status, 0) + 1
+            if status >= 500:
+                metrics.errors += 1
+            metrics.db_queries += queries
+            metrics.db_seconds += db_seconds
+            metrics.db_rows += rows
+
+    def _snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            routes = [[method, route, metrics.to_dict()] for (method, route), metrics in self._routes.items()]
+        return {'routes': routes, 'slow_queries': self.query_log.slow_queries,
+                'errors': self.query_log.errors}
+
+    def sync(self) -> None:
+        """Write this process's counters to the shared directory"""
+        if not self.shared_dir:
+            return
+        # Another thread writing the same file is at most one request behind
+        if not self._sync_lock.acquire(blocking=False):
+            return
+        try:
+            self._synced = time.monotonic()
+            fd, path = tempfile.mkstemp(dir=self.shared_dir, prefix='.metrics-', suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self._snapshot(), f)
+            os.replace(path, os.path.join(self.shared_dir, f'metrics-{os.getpid()}.json'))
+        finally:
+            self._sync_lock.release()
+
+    def _collect(self) -> Tuple[Dict[Tuple[str, str], _RouteMetrics], int, int]:
+        if not self.shared_dir:
+            with self._lock:
+                routes = {key: _RouteMetrics() for key in self._routes}
+                for key, metrics in self._routes.items():
+                    routes[key].add(metrics.to_dict())
+            return routes, self.query_log.slow_queries, self.query_log.errors
+
+        self.sync()
+        routes: Dict[Tuple[str, str], _RouteMetrics] = {}
+        slow_queries = errors = 0
+        for path in glob.glob(os.path.join(self.shared_dir, 'metrics-*.json')):
+            try:
+                with open(path) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                # Removed or replaced while we listed the directory
+                continue
+            for method, route, data in snapshot['routes']:
+                metrics = routes.get((method, route))
+                if metrics is None:
+                    metrics = routes[(method, route)] = _RouteMetrics()
+                metrics.add(data)
+            slow_queries += snapshot['slow_queries']
+            errors += snapshot['errors']
+        return routes, slow_queries, errors
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        collected, slow_queries, errors = self._collect()
+        routes = sorted(collected.items())
+        lines: List[str] = []
+
+        def family(name: str, kind: str, help_text: str) -> None:
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+
+        family('http_request_duration_seconds', 'histogram', 'Request latency by route')
+        for (method, route), metrics in routes:
+            labels = _labels(method=method, route=route)
+            for bound, count in zip(LATENCY_BUCKETS, metrics.buckets):
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {metrics.count}')
+            lines.append(f'http_request_duration_seconds_sum{{{labels}}} {metrics.seconds:.6f}')
+            lines.append(f'http_request_duration_seconds_count{{{labels}}} {metrics.count}')
+
+        family('http_requests_total', 'counter', 'Requests by route and status')
+        for (method, route), metrics in routes:
+            for status, count in sorted(metrics.statuses.items()):
+                lines.append(f'http_requests_total{{{_labels(method=method, route=route, status=status)}}} {count}')
+
+        family('http_request_errors_total', 'counter', 'Requests answered with a 5xx status')
+        for (method, route), metrics in routes:
+            lines.append(f'http_request_errors_total{{{_labels(method=method, route=route)}}} {metrics.errors}')
+
+        family('db_queries_total', 'counter', 'SQL statements run through Database, by route')
+        for (method, route), metrics in routes:
+            lines.append(f'db_queries_total{{{_labels(method=method, route=route)}}} {metrics.db_queries}')
+
+        family('db_query_duration_seconds_total', 'counter', 'Time spent in SQL statements, by route')
+        for (method, route), metrics in routes:
+            lines.append(f'db_query_duration_seconds_total{{{_labels(method=method, route=route)}}} '
+                         f'{metrics.db_seconds:.6f}')
+
+        family('db_rows_total', 'counter', 'Rows fetched, by route')
+        for (method, route), metrics in routes:
+            lines.append(f'db_rows_total{{{_labels(method=method, route=route)}}} {metrics.db_rows}')
+
+        family('db_slow_queries_total', 'counter', 'Statements slower than the slow query threshold')
+        lines.append(f'db_slow_queries_total {slow_queries}')
+        family('db_query_errors_total', 'counter', 'Statements that raised an SQLite error')
+        lines.append(f'db_query_errors_total {errors}')
+        return '\n'.join(lines) + '\n'
+
+def clear_shared_metrics(shared_dir: str) -> None:
+    """Remove the counter files of earlier runs from a shared metrics directory"""
+    for path in glob.glob(os.path.join(shared_dir, 'metrics-*.json')):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+def _escape(value: Any) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(**labels: Any) -> str:
+    return ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items())
@@ -0,0 +1,82 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Optional
+from models.user import User
+
+class PasswordPoolBusy(Exception):
+    """Raised when the password worker pool cannot take more work"""
+
+def _hash_password(password: str, rounds: int) -> str:
+    return User.hash_password(password, rounds)
+
+def _check_password(password: str, hashed_password: str) -> bool:
+    return User.check_password(password, hashed_password)
+
+class PasswordHasher:
+    """Runs bcrypt in a bounded process pool, off the request threads.
+    
+    At most max_pending hash/check calls may be queued or running; beyond
+    that, and when a result takes longer than timeout, PasswordPoolBusy is
+    raised so the caller can fail fast. With workers=0 bcrypt runs inline.
+    """
+    
+    def __init__(self, rounds: int = 12, workers: int = 2, max_pending: int = 16,
+                 timeout: float = 10.0):
+        self.rounds = rounds
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+    
+    def _get_executor(self) -> ProcessPoolExecutor:
+        # Created on first use so that forked server workers get their own pool
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._executor
+    
+    def _run(self, fn, *args):
+        if self.workers <= 0:
+            return fn(*args)
+        
+        if not self._slots.acquire(blocking=False):
+            raise PasswordPoolBusy("Password worker pool is saturated")
+        
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise PasswordPoolBusy("Timed out waiting for a password worker")
+    
+    def hash(self, password: str) -> str:
+        """Hash a password with the configured cost"""
+        return self._run(_hash_password, password, self.rounds)
+    
+    def check(self, password: str, hashed_password: str) -> bool:
+        """Check a password against a stored hash"""
+        return self._run(_check_password, password, hashed_password)
+    
+    def needs_rehash(self, hashed_password: str) -> bool:
+        """Whether a stored hash was made with a different cost"""
+        try:
+            return int(hashed_password.split('$')[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
+    
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
@@ -0,0 +1,140 @@
+import logging
+import math
+import sqlite3
+import threading
+import time
+from typing import Optional, Dict, Iterable, Tuple
+
+popularity_logger = logging.getLogger('egadget.popularity')
+
+def popularity_key(score: float, at: float, half_life: float) -> float:
+    """Stored form of a score valued at time at: log2(score) + at / half_life.
+
+    A score halves every half_life seconds, so the key of a product does not
+    change as it decays and keys of different products order them by their
+    current score at any moment.
+    """
+    return math.log2(score) + at / half_life
+
+def add_to_popularity(key: float, score: float, at: float, half_life: float) -> float:
+    """Key after adding score, valued at time at, to a stored key (0 for none)"""
+    added = popularity_key(score, at, half_life)
+    if key <= 0:
+        return added
+    # log2(2**key + 2**added), kept in range
+    high, low = max(key, added), min(key, added)
+    return high + math.log2(1 + 2 ** (low - high))
+
+class PopularityTracker:
+    """Turns product events into time-decayed popularity scores.
+
+    record() only adds each event's weight to an in-memory sum per product;
+    a flusher thread writes the sums every flush_interval seconds (sooner
+    once max_pending products are waiting) in one transaction, then flags
+    the trending_size most popular products with a current score of at
+    least trending_min_score as trending. Scores halve every half_life
+    seconds. Events not flushed yet are lost if the process dies.
+    """
+
+    def __init__(self, app, weights: Dict[str, float], half_life: float = 43200.0,
+                 flush_interval: float = 10.0, max_pending: int = 10000,
+                 trending_size: int = 12, trending_min_score: float = 5.0):
+        self.app = app
+        self.weights = dict(weights)
+        self.half_life = half_life
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.trending_size = trending_size
+        self.trending_min_score = trending_min_score
+        # Sums are valued at _since, when the first unflushed event came in
+        self._pending: Dict[int, float] = {}
+        self._since: Optional[float] = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def record(self, events: Iterable[Tuple[int, str]]) -> int:
+        """Count (product id, event type) pairs; returns how many were counted"""
+        now = time.time()
+        counted = 0
+        with self._lock:
+            if self._since is None:
+                self._since = now
+            growth = 2 ** ((now - self._since) / self.half_life)
+            for product_id, event_type in events:
+                self._pending[product_id] = self._pending.get(product_id, 0.0) + self.weights[event_type] * growth
+                counted += 1
+            full = len(self._pending) >= self.max_pending
+        if full:
+            self._wake.set()
+        return counted
+
+    def flush(self) -> int:
+        """Write the pending sums now; returns how many products were updated"""
+        # Imported here: the repository uses the key functions above
+        from models.repositories.product_repository import ProductRepository
+
+        with self._flush_lock:
+            with self._lock:
+                pending, since = self._pending, self._since
+                self._pending, self._since = {}, None
+            if not pending:
+                return 0
+
+            product_repo = ProductRepository(self.app.db)
+            try:
+                updated = product_repo.add_popularity(pending, since, self.half_life)
+                if updated:
+                    min_key = popularity_key(self.trending_min_score, time.time(), self.half_life)
+                    product_repo.refresh_trending(self.trending_size, min_key)
+            except sqlite3.Error:
+                self._restore(pending, since)
+                raise
+            return updated
+
+    def _restore(self, pending: Dict[int, float], since: float) -> None:
+        # Put unwritten sums back, revalued to the current buffer
+        with self._lock:
+            if self._since is None:
+                self._since = since
+            scale = 2 ** ((since - self._since) / self.half_life)
+            for product_id, score in pending.items():
+                self._pending[product_id] = self._pending.get(product_id, 0.0) + score * scale
+
+    def start(self) -> None:
+        """Start the flusher thread"""
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name='popularity-flusher', daemon=True)
+        self._thread.start()
+
+    def shutdown(self) -> None:
+        """Stop the flusher thread and write what is still pending"""
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stopping.set()
+            self._wake.set()
+            thread.join()
+        try:
+            self.flush()
+        except sqlite3.Error:
+            popularity_logger.exception("Could not flush popularity scores on shutdown")
+        finally:
+            self.app.db.release()
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            if self._stopping.is_set():
+                break
+            try:
+                self.flush()
+            except sqlite3.Error:
+                # The sums were kept; the next flush tries again
+                popularity_logger.exception("Could not flush popularity scores")
+            finally:
+                self.app.db.release()
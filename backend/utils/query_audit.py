@@ -0,0 +1,302 @@
+import ast
+import os
+import re
+import sqlite3
+from typing import Optional, List, Dict, Any, Set, Tuple
+
+from models.product import Product
+from models.user import User
+from models.repositories.product_repository import ProductRepository
+from models.repositories.user_repository import UserRepository
+
+# Source directories whose SQL runs on request paths or in background work
+AUDITED_DIRS = [
+    os.path.join('models', 'repositories'),
+    'routes',
+    'utils'
+]
+
+SQL_PREFIXES = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH')
+
+# Source files left out: the benchmark only runs against databases it generates
+EXCLUDED_FILES = {os.path.join('utils', 'benchmark.py')}
+
+# Statements that read a whole table on purpose, by source file: the
+# import counts the catalog around a bulk load, and the task stats of the
+# CLI group every row
+INTENDED_SCANS = {
+    os.path.join('utils', 'catalog_import.py'): {"SELECT COUNT(*) FROM products"},
+    os.path.join('utils', 'tasks.py'): {"SELECT name, status, COUNT(*) AS count FROM tasks GROUP BY name, status"}
+}
+
+# Methods whose first argument is a statement
+EXECUTE_METHODS = ('execute', 'executemany', 'stream')
+
+# Functions that build their SQL at runtime. Their statements are recorded
+# by the probes in collect_dynamic_statements() instead; anywhere else, a
+# statement that is not valid SQL with '?' per interpolation is an error
+PROBED_FUNCTIONS = {
+    os.path.join('models', 'repositories', 'product_repository.py'): {'find_facets'},
+    os.path.join('models', 'repositories', 'user_repository.py'): {'update'}
+}
+
+class RecordingDatabase:
+    """Stand-in for Database that records statements instead of running them"""
+
+    def __init__(self):
+        self.statements: List[Tuple[str, Tuple[Any, ...]]] = []
+
+    def execute(self, query, params=None):
+        self.statements.append((query, tuple(params or ())))
+        return True
+
+    def executemany(self, query, params_seq):
+        for params in params_seq:
+            return self.execute(query, params)
+        return self.execute(query)
+
+    def fetchall(self):
+        return []
+
+    def fetchone(self):
+        return None
+
+class QueryPlanFinding:
+    """EXPLAIN QUERY PLAN result for one statement"""
+
+    def __init__(self, source: str, query: str, plan: List[str],
+                 full_scans: List[str], error: Optional[str] = None):
+        self.source = source
+        self.query = query
+        self.plan = plan
+        self.full_scans = full_scans
+        self.error = error
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'source': self.source,
+            'query': self.query,
+            'plan': self.plan,
+            'fullScans': self.full_scans,
+            'error': self.error
+        }
+
+def collect_source_statements(base_dir: str) -> List[Tuple[str, str]]:
+    """Find SQL passed to .execute(), .executemany() and .stream() in the
+    audited source files.
+
+    Literals and module-level string constants are collected; f-strings are
+    rendered with '?' in place of each interpolation. Statements inside
+    PROBED_FUNCTIONS are left to the probes.
+    """
+    statements = []
+    for audited_dir in AUDITED_DIRS:
+        directory = os.path.join(base_dir, audited_dir)
+        for filename in sorted(os.listdir(directory)):
+            if not filename.endswith('.py'):
+                continue
+            path = os.path.join(directory, filename)
+            relative_path = os.path.join(audited_dir, filename)
+            if relative_path in EXCLUDED_FILES:
+                continue
+            with open(path, 'r') as f:
+                tree = ast.parse(f.read(), filename=path)
+
+            constants = {
+                target.id: node.value.value
+                for node in tree.body if isinstance(node, ast.Assign)
+                and isinstance(node.value, ast.Constant) and isinstance(node.value.value, str)
+                for target in node.targets if isinstance(target, ast.Name)
+            }
+            probed = PROBED_FUNCTIONS.get(relative_path, set())
+
+            for function, node in _calls(tree):
+                if not (isinstance(node.func, ast.Attribute) and node.func.attr in EXECUTE_METHODS
+                        and node.args) or function in probed:
+                    continue
+
+                query = _render_literal(node.args[0], constants)
+                if query and query.lstrip().upper().startswith(SQL_PREFIXES):
+                    statements.append((f"{relative_path}:{node.lineno}", query))
+    return statements
+
+def _calls(tree: ast.AST, function: Optional[str] = None):
+    """Yield (innermost enclosing function name, call) for every call in tree"""
+    for node in ast.iter_child_nodes(tree):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            yield from _calls(node, node.name)
+            continue
+        if isinstance(node, ast.Call):
+            yield function, node
+        yield from _calls(node, function)
+
+def _render_literal(node: ast.AST, constants: Dict[str, str]) -> Optional[str]:
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return node.value
+    if isinstance(node, ast.Name):
+        return constants.get(node.id)
+    if isinstance(node, ast.JoinedStr):
+        parts = []
+        for value in node.values:
+            if isinstance(value, ast.Constant):
+                parts.append(value.value)
+            else:
+                parts.append('?')
+        return ''.join(parts)
+    return None
+
+def collect_dynamic_statements() -> List[Tuple[str, str, Tuple[Any, ...]]]:
+    """Record the dynamically built listing, facet and user update queries
+    for representative inputs"""
+    recorder = RecordingDatabase()
+    repo = ProductRepository(recorder)
+
+    probes = [
+        ('default', {}),
+        ('category', {'category': 'laptops'}),
+        ('price range', {'min_price': 1000, 'max_price': 50000}),
+        ('new arrivals', {'is_new': True}),
+        ('trending', {'trending': True}),
+        ('search', {'search': 'pro'}),
+        ('category sorted by price', {'category': 'laptops', 'sort': 'price'})
+    ]
+    for sort in ['price', '-price', 'rating', '-rating', 'createdAt', '-createdAt', 'name', '-name', 'popular']:
+        probes.append((f'sort {sort}', {'sort': sort}))
+
+    statements = []
+    for label, filters in probes:
+        recorder.statements.clear()
+        repo.find_page(filters, limit=20)
+        statements.extend((f"listing: {label}", q, p) for q, p in recorder.statements)
+
+        # The same listing one page further, through a cursor
+        _, _, _, search_query = repo._build_filter_query(filters)
+        sort_token, sort_column, _ = repo._resolve_sort(filters.get('sort'), search_query)
+        cursor = repo._encode_cursor(sort_token, 0 if sort_column != 'id' else 1, 1)
+        recorder.statements.clear()
+        repo.find_page(filters, limit=20, cursor=cursor)
+        statements.extend((f"listing: {label} (cursor)", q, p) for q, p in recorder.statements)
+
+    # Facets count every match, so unfiltered and flag-only sets scan by
+    # design (the facet cache absorbs those); selective filters must not
+    facet_probes = [
+        ('category', {'category': 'laptops'}),
+        ('price range', {'min_price': 1000, 'max_price': 50000}),
+        ('search', {'search': 'pro'})
+    ]
+    for label, filters in facet_probes:
+        recorder.statements.clear()
+        repo.find_facets(filters, [1000, 10000])
+        statements.extend((f"facets: {label}", q, p) for q, p in recorder.statements)
+    
+    recorder.statements.clear()
+    repo._load_reviews_batch([Product(id=1), Product(id=2)], review_limit=3)
+    statements.extend(("listing: review previews", q, p) for q, p in recorder.statements)
+
+    user_probes = [
+        ('name', User(id=1, name='Name')),
+        ('name and email', User(id=1, name='Name', email='name@example.com'))
+    ]
+    user_repo = UserRepository(recorder)
+    for label, user in user_probes:
+        recorder.statements.clear()
+        user_repo.update(user)
+        statements.extend((f"user update: {label}", q, p) for q, p in recorder.statements)
+
+    return statements
+
+def _table_aliases(query: str) -> Dict[str, str]:
+    aliases = {}
+    for table, alias in re.findall(r"\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?", query, re.IGNORECASE):
+        aliases[table] = table
+        if alias and alias.upper() not in ('WHERE', 'JOIN', 'ON', 'LEFT', 'INNER', 'ORDER',
+                                           'GROUP', 'LIMIT', 'SET', 'VALUES'):
+            aliases[alias] = table
+    return aliases
+
+def _where_columns(query: str, alias: str, columns: Set[str]) -> Set[str]:
+    """Columns of the table known as alias that the WHERE clause filters on"""
+    match = re.search(r"\bWHERE\b(.*?)(?:\bGROUP BY\b|\bORDER BY\b|\bLIMIT\b|$)", query,
+                      re.IGNORECASE | re.DOTALL)
+    if not match:
+        return set()
+    filtered = set()
+    for qualifier, name in re.findall(r"(?:(\w+)\.)?(\w+)", match.group(1)):
+        if name in columns and qualifier in ('', alias):
+            filtered.add(name)
+    return filtered
+
+def _bounded_scan(connection: sqlite3.Connection, query: str, plan: List[str],
+                  alias: str, table: str, index: Optional[str]) -> bool:
+    """Whether an outermost scan stops after LIMIT rows.
+
+    That holds only when the scan order satisfies ORDER BY, so no temp b-tree
+    sorts its rows, and every WHERE filter on the table is answered from the
+    scanned index; a filter on other columns can read the whole table before
+    LIMIT rows match.
+    """
+    if not re.search(r"\bORDER BY\b", query, re.IGNORECASE) or not re.search(r"\bLIMIT\b", query, re.IGNORECASE):
+        return False
+    if any(detail.startswith('USE TEMP B-TREE') for detail in plan):
+        return False
+
+    table_info = connection.execute(f"PRAGMA table_info({table})").fetchall()
+    columns = {row[1] for row in table_info}
+    if index is None:
+        # A plain scan walks the rowid, which an INTEGER PRIMARY KEY column aliases
+        indexed = {row[1] for row in table_info if row[5] and row[2].upper() == 'INTEGER'}
+    else:
+        indexed = {row[2] for row in connection.execute(f"PRAGMA index_info({index})")}
+    return _where_columns(query, alias, columns) <= indexed
+
+def explain(connection: sqlite3.Connection, source: str, query: str,
+            params: Optional[Tuple[Any, ...]] = None) -> QueryPlanFinding:
+    """Run EXPLAIN QUERY PLAN and list the tables that are scanned in full"""
+    if params is None:
+        params = (None,) * query.count('?')
+
+    try:
+        rows = connection.execute(f"EXPLAIN QUERY PLAN {query}", params).fetchall()
+    except sqlite3.Error as e:
+        return QueryPlanFinding(source, query, [], [], error=str(e))
+
+    tables = {
+        row[0] for row in connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND sql NOT LIKE 'CREATE VIRTUAL%'"
+        )
+    }
+    aliases = _table_aliases(query)
+    plan = [row[3] for row in rows]
+    loops = [detail for detail in plan if re.match(r"(SCAN|SEARCH) ", detail)]
+
+    # Full table scans and full index scans (SCAN t USING [COVERING] INDEX i) both count
+    full_scans = []
+    for detail in plan:
+        match = re.match(r"SCAN (\w+)(?: USING (?:COVERING )?INDEX (\w+))?$", detail)
+        if not match:
+            continue
+        alias, index = match.groups()
+        table = aliases.get(alias, alias)
+        if table not in tables:
+            continue
+        if loops and detail == loops[0] and _bounded_scan(connection, query, plan, alias, table, index):
+            continue
+        full_scans.append(detail)
+
+    return QueryPlanFinding(source, query, plan, full_scans)
+
+def audit_query_plans(connection: sqlite3.Connection, base_dir: str) -> List[QueryPlanFinding]:
+    """EXPLAIN every audited statement against the live schema.
+
+    A statement that cannot be explained comes back with its error set, and
+    the INTENDED_SCANS come back without full scans.
+    """
+    findings = []
+    for source, query in collect_source_statements(base_dir):
+        finding = explain(connection, source, query)
+        if query.strip() in INTENDED_SCANS.get(source.rsplit(':', 1)[0], set()):
+            finding.full_scans = []
+        findings.append(finding)
+    for source, query, params in collect_dynamic_statements():
+        findings.append(explain(connection, source, query, params))
+    return findings
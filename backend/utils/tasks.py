@@ -0,0 +1,307 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, List, Callable
+
+task_logger = logging.getLogger('egadget.tasks')
+
+class _Handler:
+    def __init__(self, name: str, func: Callable, batch: bool, max_attempts: Optional[int],
+                 every: Optional[float]):
+        self.name = name
+        self.func = func
+        self.batch = batch
+        self.max_attempts = max_attempts
+        self.every = every
+
+class TaskQueue:
+    """Durable background work, stored in the tasks table.
+
+    Handlers are registered by name; enqueue() writes a row (joining the
+    caller's transaction, if any) and returns, and a dispatcher thread
+    hands due tasks to a pool of worker threads, each run in an app
+    context. Batch handlers get the payloads of up to batch_size due tasks
+    of their name in one call. A failed task is retried after
+    retry_delay * 2**(attempts - 1) seconds (at most max_retry_delay) and
+    marked failed after max_attempts. A handler registered with every=N
+    is periodic: start() makes sure one live task of its name exists, and
+    that task is rescheduled N seconds out after each success, or after
+    its last failed attempt, instead of being deleted or marked failed. A claimed task holds a lease of
+    lease seconds; if its worker dies it becomes due again once the lease
+    runs out, so handlers must be idempotent. With workers=0 nothing runs
+    in the background and tasks wait for run_pending().
+    """
+
+    def __init__(self, app, workers: int = 2, poll_interval: float = 1.0, batch_size: int = 50,
+                 lease: float = 60.0, max_attempts: int = 5, retry_delay: float = 2.0,
+                 max_retry_delay: float = 600.0):
+        self.app = app
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self._handlers: Dict[str, _Handler] = {}
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._slots: Optional[threading.BoundedSemaphore] = None
+        self._lock = threading.Lock()
+
+    def register(self, name: str, func: Callable, batch: bool = False,
+                 max_attempts: Optional[int] = None, every: Optional[float] = None) -> Callable:
+        """Run func(payload), or func(payloads) if batch, for tasks called name;
+        with every, also run it every that many seconds"""
+        self._handlers[name] = _Handler(name, func, batch, max_attempts, every)
+        return func
+
+    def handler(self, name: str, batch: bool = False, max_attempts: Optional[int] = None,
+                every: Optional[float] = None):
+        """Decorator form of register()"""
+        def decorator(func: Callable) -> Callable:
+            return self.register(name, func, batch, max_attempts, every)
+        return decorator
+
+    def enqueue(self, name: str, payload: Optional[Dict[str, Any]] = None, delay: float = 0.0,
+                max_attempts: Optional[int] = None) -> Optional[int]:
+        """Store a task and return its id.
+
+        Inside Database.transaction() the task is only stored if the
+        transaction commits; SQLite errors are raised.
+        """
+        handler = self._handlers.get(name)
+        if handler is None:
+            raise ValueError(f"No task handler registered for '{name}'")
+        if max_attempts is None:
+            max_attempts = handler.max_attempts or self.max_attempts
+
+        db = self.app.db
+        # Joins the caller's transaction; RETURNING rows must be read before a commit
+        with db.transaction():
+            db.execute(
+                "INSERT INTO tasks (name, payload, max_attempts, run_at) VALUES (?, ?, ?, ?) RETURNING id",
+                (name, json.dumps(payload or {}), max_attempts, time.time() + delay)
+            )
+            row = db.fetchone()
+        self._wake.set()
+        return row['id'] if row else None
+
+    def start(self) -> None:
+        """Start the dispatcher and worker threads (no-op with workers=0)"""
+        with self._lock:
+            if self.workers <= 0 or self._thread is not None:
+                return
+            self._stopping.clear()
+            try:
+                self._schedule_periodic()
+            finally:
+                self.app.db.release()
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='task-worker')
+            self._slots = threading.BoundedSemaphore(self.workers)
+            self._thread = threading.Thread(target=self._dispatch, name='task-dispatcher', daemon=True)
+            self._thread.start()
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stop claiming tasks; with wait, let the claimed ones finish"""
+        with self._lock:
+            thread, executor = self._thread, self._executor
+            self._thread = self._executor = None
+        if thread is None:
+            return
+        self._stopping.set()
+        self._wake.set()
+        thread.join()
+        # Tasks left unfinished are redelivered once their lease runs out
+        executor.shutdown(wait=wait, cancel_futures=not wait)
+
+    def run_pending(self, limit: Optional[int] = None) -> int:
+        """Run due tasks on the calling thread (in its app context); returns
+        how many were run"""
+        done = 0
+        while limit is None or done < limit:
+            ran = 0
+            for handler in self._due_handlers():
+                size = self.batch_size if handler.batch else 1
+                if limit is not None:
+                    size = min(size, limit - done - ran)
+                if size <= 0:
+                    break
+                tasks = self._claim(handler, size)
+                if tasks:
+                    self._run(handler, tasks)
+                    ran += len(tasks)
+            if not ran:
+                break
+            done += ran
+        return done
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Task counts by name and status"""
+        self.app.db.execute("SELECT name, status, COUNT(*) AS count FROM tasks GROUP BY name, status")
+        rows = self.app.db.fetchall() or []
+        counts: Dict[str, Dict[str, int]] = {}
+        for row in rows:
+            counts.setdefault(row['name'], {})[row['status']] = row['count']
+        return counts
+
+    def retry_failed(self, name: Optional[str] = None) -> int:
+        """Make failed tasks (of name, if given) due again with fresh attempts"""
+        query = "UPDATE tasks SET status = 'pending', attempts = 0, run_at = ? WHERE status = 'failed'"
+        params: List[Any] = [time.time()]
+        if name:
+            query += " AND name = ?"
+            params.append(name)
+        with self.app.db.transaction():
+            self.app.db.execute(query, tuple(params))
+            retried = self.app.db.rowcount
+        if retried:
+            self._wake.set()
+        return retried
+
+    def _dispatch(self) -> None:
+        while not self._stopping.is_set():
+            claimed = False
+            try:
+                due = self._due_handlers()
+            except sqlite3.Error:
+                task_logger.exception("Could not look for due tasks")
+                due = []
+            finally:
+                self.app.db.release()
+            for handler in due:
+                # Only claim what a free worker can start on right away
+                if not self._slots.acquire(timeout=self.poll_interval):
+                    break
+                if self._stopping.is_set():
+                    self._slots.release()
+                    break
+                try:
+                    tasks = self._claim(handler, self.batch_size if handler.batch else 1)
+                except sqlite3.Error:
+                    task_logger.exception("Could not claim '%s' tasks", handler.name)
+                    tasks = []
+                finally:
+                    self.app.db.release()
+                if not tasks:
+                    self._slots.release()
+                    continue
+                claimed = True
+                self._executor.submit(self._work, handler, tasks)
+            if not claimed:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    def _schedule_periodic(self) -> None:
+        # Every serving process calls this; the write lock lets only the first insert
+        db = self.app.db
+        with db.transaction(immediate=True):
+            for handler in self._handlers.values():
+                if handler.every is None:
+                    continue
+                db.execute(
+                    """
+                    INSERT INTO tasks (name, max_attempts, run_at)
+                    SELECT ?, ?, ? WHERE NOT EXISTS (
+                        SELECT 1 FROM tasks WHERE name = ? AND status != 'failed'
+                    )
+                    """,
+                    (handler.name, handler.max_attempts or self.max_attempts,
+                     time.time() + handler.every, handler.name)
+                )
+
+    def _due_handlers(self) -> List[_Handler]:
+        """Handlers with claimable tasks, found with a plain read so that an
+        idle queue never takes the write lock. Naming the handlers lets each
+        one seek idx_tasks_due on (name, run_at) instead of walking it"""
+        if not self._handlers:
+            return []
+        placeholders = ', '.join('?' for _ in self._handlers)
+        self.app.db.execute(
+            f"SELECT DISTINCT name FROM tasks WHERE name IN ({placeholders}) "
+            f"AND status IN ('pending', 'running') AND run_at <= ?",
+            (*self._handlers, time.time())
+        )
+        names = {row['name'] for row in self.app.db.fetchall() or []}
+        return [handler for name, handler in self._handlers.items() if name in names]
+
+    def _claim(self, handler: _Handler, limit: int) -> List[Dict[str, Any]]:
+        now = time.time()
+        db = self.app.db
+        # Pending tasks and running ones whose lease expired, oldest first
+        with db.transaction(immediate=True):
+            db.execute(
+                """
+                UPDATE tasks SET status = 'running', attempts = attempts + 1, run_at = ?
+                WHERE id IN (
+                    SELECT id FROM tasks
+                    WHERE name = ? AND status IN ('pending', 'running') AND run_at <= ?
+                    ORDER BY run_at
+                    LIMIT ?
+                )
+                RETURNING id, payload, attempts, max_attempts
+                """,
+                (now + self.lease, handler.name, now, limit)
+            )
+            return db.fetchall() or []
+
+    def _work(self, handler: _Handler, tasks: List[Dict[str, Any]]) -> None:
+        try:
+            # The app context hands the worker's connection back when it ends
+            with self.app.app_context():
+                self._run(handler, tasks)
+        except Exception:
+            task_logger.exception("Could not record the outcome of '%s' tasks", handler.name)
+        finally:
+            self._slots.release()
+
+    def _run(self, handler: _Handler, tasks: List[Dict[str, Any]]) -> None:
+        try:
+            payloads = [json.loads(task['payload']) for task in tasks]
+            if handler.batch:
+                handler.func(payloads)
+            else:
+                for payload in payloads:
+                    handler.func(payload)
+        except Exception as e:
+            task_logger.warning("Task '%s' failed (%d tasks): %s", handler.name, len(tasks), e)
+            self._failed(handler, tasks, e)
+            return
+        self._finished(handler, tasks)
+
+    def _finished(self, handler: _Handler, tasks: List[Dict[str, Any]]) -> None:
+        db = self.app.db
+        with db.transaction():
+            if handler.every is None:
+                db.executemany("DELETE FROM tasks WHERE id = ?", [(task['id'],) for task in tasks])
+            else:
+                db.executemany(
+                    "UPDATE tasks SET status = 'pending', attempts = 0, run_at = ?, last_error = NULL WHERE id = ?",
+                    [(time.time() + handler.every, task['id']) for task in tasks]
+                )
+
+    def _failed(self, handler: _Handler, tasks: List[Dict[str, Any]], error: Exception) -> None:
+        now = time.time()
+        message = f"{type(error).__name__}: {error}"
+        rows = []
+        for task in tasks:
+            if task['attempts'] < task['max_attempts']:
+                delay = min(self.retry_delay * 2 ** (task['attempts'] - 1), self.max_retry_delay)
+                rows.append(('pending', now + delay, task['attempts'], message, task['id']))
+            elif handler.every is not None:
+                # A periodic task is never given up on: it runs again next period
+                rows.append(('pending', now + handler.every, 0, message, task['id']))
+            else:
+                rows.append(('failed', now, task['attempts'], message, task['id']))
+
+        db = self.app.db
+        with db.transaction():
+            db.executemany(
+                "UPDATE tasks SET status = ?, run_at = ?, attempts = ?, last_error = ? WHERE id = ?",
+                rows
+            )
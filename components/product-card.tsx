@@ -93,7 +93,7 @@ export default function ProductCard({ product }: ProductCardProps) {
                   )}
                 />
               ))}
-            <span className="text-xs text-muted-foreground ml-1">({product.reviews.length})</span>
+            <span className="text-xs text-muted-foreground ml-1">({product.reviewCount ?? product.reviews.length})</span>
           </div>
           <h3 className="font-medium line-clamp-2">{product.name}</h3>
           <div className="flex items-baseline gap-2 mt-1">
@@ -119,6 +119,31 @@ class ApiClient {
     }
   }
 
+  async patch(endpoint: string, data: any) {
+    try {
+      const response = await fetch(`${API_URL}${endpoint}`, {
+        method: 'PATCH',
+        headers: this.getHeaders(),
+        body: JSON.stringify(data),
+      });
+
+      if (response.status === 401) {
+        this.clearToken();
+        throw new Error('Unauthorized - Please log in again');
+      }
+
+      if (!response.ok) {
+        const errorData = await response.json().catch(() => ({ message: 'Unknown error' }));
+        throw new Error(errorData.message || `API error: ${response.status}`);
+      }
+
+      return response.json();
+    } catch (error) {
+      console.error(`API PATCH error (${endpoint}):`, error);
+      throw error;
+    }
+  }
+
   async delete(endpoint: string) {
     try {
       const response = await fetch(`${API_URL}${endpoint}`, {
@@ -216,6 +241,18 @@ export class ProductApi {
     return this.mapProductsResponse(data.products);
   }
 
+  async getFacets(filters?: Record<string, any>) {
+    const queryParams = filters ?
+      '?' + Object.entries(filters)
+        .filter(([_, value]) => value !== undefined && value !== null)
+        .map(([key, value]) => `${key}=${encodeURIComponent(value)}`)
+        .join('&')
+      : '';
+
+    const data = await this.api.get(`/products/facets${queryParams}`);
+    return data.facets;
+  }
+
   async getProductById(id: string | number): Promise<Product> {
     const data = await this.api.get(`/products/${id}`);
     return this.mapProductResponse(data.product);
@@ -252,6 +289,8 @@ export class ProductApi {
         comment: review.comment,
         date: review.createdAt,
       })) || [],
+      reviewCount: product.reviewCount ?? product.reviews?.length ?? 0,
+      ratingHistogram: product.ratingHistogram,
       isNew: product.isNew || false,
       featured: false, // Backend doesn't track this yet
       trending: product.trending || false,
@@ -319,6 +358,27 @@ export class CartApi {
     }
   }
 
+  // Apply many upserts and removals in one request and one transaction
+  async syncCart(
+    upserts: { productId: string | number; quantity: number }[],
+    removals: (string | number)[] = [],
+    mode: 'set' | 'add' | 'max' = 'set',
+    clampToStock = false,
+  ) {
+    try {
+      const data = await this.api.patch('/cart', {
+        upsert: upserts.map(({ productId, quantity }) => ({ product_id: productId, quantity })),
+        remove: removals,
+        mode,
+        clamp_to_stock: clampToStock,
+      });
+      return data;
+    } catch (error) {
+      console.error('Error syncing cart:', error);
+      throw error;
+    }
+  }
+
   async clearCart() {
     try {
       const data = await this.api.delete('/cart');
@@ -330,8 +390,36 @@ export class CartApi {
   }
 }
 
+/**
+ * Order-related API methods
+ */
+export class OrderApi {
+  private api: ApiClient;
+
+  constructor(api: ApiClient) {
+    this.api = api;
+  }
+
+  // Turns the server-side cart into an order
+  async createOrder() {
+    const data = await this.api.post('/orders', {});
+    return data.order;
+  }
+
+  async getOrders() {
+    const data = await this.api.get('/orders');
+    return data.orders;
+  }
+
+  async getOrder(id: string | number) {
+    const data = await this.api.get(`/orders/${id}`);
+    return data.order;
+  }
+}
+
 // Create and export API instances
 const apiClient = new ApiClient();
 export const authApi = new AuthApi(apiClient);
 export const productApi = new ProductApi(apiClient);
-export const cartApi = new CartApi(apiClient); 
\ No newline at end of file
+export const cartApi = new CartApi(apiClient);
+export const orderApi = new OrderApi(apiClient); 
\ No newline at end of file
@@ -33,7 +33,28 @@ export function CartProvider({ children }: { children: React.ReactNode }) {
     const fetchCart = async () => {
       if (isAuthenticated) {
         try {
-          const cartData = await cartApi.getCart()
+          // The local cart only holds items added while logged out: merge
+          // them in a single round trip once, then drop the local copy.
+          // Products deleted since are skipped by the merge, not rejected
+          const localItems = readLocalCart().items
+          let cartData
+          if (localItems.length > 0) {
+            try {
+              cartData = await cartApi.syncCart(
+                localItems.map((item) => ({ productId: item.product.id, quantity: item.quantity })),
+                [],
+                'max',
+                true,
+              )
+              localStorage.removeItem("egadget_cart")
+            } catch (error) {
+              // Keep the local items for the next login and show the server cart
+              console.error("Failed to merge local cart:", error)
+            }
+          }
+          if (!cartData) {
+            cartData = await cartApi.getCart()
+          }
           setCart({
             items: cartData.items.map((item: any) => ({
               id: item.id, // Store the cart item ID
@@ -64,8 +85,8 @@ export function CartProvider({ children }: { children: React.ReactNode }) {
           })
         } catch (error) {
           console.error("Failed to fetch cart:", error)
-          // If API fails, try to load from localStorage as fallback
-          loadFromLocalStorage()
+          // The local cart is not the signed-in user's cart; show none
+          setCart({ items: [] })
         }
       } else {
         // Not authenticated, use localStorage
@@ -77,7 +98,20 @@ export function CartProvider({ children }: { children: React.ReactNode }) {
     fetchCart()
   }, [isAuthenticated])
 
-  // Load cart from localStorage
+  // Read the cart stored in localStorage without applying it
+  const readLocalCart = (): Cart => {
+    const storedCart = localStorage.getItem("egadget_cart")
+    if (storedCart) {
+      try {
+        return JSON.parse(storedCart)
+      } catch (error) {
+        return { items: [] }
+      }
+    }
+    return { items: [] }
+  }
+
+  // Load cart from localStorage (empty after logout, so the server cart is not kept)
   const loadFromLocalStorage = () => {
     const storedCart = localStorage.getItem("egadget_cart")
     if (storedCart) {
@@ -87,16 +121,20 @@ export function CartProvider({ children }: { children: React.ReactNode }) {
       } catch (error) {
         console.error("Failed to parse stored cart:", error)
         localStorage.removeItem("egadget_cart")
+        setCart({ items: [] })
       }
+    } else {
+      setCart({ items: [] })
     }
   }
 
-  // Save cart to localStorage whenever it changes
+  // Save the anonymous cart to localStorage whenever it changes; while
+  // logged in the server cart is the only copy
   useEffect(() => {
-    if (!loading) {
+    if (!loading && !isAuthenticated) {
       localStorage.setItem("egadget_cart", JSON.stringify(cart))
     }
-  }, [cart, loading])
+  }, [cart, loading, isAuthenticated])
 
   const addToCart = async (product: Product, quantity: number) => {
     if (isAuthenticated) {
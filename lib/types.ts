@@ -16,6 +16,8 @@ export interface Product {
   features: string[]
   specifications?: Record<string, string>
   reviews: Review[]
+  reviewCount?: number
+  ratingHistogram?: Record<string, number>
   isNew: boolean
   featured: boolean
   trending: boolean